@@ -0,0 +1,325 @@
+"""
+This module provides the `cobair-infer` command line tool for batch inference of evidence files.
+
+Evidence is streamed from a JSONL file (one evidence dict per line) or a CSV file (one column per
+context, empty cells are unobserved, numeric cells of discretized contexts are parsed) through the
+net in chunks of fixed size, so memory stays bounded for files of any size. Posteriors and
+decisions are written as soon as a chunk is inferred:
+
+```
+cobair-infer small_example.yml evidence.jsonl --output posteriors.jsonl
+cobair-infer small_example.yml evidence.csv --output posteriors.csv --processes 8
+```
+
+JSONL output has one line per row like `{"row": 0, "intention": "pick up tool",
+"decision_threshold": 0.8, "inference": {...}}` or `{"row": 1, "error": "..."}` for evidence which
+can't be used, including malformed JSONL lines and rows whose discretization function raises.
+CSV output has the columns `row`, `intention`, one column per intention with its probability and
+`error`.
+Throughput and latency statistics are printed to stderr at the end.
+"""
+
+# System imports
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+
+# 3rd party imports
+import numpy as np
+
+# local imports
+from .bayes_net import BayesNet, load_config
+from .diagnostics import DIAGNOSTICS_MODES
+from .inference_pool import InferencePool
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def read_jsonl(stream):
+    """
+    Reads evidence from JSONL.
+
+    Args:
+        stream: a text stream with one JSON object per line
+    Yields:
+        dict:
+        The evidence of every non empty line or a ValueError if the line is no JSON object
+    """
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            evidence = json.loads(line)
+        except json.JSONDecodeError as error:
+            yield ValueError(f'Malformed JSON in line {number}: {error}')
+            continue
+        if not isinstance(evidence, dict):
+            yield ValueError(f'Expected a JSON object in line {number}, got {line.strip()}')
+            continue
+        yield evidence
+
+
+def read_csv(stream, net: BayesNet):
+    """
+    Reads evidence from CSV with one column per context.
+
+    Cells are translated back into the instantiations of the config, e.g. "True" into True.
+    Other cells of contexts with a bound discretization function are parsed as numbers if
+    possible, e.g. "0.7" into 0.7. Empty cells are unobserved.
+
+    Args:
+        stream: a text stream with a header line
+        net: the net whose instantiations and discretization functions are used to translate
+            the cells
+    Yields:
+        dict:
+        The evidence of every row
+    """
+    instantiations = {context: {str(instantiation): instantiation
+                                for instantiation in net.value_to_card[context]}
+                      for context in net.contexts}
+    discretized = set(net.discretization_functions)
+    for row in csv.DictReader(stream):
+        evidence = {}
+        for context, cell in row.items():
+            if cell is None or cell == '':
+                continue
+            known = instantiations.get(context, {})
+            if cell in known:
+                evidence[context] = known[cell]
+            elif context in discretized:
+                evidence[context] = _parse_number(cell)
+            else:
+                evidence[context] = cell
+        yield evidence
+
+
+def _parse_number(cell: str):
+    """Returns the cell as int or float or the cell itself if it is no number"""
+    try:
+        return int(cell)
+    except ValueError:
+        pass
+    try:
+        return float(cell)
+    except ValueError:
+        return cell
+
+
+def chunked(iterable, chunk_size: int):
+    """
+    Splits an iterable into lists of chunk_size items.
+
+    Args:
+        iterable: any iterable
+        chunk_size: the number of items per chunk
+    Yields:
+        list:
+        The next chunk
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ResultWriter():
+    """Writes inference results as JSONL or CSV."""
+
+    def __init__(self, stream, intentions: list, output_format: str = 'jsonl') -> None:
+        '''
+        Creates the writer. The CSV header is written right away.
+
+        Args:
+            stream: a text stream to write to
+            intentions: the intentions of the net
+            output_format: "jsonl" or "csv"
+        '''
+        self.stream = stream
+        self.intentions = intentions
+        self.output_format = output_format
+        self._csv = None
+        if output_format == 'csv':
+            self._csv = csv.writer(stream)
+            self._csv.writerow(['row', 'intention', *intentions, 'error'])
+
+    def write(self, row: int, result):
+        """
+        Writes the result of one row.
+
+        Args:
+            row: the number of the row in the evidence file
+            result: a tuple like returned by `BayesNet.infer` or an exception
+        """
+        if self._csv is not None:
+            if isinstance(result, Exception):
+                self._csv.writerow([row, '', *([''] * len(self.intentions)), str(result)])
+            else:
+                max_intention, _, inference = result
+                self._csv.writerow([row, '' if max_intention is None else max_intention,
+                                    *(float(inference[intention])
+                                      for intention in self.intentions), ''])
+            return
+        if isinstance(result, Exception):
+            line = {'row': row, 'error': str(result)}
+        else:
+            max_intention, decision_threshold, inference = result
+            line = {'row': row, 'intention': max_intention,
+                    'decision_threshold': decision_threshold,
+                    'inference': {intention: float(probability)
+                                  for intention, probability in inference.items()}}
+        self.stream.write(json.dumps(line) + '\n')
+
+
+def infer_stream(net: BayesNet, evidences, writer: ResultWriter, chunk_size: int = 1024,
+                 processes: int = 1, normalized=True, decision_threshold=None) -> dict:
+    """
+    Infers a stream of evidence chunk by chunk and writes the results.
+
+    Args:
+        net: The net used for inference
+        evidences: an iterable of evidences. Exceptions in it, e.g. for lines which could not
+            be read, are written as errors of their rows.
+        writer: the writer for the results
+        chunk_size: number of evidences inferred at once
+        processes: number of worker processes. Inference runs in this process if 1.
+        normalized: Flag if the returned inferences are normalized to sum up to 1.
+        decision_threshold: a threshold for picking the most likely intention.
+            If not given the decision_threshold of the net is taken.
+    Returns:
+        dict:
+            Statistics with the number of rows and errors, the elapsed seconds and the latency
+            of every inferred batch in milliseconds
+    """
+    stats = {'rows': 0, 'errors': 0, 'seconds': 0.0, 'batch_latencies_ms': []}
+    start = time.perf_counter()
+    pool = InferencePool(net, processes=processes) if processes > 1 else None
+    # every worker gets a few chunks at once - only these are held in memory
+    batch_size = chunk_size * processes * 4 if pool is not None else chunk_size
+    try:
+        for batch in chunked(evidences, batch_size):
+            batch_start = time.perf_counter()
+            valid = [evidence for evidence in batch if not isinstance(evidence, Exception)]
+            if not valid:
+                inferred = []
+            elif pool is not None:
+                inferred = pool.map(valid, normalized=normalized,
+                                    decision_threshold=decision_threshold,
+                                    chunksize=chunk_size, return_exceptions=True)
+            else:
+                inferred = net.infer_batch(valid, normalized=normalized,
+                                           decision_threshold=decision_threshold,
+                                           return_exceptions=True)
+            inferred = iter(inferred)
+            results = [evidence if isinstance(evidence, Exception) else next(inferred)
+                       for evidence in batch]
+            stats['batch_latencies_ms'].append((time.perf_counter() - batch_start) * 1000)
+            for result in results:
+                writer.write(stats['rows'], result)
+                stats['rows'] += 1
+                stats['errors'] += isinstance(result, Exception)
+            writer.stream.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def format_stats(stats: dict) -> str:
+    """
+    Formats the statistics of `infer_stream`.
+
+    Args:
+        stats: the statistics returned by `infer_stream`
+    Returns:
+        str:
+            A human readable summary
+    """
+    latencies = np.array(stats['batch_latencies_ms'] or [0.0])
+    throughput = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    return (f"rows: {stats['rows']} ({stats['errors']} errors) in {stats['seconds']:.3f} s - "
+            f"{throughput:.1f} rows/s\n"
+            f"batch latency: mean {latencies.mean():.3f} ms, "
+            f"p50 {np.percentile(latencies, 50):.3f} ms, "
+            f"p95 {np.percentile(latencies, 95):.3f} ms, max {latencies.max():.3f} ms")
+
+
+def _format_of(path: str, given: str, default: str) -> str:
+    """Returns the given format or guesses it from the file extension"""
+    if given is not None:
+        return given
+    if path.lower().endswith('.csv'):
+        return 'csv'
+    if path.lower().endswith(('.jsonl', '.json', '.ndjson')):
+        return 'jsonl'
+    return default
+
+
+def main(argv: list = None):
+    """
+    Entry point of `cobair-infer`.
+
+    Args:
+        argv: command line arguments. sys.argv is used if None.
+    """
+    parser = argparse.ArgumentParser(
+        prog='cobair-infer', description='Batch inference of an evidence file with a config')
+    parser.add_argument('config', help='path to the config file')
+    parser.add_argument('evidence', help='path to a JSONL or CSV evidence file, - for stdin')
+    parser.add_argument('--input-format', choices=['jsonl', 'csv'],
+                        help='format of the evidence file. Guessed from the extension if not given')
+    parser.add_argument('--output', '-o', default='-', help='path of the output file, - for stdout')
+    parser.add_argument('--output-format', choices=['jsonl', 'csv'],
+                        help='format of the output. Guessed from the extension if not given')
+    parser.add_argument('--chunk-size', type=int, default=1024,
+                        help='number of rows inferred at once')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of worker processes')
+    parser.add_argument('--decision-threshold', type=float,
+                        help='decision threshold instead of the one of the config')
+    parser.add_argument('--unnormalized', action='store_true',
+                        help='do not normalize the inference over all intentions')
+    parser.add_argument('--cache-dir', help='directory of an on-disk cache for compiled models')
+    parser.add_argument('--diagnostics', choices=DIAGNOSTICS_MODES, default='warn',
+                        help='report unknown contexts and invalid evidence as warnings, '
+                        'as rate limited log messages (quiet) or as errors (strict)')
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1 or args.processes < 1:
+        parser.error('--chunk-size and --processes must be at least 1')
+
+    net = BayesNet(load_config(args.config), cache_dir=args.cache_dir,
+                   diagnostics=args.diagnostics)
+    if not net.valid:
+        parser.exit(1, f'Invalid configuration in {args.config}\n')
+    input_format = _format_of(args.evidence, args.input_format, 'jsonl')
+    output_format = _format_of(args.output, args.output_format, 'jsonl')
+
+    evidence_file = sys.stdin if args.evidence == '-' else open(
+        args.evidence, encoding='utf-8', newline='')
+    output_file = sys.stdout if args.output == '-' else open(
+        args.output, 'w', encoding='utf-8', newline='')
+    try:
+        evidences = read_csv(evidence_file, net) if input_format == 'csv' else read_jsonl(
+            evidence_file)
+        stats = infer_stream(net, evidences, ResultWriter(output_file, net.intentions,
+                                                          output_format),
+                             chunk_size=args.chunk_size, processes=args.processes,
+                             normalized=not args.unnormalized,
+                             decision_threshold=args.decision_threshold)
+    finally:
+        if evidence_file is not sys.stdin:
+            evidence_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    print(format_stats(stats), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,17 +6,39 @@ This module provides a class for a two-layer bayes net for context based intenti
 from __future__ import annotations
 import itertools
 from collections import defaultdict
-from collections.abc import Hashable
+from collections.abc import Hashable, Mapping
+import asyncio
+import concurrent.futures
+import contextlib
 from copy import deepcopy
+import functools
 import warnings
 import logging
+import threading
+import time
+import weakref
 
 # 3rd party imports
-import bnlearn as bn
-from pgmpy.factors.discrete import TabularCPD
+import numpy as np
 import yaml
 # local imports
 from .random_base_count import Counter
+from .model_cache import ModelCache, config_hash
+from .lazy_import import LazyModule
+from .numpy_engine import SOFT, UNOBSERVED, NumpyEngine
+from .columnar import columns_to_cards
+from .discretizers import compile_discretizers
+from .diagnostics import INVALID_INSTANTIATION, NO_EVIDENCE, UNKNOWN_CONTEXT, Diagnostics
+from .discretization_stage import DiscretizationMemo, DiscretizationStage
+from .instrumentation import (DISCRETIZATION, EXTRACTION, INFERENCE, NORMALIZATION, TOTAL,
+                              VALIDATION, StageTimer)
+from .metrics import (COMPILATIONS, COMPILE_SECONDS, CONFIG_EDITS, CONFIG_LOAD_SECONDS,
+                      INFER_BATCH_ERRORS, INFER_BATCH_SECONDS, INFER_ERRORS, INFER_SECONDS,
+                      MetricsRegistry)
+
+# bnlearn and pgmpy are heavy to import and only needed for inference
+bn = LazyModule('bnlearn')
+pgmpy_discrete = LazyModule('pgmpy.factors.discrete')
 
 # end file header
 __author__ = 'Adrian Lubitz'
@@ -45,40 +67,40 @@ PrettySafeLoader.add_constructor(
     PrettySafeLoader.construct_python_tuple)
 
 
-class BayesNet():
-    def __init__(self, config: dict = None, bn_verbosity: int = 0, validate: bool = True) -> None:
-        '''
-        Initializes the BayesNet with the given config.
-
-        Args:
-            config: A dict with a config following the config format.
-            bn_verbosity: sets the verbose flag for bnlearn. See [bnlearn API](
-                https://erdogant.github.io/bnlearn/pages/html/bnlearn.bnlearn.html?highlight=verbose
-                #bnlearn.bnlearn.make_DAG) for more information
-            validate: Flag if the given config should be validated or not. 
-                This is necessary to load invalid configs
-        '''
-        self.log = logging.getLogger(self.__class__.__name__)
+class CompiledModel():
+    """
+    An immutable snapshot of everything compiled from a config.
 
-        self.valid = False
-        self.bn_verbosity = bn_verbosity
-        self.discretization_functions = {}
+    A `BayesNet` publishes a new snapshot with a single reference assignment whenever its config
+    changes. Readers which hold a snapshot always see a consistent model, so `BayesNet.infer` can
+    run without locks while another thread compiles the next snapshot.
 
-        if config is None:
-            validate = False
-        config = config_to_default_dict(config)
+    !!! note
+        Snapshots must never be modified after creation. Only the pgmpy CPTs and the DAG are
+        created lazily on first access.
+    """
 
-        # if not config:
-        #     self.config = {'intentions': defaultdict(lambda: defaultdict(
-        #         lambda: defaultdict(int))), 'contexts': defaultdict(lambda: defaultdict(float))}
-        #     return
+    def __init__(self, config: dict, valid: bool, bn_verbosity: int = 0,
+                 compiled: dict = None, engine: NumpyEngine = None) -> None:
+        '''
+        Compiles the given config.
 
+        Args:
+            config: A dict with a config following the config format. The snapshot keeps its
+                own copy of it.
+            valid: Flag if the config was validated successfully
+            bn_verbosity: sets the verbose flag for bnlearn
+            compiled: pgmpy CPTs and the DAG for the config, e.g. from a `ModelCache`.
+                If given, the CPT values are not calculated again.
+            engine: A NumPy engine for the config, e.g. attached to shared memory by
+                `CoBaIR.inference_pool`. If given without compiled, the CPT values are not
+                calculated and the snapshot has no pgmpy CPTs.
+        '''
         self.config = deepcopy(config)
+        self.valid = valid
+        self.bn_verbosity = bn_verbosity
         self.decision_threshold = self.config['decision_threshold']
 
-        if validate:
-            self.validate_config()
-
         # Translation dicts for context to card number in bnlearn and vice versa
         self._create_value_to_card()
         self._create_card_to_value()
@@ -88,17 +110,95 @@ class BayesNet():
 
         # initialize the bayes net structure
         self.contexts = self.evidence = list(self.config['contexts'].keys())
+        self.context_index = {context: index for index,
+                              context in enumerate(self.contexts)}
         self.intentions = list(self.config['intentions'].keys())
         self.edges = list(itertools.product(self.contexts, self.intentions))
         self._create_evidence_card()
 
-        # create CPTs for the bayes net
-        self.cpts = []
-        self._create_context_cpts()
-        self._create_intention_cpts()
-        if self.valid:
-            self.DAG = bn.make_DAG(self.edges, CPD=self.cpts,
-                                   verbose=self.bn_verbosity)
+        # The pgmpy CPTs, the DAG and the NumPy engine are only created when they are first used
+        self._lock = threading.Lock()
+        self._engine = engine
+        if compiled is None and engine is not None:
+            self._cpt_specs = None
+            self._cpts = None
+            self._DAG = None
+        elif compiled is None:
+            self._cpts = None
+            self._DAG = None
+            self._cpt_specs = []
+            self._create_context_cpts()
+            self._create_intention_cpts()
+        else:
+            self._cpt_specs = None
+            self._cpts = compiled['cpts']
+            self._DAG = compiled['DAG']
+
+    @property
+    def cpts(self) -> list:
+        '''
+        The pgmpy Conditional Probability Tables of all nodes. They are created on first access.
+
+        Raises:
+            AttributeError: An AttributeError is raised if the snapshot was created from an engine
+        '''
+        if self._cpts is None:
+            if self._cpt_specs is None:
+                raise AttributeError('A snapshot created from an engine has no CPTs')
+            with self._lock:
+                if self._cpts is None:
+                    self._cpts = [pgmpy_discrete.TabularCPD(**spec)
+                                  for spec in self._cpt_specs]
+        return self._cpts
+
+    @property
+    def DAG(self) -> dict:  # pylint: disable=invalid-name
+        '''
+        The bnlearn DAG of the bayes net. It is created on first access.
+
+        Raises:
+            AttributeError: An AttributeError is raised if the config is not valid
+        '''
+        if self._DAG is None:
+            if not self.valid:
+                raise AttributeError('An invalid config has no DAG')
+            cpts = self.cpts
+            with self._lock:
+                if self._DAG is None:
+                    self._DAG = bn.make_DAG(self.edges, CPD=cpts,
+                                            verbose=self.bn_verbosity)
+        return self._DAG
+
+    @property
+    def engine(self) -> NumpyEngine:
+        '''
+        The NumPy engine for batched inference. It is created on first access.
+        '''
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = self._create_engine()
+        return self._engine
+
+    def _create_engine(self) -> NumpyEngine:
+        '''
+        Creates the NumPy engine from the CPT values. Context CPTs come first, then intention CPTs.
+
+        Returns:
+            NumpyEngine:
+                An engine for all intentions of this snapshot
+        '''
+        if self._cpt_specs is not None:
+            values = [spec['values'] for spec in self._cpt_specs]
+        else:
+            values = [cpt.get_values() for cpt in self._cpts]
+        num_contexts = len(self.contexts)
+        priors = [np.asarray(value, dtype=float).reshape(-1)
+                  for value in values[:num_contexts]]
+        # only the probabilities for intentions being True are needed
+        tables = np.array([np.asarray(value, dtype=float)[1] for value in values[num_contexts:]])
+        tables = tables.reshape((len(self.intentions), *self.evidence_card))
+        return NumpyEngine(tables, priors)
 
     def _create_value_to_card(self):
         '''
@@ -123,31 +223,36 @@ class BayesNet():
     def _create_context_cpts(self):
         '''
         Create the Conditional Probability Tables for all context nodes in the DAG and 
-            APPENDS them to self.cpts
+            APPENDS their specification to self._cpt_specs
+
+        Raises:
+            TypeError: A TypeError is raised if a context has no instantiations
         '''
         for context, probabilities in self.config['contexts'].items():
+            if not probabilities:
+                raise TypeError(
+                    f'Context "{context}" has no instantiations - CPT values must be a 2D list')
             values = [None] * len(probabilities)
             for value in probabilities:
                 values[self.value_to_card[context][value]] = [
                     probabilities[value]]
-            self.cpts.append(TabularCPD(variable=context,
-                             variable_card=len(probabilities), values=values))
+            self._cpt_specs.append({'variable': context,
+                                    'variable_card': len(probabilities),
+                                    'values': values})
 
     def _create_intention_cpts(self):
         '''
         Create the Conditional Probability Tables for all intention nodes in the DAG and 
-            APPENDS them to self.cpts
+            APPENDS their specification to self._cpt_specs
         '''
         for intention, context_influence in self.config['intentions'].items():
             values = self._calculate_probability_values(context_influence)
-            # create a TabularCPD
-            self.cpts.append(
-                TabularCPD(variable=intention,
-                           variable_card=2,  # intentions are always binary
-                           values=values,
-                           evidence=self.evidence,
-                           evidence_card=self.evidence_card)
-            )
+            # specification of a TabularCPD
+            self._cpt_specs.append({'variable': intention,
+                                    'variable_card': 2,  # intentions are always binary
+                                    'values': values,
+                                    'evidence': self.evidence,
+                                    'evidence_card': self.evidence_card})
 
     def _create_evidence_card(self):
         '''
@@ -327,7 +432,393 @@ class BayesNet():
 
         return True, ''
 
-    def bind_discretization_function(self, context, discretization_function):
+
+class InferenceResult(tuple):
+    """
+    The result of `BayesNet.infer` with a deadline. It unpacks like the tuple returned by `infer`.
+
+    Attributes:
+        stale: True if the exact inference did not finish within the deadline
+        source: "exact", "analytic" for a result of the NumPy engine or "last" for the last
+            exact result of the net
+    """
+
+    def __new__(cls, result: tuple, stale: bool = False, source: str = 'exact'):
+        instance = super().__new__(cls, result)
+        instance.stale = stale
+        instance.source = source
+        return instance
+
+
+# Compiled models of valid configs shared by all nets - entries vanish with their last net
+_interned_models = weakref.WeakValueDictionary()
+_intern_lock = threading.Lock()
+
+# Attributes of a BayesNet which are pickled as they are - see `BayesNet.__getstate__`
+_PICKLED = ('valid', 'bn_verbosity', 'cache_dir', 'cache_max_entries', 'intern',
+            'discretization_functions')
+
+
+def interned_model_count() -> int:
+    """
+    Returns the number of compiled models which are currently shared between nets.
+
+    Returns:
+        int:
+            Number of distinct compiled models in use by nets with `intern=True`
+    """
+    return len(_interned_models)
+
+
+def _no_clock() -> float:
+    """Stands in for the clock if timing is disabled"""
+    return 0.0
+
+
+def _snapshot_attribute(name: str, doc: str) -> property:
+    """
+    Creates a read-only property which reads an attribute of the active snapshot.
+
+    Args:
+        name: name of the attribute of the `CompiledModel`
+        doc: docstring of the property
+    Returns:
+        property:
+            A property reading the attribute from `BayesNet.model`
+    """
+    return property(lambda self: getattr(self._model, name), doc=doc)
+
+
+def _locked(method):
+    """
+    Decorator which serializes all methods that change a `BayesNet`.
+
+    Args:
+        method: a method of `BayesNet` which changes the net
+    Returns:
+        The method which holds the write lock while it runs
+    """
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._write_lock:  # pylint: disable=protected-access
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def _writer(method):
+    """
+    Decorator which serializes all methods that edit the config of a `BayesNet` and counts
+    their successful calls in the metrics of the net.
+
+    Args:
+        method: a method of `BayesNet` which edits the config
+    Returns:
+        The method which holds the write lock while it runs
+    """
+    locked = _locked(method)
+
+    @functools.wraps(method)
+    def counted(self, *args, **kwargs):
+        result = locked(self, *args, **kwargs)
+        if self.metrics is not None:
+            self.metrics.inc(CONFIG_EDITS, labels={'method': method.__name__})
+        return result
+    return counted
+
+
+def _measured(histogram: str, errors: str = None):
+    """
+    Decorator which records the duration of a method of `BayesNet` in its metrics registry.
+
+    Args:
+        histogram: the histogram of the durations, see `CoBaIR.metrics`
+        errors: the counter of calls which raised a ValueError. Errors are not counted if None.
+    Returns:
+        A decorator for methods which only time them if the net has a registry
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def measured(self, *args, **kwargs):
+            metrics = self.metrics
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = method(self, *args, **kwargs)
+            except ValueError:
+                if errors is not None:
+                    metrics.inc(errors)
+                raise
+            metrics.observe(histogram, time.perf_counter() - start)
+            return result
+        return measured
+    return decorator
+
+
+class BayesNet():
+    def __init__(self, config: dict = None, bn_verbosity: int = 0, validate: bool = True,
+                 cache_dir: str = None, intern: bool = True, diagnostics: str = 'warn',
+                 discretization_workers: int = 0, metrics: MetricsRegistry = None,
+                 cache_max_entries: int = 64) -> None:
+        '''
+        Initializes the BayesNet with the given config.
+
+        Args:
+            config: A dict with a config following the config format.
+            bn_verbosity: sets the verbose flag for bnlearn. See [bnlearn API](
+                https://erdogant.github.io/bnlearn/pages/html/bnlearn.bnlearn.html?highlight=verbose
+                #bnlearn.bnlearn.make_DAG) for more information
+            validate: Flag if the given config should be validated or not. 
+                This is necessary to load invalid configs
+            cache_dir: Directory of an on-disk cache for compiled models. If given, a valid
+                config is only compiled if no compiled model for it is found in the cache.
+                See `CoBaIR.model_cache` for details.
+            intern: Flag if the compiled model is shared with all other nets of a structurally
+                identical valid config. Compiled models are immutable, so only memory and compile
+                time are shared. Discretization functions and results stay with every net.
+            diagnostics: How unknown contexts, invalid instantiations and None in evidence are
+                reported. "warn" emits a warning for each of them, "quiet" counts them in
+                `diagnostics` and logs a summary at most every 10 seconds, "strict" counts None
+                and raises a ValueError for everything else. See `CoBaIR.diagnostics`.
+            discretization_workers: number of threads which run the discretization functions
+                of one evidence concurrently. With 0 they run one after another.
+                See `CoBaIR.discretization_stage`.
+            metrics: a registry the net reports its calls, durations and statistics into.
+                See `CoBaIR.metrics`.
+            cache_max_entries: maximum number of compiled models kept in the on-disk cache in
+                cache_dir. The least recently used models are removed first.
+        Raises:
+            ValueError: A ValueError is raised if the diagnostics mode is unknown,
+                discretization_workers is negative or cache_max_entries is smaller than 1
+        '''
+        if cache_max_entries < 1:
+            raise ValueError(
+                f'cache_max_entries must be at least 1. Given value is {cache_max_entries}')
+        self._init_runtime(diagnostics, discretization_workers)
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.register(self)
+
+        self.valid = False
+        self.bn_verbosity = bn_verbosity
+        self.cache_dir = cache_dir
+        self.cache_max_entries = cache_max_entries
+        self.intern = intern
+        self.discretization_functions = {}
+        self._discretization_memos = {}
+
+        if config is None:
+            validate = False
+        config = config_to_default_dict(config)
+
+        # if not config:
+        #     self.config = {'intentions': defaultdict(lambda: defaultdict(
+        #         lambda: defaultdict(int))), 'contexts': defaultdict(lambda: defaultdict(float))}
+        #     return
+
+        # This is the config which is edited - the compiled snapshot has its own copy
+        self.config = deepcopy(config)
+        # discretizers declared in the config are bound like discretization functions
+        self.discretization_functions.update(self.config.get('discretizers', {}))
+
+        if validate:
+            self.validate_config()
+
+        self._model = self._compile_model()
+
+    def _init_runtime(self, diagnostics: str, discretization_workers: int):
+        '''
+        Creates the locks, threads and statistics of the net. They are not pickled.
+
+        Args:
+            diagnostics: the diagnostics mode, see `__init__`
+            discretization_workers: the number of discretization threads, see `__init__`
+        '''
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.diagnostics = Diagnostics(diagnostics, logger=self.log)
+        self._discretization = DiscretizationStage(discretization_workers)
+        # Records the durations of the stages of infer if set - see `CoBaIR.instrumentation`
+        self.stage_timer = None
+        # Serializes writers - readers only read the published snapshot and never lock
+        self._write_lock = threading.RLock()
+        # Number of inferences which did not finish within their deadline
+        self.deadline_misses = 0
+        self._last_result = None
+        # Number of exact inferences skipped because the discretized evidence did not change
+        self.unchanged_inferences = 0
+        self._last_inference = None
+        self._unchanged_lock = threading.Lock()
+        self._deadline_lock = threading.Lock()
+        self._deadline_executor = None
+        self._exact_future = None
+
+    def __getstate__(self) -> dict:
+        '''
+        Returns the state of the net for pickling, e.g. to send it to worker processes.
+
+        The config, its validity, the options and the discretization functions are pickled, so
+        the discretization functions must be picklable like the declarative discretizers of
+        `CoBaIR.discretizers`. Locks, threads, statistics, the stage timer and the metrics
+        registry stay with this net. The compiled snapshot is compiled again on unpickling,
+        which is cheap with an interned model or an on-disk cache.
+        '''
+        state = {name: value for name, value in self.__dict__.items() if name in _PICKLED}
+        state['config'] = default_to_regular(self.config)
+        if 'valid_config' in self.__dict__:
+            state['valid_config'] = default_to_regular(self.valid_config)
+        state['diagnostics'] = self.diagnostics.mode
+        state['discretization_workers'] = self._discretization.max_workers
+        state['memo_options'] = {context: (memo.maxsize, memo.step)
+                                 for context, memo in self._discretization_memos.items()}
+        return state
+
+    def __setstate__(self, state: dict):
+        '''
+        Restores a pickled net. See `__getstate__`.
+        '''
+        state = dict(state)
+        self._init_runtime(state.pop('diagnostics'), state.pop('discretization_workers'))
+        self.metrics = None
+        self._discretization_memos = {
+            context: DiscretizationMemo(maxsize, step)
+            for context, (maxsize, step) in state.pop('memo_options').items()}
+        self.__dict__.update(state)
+        self.config = config_to_default_dict(self.config)
+        if 'valid_config' in state:
+            self.valid_config = config_to_default_dict(self.valid_config)
+        self._model = self._compile_model()
+
+    @_measured(COMPILE_SECONDS)
+    def _compile_model(self) -> CompiledModel:
+        '''
+        Compiles a new snapshot of the current config. An interned snapshot of an identical config
+        is shared if possible, otherwise it is loaded from the cache if possible.
+
+        Returns:
+            CompiledModel:
+                The compiled snapshot
+        '''
+        if not self.valid or not self.intern:
+            return self._load_or_compile_model()
+        key = (config_hash(self.config),
+               self.config['decision_threshold'], self.bn_verbosity)
+        model = _interned_models.get(key)
+        if model is None:
+            model = self._load_or_compile_model()
+            with _intern_lock:
+                # another net may have compiled the same config meanwhile
+                model = _interned_models.setdefault(key, model)
+            return model
+        self._count_compilation('interned')
+        if self.cache_dir is not None:
+            # keep the on-disk cache complete for other processes
+            cache = ModelCache(self.cache_dir, self.cache_max_entries)
+            if key[0] not in cache:
+                cache.put(key[0], {'cpts': model.cpts, 'DAG': model.DAG})
+        return model
+
+    def _load_or_compile_model(self) -> CompiledModel:
+        '''
+        Compiles a new snapshot of the current config. It is loaded from the cache if possible.
+
+        Returns:
+            CompiledModel:
+                The compiled snapshot
+        '''
+        if not self.valid or self.cache_dir is None:
+            self._count_compilation('compiled')
+            return CompiledModel(self.config, self.valid, self.bn_verbosity)
+        cache = ModelCache(self.cache_dir, self.cache_max_entries)
+        cache_key = config_hash(self.config)
+        compiled = cache.get(cache_key)
+        self._count_compilation('compiled' if compiled is None else 'cache')
+        model = CompiledModel(self.config, self.valid,
+                              self.bn_verbosity, compiled)
+        if compiled is None:
+            cache.put(cache_key, {'cpts': model.cpts, 'DAG': model.DAG})
+        return model
+
+    def _count_compilation(self, source: str):
+        '''
+        Counts where a compiled model came from if the net has a metrics registry.
+
+        Args:
+            source: "interned", "cache" or "compiled"
+        '''
+        if self.metrics is not None:
+            self.metrics.inc(COMPILATIONS, labels={'source': source})
+
+    def _recompile(self):
+        '''
+        Validates the edited config and publishes a new snapshot of it.
+
+        The snapshot is swapped in with a single reference assignment. Running inference keeps
+        using the old snapshot. Discretization functions of removed contexts are unbound.
+        Must be called with the write lock held.
+        '''
+        self.validate_config()
+        model = self._compile_model()
+        self.discretization_functions = {
+            context: function for context, function in self.discretization_functions.items()
+            if context in model.contexts}
+        self._discretization_memos = {
+            context: memo for context, memo in self._discretization_memos.items()
+            if context in model.contexts}
+        if 'discretizers' in self.config:
+            self.config['discretizers'] = {
+                context: discretizer for context, discretizer in self.config['discretizers'].items()
+                if context in model.contexts}
+        self._model = model
+
+    @property
+    def model(self) -> CompiledModel:
+        '''
+        The active compiled snapshot. Use it to run several queries against the same model.
+        '''
+        return self._model
+
+    contexts = _snapshot_attribute('contexts', 'Names of all contexts')
+    evidence = _snapshot_attribute(
+        'evidence', 'Names of all contexts in the order of the CPT evidence')
+    intentions = _snapshot_attribute('intentions', 'Names of all intentions')
+    edges = _snapshot_attribute('edges', 'All edges of the DAG')
+    value_to_card = _snapshot_attribute(
+        'value_to_card', 'Translation dict for context instantiations to card numbers')
+    card_to_value = _snapshot_attribute(
+        'card_to_value', 'Translation dict for card numbers to context instantiations')
+    evidence_card = _snapshot_attribute(
+        'evidence_card', 'Number of instantiations of every context')
+    value_to_prob = _snapshot_attribute(
+        'value_to_prob', 'Translation dict for influence values to probabilities')
+    decision_threshold = _snapshot_attribute(
+        'decision_threshold', 'The decision threshold of the compiled config')
+    cpts = _snapshot_attribute('cpts', 'The pgmpy Conditional Probability Tables of all nodes')
+    DAG = _snapshot_attribute('DAG', 'The bnlearn DAG of the bayes net')
+
+    def _create_combined_context(self, context_influence: dict) -> dict:
+        """
+        Creates a dict with the combined contexts in card index format from context_influence.
+        See `CompiledModel._create_combined_context` for details.
+        """
+        return self._model._create_combined_context(context_influence)
+
+    def _calculate_probability_values(self, context_influence: dict) -> list:
+        '''
+        Calculates the probability values with the given context_influence from the config.
+        See `CompiledModel._calculate_probability_values` for details.
+        '''
+        return self._model._calculate_probability_values(context_influence)
+
+    def valid_evidence(self, context: str, instantiation) -> tuple[bool, str]:
+        """
+        Tests if evidence is a valid instantiation for the context.
+        See `CompiledModel.valid_evidence` for details.
+        """
+        return self._model.valid_evidence(context, instantiation)
+
+    @_locked
+    def bind_discretization_function(self, context, discretization_function, memo_size: int = 0,
+                                     quantization_step: float = None):
         """
         binds a discretization_function to a specific context.
 
@@ -336,13 +827,35 @@ class BayesNet():
             context: One of the possible contexts from the config
             discretization_function: A discretization function which has to take one parameter and 
                 return one of the possible discrete context instantiations.
+            memo_size: If positive, up to memo_size raw values are mapped directly to the card
+                numbers of their instantiations, so the function only runs once per value.
+                Only use it for functions without state. See `CoBaIR.discretization_stage`.
+            quantization_step: Numbers are rounded to a multiple of this step before they are
+                discretized and memoized. Only used with memo_size.
+        Raises:
+            ValueError: A ValueError is raised if the context does not exist or the
+                quantization step is not positive
         """
         if context not in self.contexts:
             raise ValueError(
                 f'Cannot bind discretization function to {context}. Context does not exist!')
+        if memo_size > 0:
+            self._discretization_memos[context] = DiscretizationMemo(memo_size, quantization_step)
+        else:
+            self._discretization_memos.pop(context, None)
         self.discretization_functions[context] = discretization_function
+        # declarative discretizers are saved with the config
+        discretizers = self.config.setdefault('discretizers', {})
+        if hasattr(discretization_function, 'to_spec'):
+            discretizers[context] = discretization_function
+        else:
+            discretizers.pop(context, None)
+        if not discretizers:
+            del self.config['discretizers']
 
-    def infer(self, evidence, normalized=True, decision_threshold=None) -> tuple:
+    @_measured(INFER_SECONDS, INFER_ERRORS)
+    def infer(self, evidence, normalized=True, decision_threshold=None, deadline_ms=None,
+              fallback='analytic') -> tuple:
         '''
         infers the probabilities for the intentions with given evidence.
 
@@ -355,68 +868,595 @@ class BayesNet():
                     {'speech commands': 'pickup',
                      'human holding object': True,
                      'human activity': 'idle'}
+                Instead of one instantiation, a context can be given soft evidence as a dict of
+                instantiations and their probabilities, e.g.
+                    {'human holding object': {True: 0.8, False: 0.2}}
+                Missing instantiations have probability 0 and the probabilities are normalized.
+                Soft evidence replaces the apriori probabilities of the context and is inferred
+                exactly with the NumPy engine (see `infer_batch`). Discretization functions can
+                return soft evidence as well.
             decision_threshold: a threshold for picking the most likely intention. 
                 Must be between 0 and 1. 
                 If not given the decision_threshold defined on initialization is taken. 
             normalized: Flag if the returned inference is normalized to sum up to 1.
+            deadline_ms: maximum time in milliseconds to wait for the exact inference.
+                If it does not finish in time, a fallback result is returned which is marked as
+                stale and the miss is counted in `deadline_misses`. The exact inference keeps
+                running in the background and its result becomes the last valid result.
+                Validation and discretization of the evidence are not bounded by the deadline.
+            fallback: The fallback if the deadline is missed. "analytic" infers with the NumPy
+                engine (see `infer_batch`), "last" returns the last exact result of the net
+                and falls back to "analytic" if there is none.
         Returns:
             tuple:
             Returns the highest ranking intention (or None if decision_threshold is not reached), the decision threshold
             and a dictionary of intentions and the corresponding probabilities.
+            With a deadline, the tuple is an `InferenceResult` which tells if it is stale.
         '''
-        # check if evidence values are in instantiations and create a card form of bnlearn
+        timer = self.stage_timer
+        if timer is not None:
+            start = time.perf_counter()
+        # Read the published snapshot once - a concurrent writer may swap in a new one meanwhile
+        model = self._model
+        if decision_threshold is None:
+            decision_threshold = model.decision_threshold
+        if timer is None:
+            card_evidence = self._card_evidence(model, evidence)
+        else:
+            values, memo_cards = self._to_discretize(model, evidence)
+            discretized = self._discretization.run(self.discretization_functions, values)
+            discretized_time = time.perf_counter()
+            timer.record(DISCRETIZATION, discretized_time - start)
+            card_evidence = self._card_evidence(model, evidence, discretized, memo_cards)
+            timer.record(VALIDATION, time.perf_counter() - discretized_time)
+        if not model.valid:
+            raise ValueError('Invalid configuration')
+        if any(isinstance(card, np.ndarray) for card in card_evidence.values()):
+            # bnlearn has no soft evidence - the engine infers it exactly and fast
+            engine_start = time.perf_counter()
+            result = self._infer_cards(model, [card_evidence], normalized, decision_threshold)[0]
+            if timer is not None:
+                timer.record(INFERENCE, time.perf_counter() - engine_start)
+            if deadline_ms is not None:
+                result = InferenceResult(result)
+        elif deadline_ms is None:
+            result = self._infer_exact(model, card_evidence, normalized, decision_threshold)
+        else:
+            result = self._infer_with_deadline(model, card_evidence, normalized,
+                                               decision_threshold, deadline_ms, fallback)
+        if timer is not None:
+            timer.record(TOTAL, time.perf_counter() - start)
+        return result
+
+    def close(self):
+        '''
+        Shuts down the background threads of inference with a deadline and of the
+        discretization stage. Running inference finishes. The net stays usable - the threads
+        are started again when they are needed.
+        '''
+        with self._deadline_lock:
+            executor, self._deadline_executor = self._deadline_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        self._discretization.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextlib.contextmanager
+    def timing(self, callback=None):
+        '''
+        Records the durations of the stages of `infer` within a with block.
+
+        ```
+        with net.timing() as timer:
+            net.infer(evidence)
+        timer.snapshot()
+        ```
+
+        Args:
+            callback: function which is called with the stage and the duration of every
+                recorded stage, see `CoBaIR.instrumentation.StageTimer`
+        Yields:
+            StageTimer:
+            The timer which is set as `stage_timer` within the block. The previous timer is
+            restored afterwards.
+        '''
+        previous = self.stage_timer
+        timer = StageTimer(callback)
+        self.stage_timer = timer
+        try:
+            yield timer
+        finally:
+            self.stage_timer = previous
+
+    async def infer_async(self, evidence, normalized=True, decision_threshold=None) -> tuple:
+        '''
+        infers the probabilities for the intentions without blocking the event loop.
+
+        Discretization functions which are coroutine functions are awaited, all other
+        discretization functions and the inference run in threads. See `infer` for the arguments.
+
+        Returns:
+            tuple:
+            The result like returned by `infer`
+        '''
+        model = self._model
+        values, memo_cards = self._to_discretize(model, evidence)
+        discretized = await self._discretization.run_async(self.discretization_functions, values)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(
+            self._infer_discretized, model, evidence, discretized, memo_cards, normalized,
+            decision_threshold))
+
+    def _infer_discretized(self, model: CompiledModel, evidence: dict, discretized: dict,
+                           memo_cards: dict, normalized: bool, decision_threshold: float) -> tuple:
+        '''
+        Infers evidence whose discretization functions already ran.
+
+        Args:
+            model: the snapshot to infer with
+            evidence: Evidence for some contexts. See `infer` for details.
+            discretized: the discretized values of the evidence, see `_card_evidence`
+            memo_cards: the memoized card numbers of the evidence, see `_card_evidence`
+            normalized: Flag if the returned inference is normalized to sum up to 1.
+            decision_threshold: a threshold for picking the most likely intention or None
+        Returns:
+            tuple:
+            The result like returned by `infer`
+        '''
+        card_evidence = self._card_evidence(model, evidence, discretized, memo_cards)
+        return self._infer_card_evidence(model, card_evidence, normalized, decision_threshold)
+
+    def _infer_card_evidence(self, model: CompiledModel, card_evidence: dict, normalized: bool,
+                             decision_threshold: float) -> tuple:
+        '''
+        Infers evidence which is already validated and translated into card numbers.
+        Soft evidence is inferred with the NumPy engine, all other evidence with bnlearn.
+
+        Args:
+            model: the snapshot to infer with
+            card_evidence: evidence in the card numbers of bnlearn or arrays of probabilities
+                for soft evidence, see `_card_evidence`
+            normalized: Flag if the returned inference is normalized to sum up to 1.
+            decision_threshold: a threshold for picking the most likely intention or None
+        Returns:
+            tuple:
+            The result like returned by `infer`
+        Raises:
+            ValueError: A ValueError is raised if the config is invalid
+        '''
+        if decision_threshold is None:
+            decision_threshold = model.decision_threshold
+        if not model.valid:
+            raise ValueError('Invalid configuration')
+        if any(isinstance(card, np.ndarray) for card in card_evidence.values()):
+            return self._infer_cards(model, [card_evidence], normalized, decision_threshold)[0]
+        return self._infer_exact(model, card_evidence, normalized, decision_threshold)
+
+    def _infer_exact(self, model: CompiledModel, card_evidence: dict, normalized: bool,
+                     decision_threshold: float) -> tuple:
+        '''
+        Infers with bnlearn and keeps the result as the last valid result.
+
+        If the snapshot, the discretized evidence and the arguments are the same as in the last
+        exact inference, its result is returned without inferring again. With stateful
+        discretizers like `HysteresisDiscretizer` noisy raw evidence often discretizes to the
+        same evidence as before.
+
+        Args:
+            model: the snapshot to infer with
+            card_evidence: evidence in the card numbers of bnlearn
+            normalized: Flag if the returned inference is normalized to sum up to 1.
+            decision_threshold: a threshold for picking the most likely intention
+        Returns:
+            tuple:
+            The result like returned by `infer`
+        '''
+        # a weak reference does not keep a replaced snapshot alive - references to the same
+        # living snapshot compare equal
+        key = (weakref.ref(model), sorted(card_evidence.items()), normalized, decision_threshold)
+        last_inference = self._last_inference
+        if last_inference is not None and last_inference[0] == key:
+            with self._unchanged_lock:
+                self.unchanged_inferences += 1
+            intention, threshold, inference = last_inference[1]
+            # the caller may change the returned dict
+            return intention, threshold, dict(inference)
+        timer = self.stage_timer
+        clock = time.perf_counter if timer is not None else _no_clock
+        fit_time = extraction_time = 0.0
+        inference = {}
+        for intention in model.intentions:
+            start = clock()
+            factor = bn.inference.fit(
+                model.DAG,
+                variables=[intention],
+                evidence=card_evidence,
+                verbose=self.bn_verbosity
+            )
+            fitted = clock()
+            # only True values of binary intentions will be saved
+            inference[intention] = factor.values[1]
+            fit_time += fitted - start
+            extraction_time += clock() - fitted
+        start = clock()
+        result = self._decide(inference, normalized, decision_threshold)
+        if timer is not None:
+            timer.record(INFERENCE, fit_time)
+            timer.record(EXTRACTION, extraction_time)
+            timer.record(NORMALIZATION, clock() - start)
+        # the caller may change the returned dict - keep a copy for the next calls
+        intention, threshold, inference = result
+        stored = (intention, threshold, dict(inference))
+        self._last_result = stored
+        self._last_inference = (key, stored)
+        return result
+
+    def _infer_with_deadline(self, model: CompiledModel, card_evidence: dict, normalized: bool,
+                             decision_threshold: float, deadline_ms: float,
+                             fallback: str) -> InferenceResult:
+        '''
+        Runs the exact inference in a background thread and returns a fallback if it does not
+        finish within the deadline. See `infer` for the arguments.
+
+        Only one exact inference runs in the background at a time. If the previous one did not
+        finish yet, the deadline is missed right away instead of queuing up work.
+
+        Returns:
+            InferenceResult:
+                The exact or the fallback result
+        Raises:
+            ValueError: A ValueError is raised if the fallback is unknown
+        '''
+        if fallback not in ('analytic', 'last'):
+            raise ValueError(f'Unknown fallback "{fallback}" - use "analytic" or "last"')
+        future = None
+        with self._deadline_lock:
+            if self._exact_future is None or self._exact_future.done():
+                if self._deadline_executor is None:
+                    self._deadline_executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=1, thread_name_prefix='BayesNet-exact')
+                future = self._deadline_executor.submit(
+                    self._infer_exact, model, card_evidence, normalized, decision_threshold)
+                self._exact_future = future
+        if future is not None:
+            try:
+                return InferenceResult(future.result(timeout=deadline_ms / 1000))
+            except concurrent.futures.TimeoutError:
+                pass
+        with self._deadline_lock:
+            self.deadline_misses += 1
+        self.log.debug('Missed the deadline of %s ms - using the %s fallback',
+                       deadline_ms, fallback)
+        last_result = self._last_result
+        if fallback == 'last' and last_result is not None:
+            intention, threshold, inference = last_result
+            return InferenceResult((intention, threshold, dict(inference)), stale=True,
+                                   source='last')
+        result = self._infer_cards(model, [card_evidence], normalized, decision_threshold)[0]
+        return InferenceResult(result, stale=True, source='analytic')
+
+    @_measured(INFER_BATCH_SECONDS, INFER_BATCH_ERRORS)
+    def infer_batch(self, evidences: list, normalized=True, decision_threshold=None,
+                    return_exceptions: bool = False) -> list:
+        '''
+        infers the probabilities for the intentions for many evidences at once.
+
+        The probabilities are calculated with the exact NumPy engine (see `CoBaIR.numpy_engine`)
+        instead of bnlearn. They are the same as the results of `infer` up to floating point
+        rounding.
+
+        Args:
+            evidences: A list of evidences. See `infer` for the format of a single evidence.
+            normalized: Flag if the returned inferences are normalized to sum up to 1.
+            decision_threshold: a threshold for picking the most likely intention.
+                If not given the decision_threshold defined on initialization is taken.
+            return_exceptions: If True, the exception of evidence which can't be used is put
+                into the returned list instead of being raised. This is the ValueError of invalid
+                evidence or any exception raised by a discretization function.
+        Returns:
+            list:
+            One tuple per evidence like it is returned by `infer`
+        Raises:
+            ValueError: A ValueError is raised if the config is invalid or if evidence can't be
+                used and return_exceptions is False
+        '''
+        model = self._model
+        if not model.valid:
+            raise ValueError('Invalid configuration')
         if decision_threshold is None:
-            decision_threshold = self.config['decision_threshold']
+            decision_threshold = model.decision_threshold
+        card_evidences = []
+        for evidence in evidences:
+            try:
+                card_evidences.append(self._card_evidence(model, evidence))
+            except Exception as error:  # pylint: disable=broad-except
+                # discretization functions may raise anything for a bad row
+                if not return_exceptions:
+                    raise
+                card_evidences.append(error)
+        return self._infer_cards(model, card_evidences, normalized, decision_threshold)
+
+    def infer_columns(self, data, normalized=True, decision_threshold=None) -> tuple:
+        '''
+        infers the probabilities for the intentions for columnar evidence without creating
+        Python objects per row.
+
+        Every column holds the evidence of one context. See `CoBaIR.columnar` for the supported
+        formats and how values are translated. The probabilities are calculated with the exact
+        NumPy engine like in `infer_batch`.
+
+        Args:
+            data: A NumPy structured array, a pyarrow RecordBatch or a dict of arrays
+                with one column per context
+            normalized: Flag if the returned inferences are normalized to sum up to 1.
+            decision_threshold: a threshold for picking the most likely intention.
+                If not given the decision_threshold defined on initialization is taken.
+        Returns:
+            tuple:
+            An integer array with the index of the highest ranking intention in `intentions` for
+            every row (or -1 if decision_threshold is not reached), the decision threshold and
+            an array of shape (number of rows, number of intentions) with the probabilities.
+        Raises:
+            ValueError: A ValueError is raised if the config is invalid or, in strict diagnostics
+                mode, if a column has an unknown context or invalid values
+        '''
+        model = self._model
+        if not model.valid:
+            raise ValueError('Invalid configuration')
+        if decision_threshold is None:
+            decision_threshold = model.decision_threshold
+        cards = columns_to_cards(model, data, self.discretization_functions, self.diagnostics)
+        probabilities = model.engine.infer_cards(cards)
+        if normalized:
+            probabilities = probabilities / probabilities.sum(axis=1, keepdims=True)
+        max_intentions = probabilities.argmax(axis=1)
+        rows = np.arange(len(max_intentions))
+        max_intentions[probabilities[rows, max_intentions] <= decision_threshold] = -1
+        return max_intentions, decision_threshold, probabilities
+
+    def _infer_cards(self, model: CompiledModel, card_evidences: list, normalized: bool,
+                     decision_threshold: float) -> list:
+        '''
+        Infers evidences in card numbers with the NumPy engine.
+
+        Args:
+            model: the snapshot to infer with
+            card_evidences: A list of evidences in the card numbers of bnlearn or arrays of
+                probabilities for soft evidence. Exceptions in the list are passed through.
+            normalized: Flag if the returned inferences are normalized to sum up to 1.
+            decision_threshold: a threshold for picking the most likely intention
+        Returns:
+            list:
+            One tuple per evidence like it is returned by `infer`
+        '''
+        cards = np.full((len(card_evidences), len(model.contexts)),
+                        UNOBSERVED, dtype=np.intp)
+        soft = {}
+        for row, card_evidence in enumerate(card_evidences):
+            if isinstance(card_evidence, Exception):
+                continue
+            for context, card in card_evidence.items():
+                index = model.context_index[context]
+                if isinstance(card, np.ndarray):
+                    if index not in soft:
+                        soft[index] = np.zeros((len(card_evidences), len(card)))
+                    soft[index][row] = card
+                    card = SOFT
+                cards[row, index] = card
+
+        probabilities = model.engine.infer_cards(cards, soft)
+        results = []
+        for row, card_evidence in enumerate(card_evidences):
+            if isinstance(card_evidence, Exception):
+                results.append(card_evidence)
+                continue
+            inference = dict(zip(model.intentions, probabilities[row]))
+            results.append(self._decide(inference, normalized, decision_threshold))
+        return results
+
+    @property
+    def discretization_timings(self) -> dict:
+        '''
+        A dict of contexts and the `FunctionTiming` of their discretization functions.
+        See `CoBaIR.discretization_stage`.
+        '''
+        return self._discretization.timings
+
+    @property
+    def discretization_memos(self) -> dict:
+        '''
+        A dict of contexts and the `DiscretizationMemo` of their discretization functions.
+        '''
+        return dict(self._discretization_memos)
+
+    def _to_discretize(self, model: CompiledModel, evidence: dict) -> tuple:
+        '''
+        Picks the values of the evidence which must be discretized: values of contexts with a
+        discretization function which are not an instantiation of the context.
+        Memoized values are looked up instead.
+
+        Args:
+            model: the snapshot the evidence is translated for
+            evidence: Evidence for some contexts. See `infer` for details.
+        Returns:
+            tuple:
+            A dict of contexts and their (quantized) values to discretize and a dict of contexts
+            and their memoized card numbers
+        '''
+        discretization_functions = self.discretization_functions
+        if not discretization_functions:
+            return {}, {}
+        value_to_card = model.value_to_card
+        values = {context: instantiation for context, instantiation in evidence.items()
+                  if context in discretization_functions and instantiation is not None
+                  and context in value_to_card
+                  and (not isinstance(instantiation, Hashable)
+                       or instantiation not in value_to_card[context])}
+        memo_cards = {}
+        for context, memo in self._discretization_memos.items():
+            if context in values:
+                card = memo.get(model, memo.key(values[context]))
+                if card is None:
+                    values[context] = memo.quantize(values[context])
+                else:
+                    memo_cards[context] = card
+                    del values[context]
+        return values, memo_cards
+
+    def _card_evidence(self, model: CompiledModel, evidence: dict,
+                       discretized: dict = None, memo_cards: dict = None) -> dict:
+        '''
+        Validates and discretizes evidence and translates it into the card numbers of bnlearn.
+
+        Args:
+            model: the snapshot the evidence is translated for
+            evidence: Evidence for some contexts. See `infer` for details.
+            discretized: the discretized values of the evidence which need discretization
+                (see `_to_discretize`). The discretization functions are run if None.
+            memo_cards: the memoized card numbers of the evidence (see `_to_discretize`)
+        Returns:
+            dict:
+                The card numbers of all usable evidence. Soft evidence is an array with the
+                probability of every card number.
+        Raises:
+            ValueError: A ValueError is raised if evidence can't be used
+        '''
+        if discretized is None:
+            values, memo_cards = self._to_discretize(model, evidence)
+            discretized = self._discretization.run(self.discretization_functions, values)
+        memo_cards = memo_cards or {}
+        memos = self._discretization_memos
+        # check if evidence values are in instantiations and create a card form of bnlearn
         card_evidence = {}
         errors = []
         warning_msgs = []
+        diagnostics = self.diagnostics
+        quiet = diagnostics.quiet
         for context, instantiation in evidence.items():
-            valid, err_msg = self.valid_evidence(context, instantiation)
+            if quiet:
+                # the most frequent diagnostics are counted without formatting a message
+                if context not in model.context_index:
+                    if diagnostics.strict:
+                        errors.append(f'Context "{context}" not set in config')
+                    else:
+                        diagnostics.record(UNKNOWN_CONTEXT, context)
+                    continue
+                if instantiation is None:
+                    diagnostics.record(NO_EVIDENCE, context)
+                    continue
+            if context in memo_cards:
+                card_evidence[context] = memo_cards[context]
+                continue
+            if isinstance(instantiation, Mapping) and context in model.value_to_card:
+                instantiation = discretized.get(context, instantiation)
+                if isinstance(instantiation, Mapping):
+                    weights, err_msg = self._soft_evidence(model, context, instantiation)
+                    if weights is None:
+                        errors.append(err_msg)
+                    else:
+                        card_evidence[context] = weights
+                    continue
+            valid, err_msg = model.valid_evidence(context, instantiation)
+            if context in discretized:
+                # not an instantiation of the context, e.g. a continuous value - discretized
+                valid = False
             if valid:
                 if err_msg:
-                    warning_msgs.append(err_msg)
+                    warning_msgs.append((context, instantiation, err_msg))
                     continue
-                card_evidence[context] = self.value_to_card[context][instantiation]
-            elif context in self.discretization_functions and instantiation is not None:
-                discrete_instantiation = self.discretization_functions[context](
-                    instantiation)
-                valid, err_msg = self.valid_evidence(
+                card_evidence[context] = model.value_to_card[context][instantiation]
+            elif context in discretized:
+                discrete_instantiation = discretized[context]
+                memo = memos.get(context)
+                if isinstance(discrete_instantiation, Mapping):
+                    weights, err_msg = self._soft_evidence(model, context, discrete_instantiation)
+                    if weights is None:
+                        errors.append(err_msg)
+                    else:
+                        card_evidence[context] = weights
+                        if memo is not None:
+                            memo.put(model, memo.key(instantiation), weights)
+                    continue
+                valid, err_msg = model.valid_evidence(
                     context, discrete_instantiation)
                 if valid:
                     if err_msg:
-                        warning_msgs.append(err_msg)
+                        warning_msgs.append((context, discrete_instantiation, err_msg))
                         continue
-                    card_evidence[context] = self.value_to_card[context][discrete_instantiation]
+                    card_evidence[context] = model.value_to_card[context][discrete_instantiation]
+                    if memo is not None:
+                        memo.put(model, memo.key(instantiation), card_evidence[context])
                 else:
                     errors.append(err_msg)
             else:
                 errors.append(err_msg)
 
-        if warning_msgs:
-            for warning in warning_msgs:
+        for context, instantiation, warning in warning_msgs:
+            if not quiet:
                 warnings.warn(warning)
+            elif instantiation is None:
+                diagnostics.record(NO_EVIDENCE, context)
+            elif diagnostics.strict:
+                errors.append(warning)
+            else:
+                diagnostics.record(INVALID_INSTANTIATION, context)
 
         if errors:
             raise ValueError(f"{errors}")
+        return card_evidence
 
-        if self.valid:
-            inference = {}
-            for intention in self.intentions:
-                # only True values of binary intentions will be saved
-                inference[intention] = bn.inference.fit(
-                    self.DAG,
-                    variables=[intention],
-                    evidence=card_evidence,
-                    verbose=self.bn_verbosity
-                ).values[1]
-
-            if normalized:
-                inference = self.normalize_inference(inference)
-            max_intention = max(inference, key=inference.get)
-            max_intention = max_intention if inference[max_intention] > decision_threshold else None
-            return max_intention, decision_threshold, inference
-        else:
-            raise ValueError('Invalid configuration')
+    @staticmethod
+    def _soft_evidence(model: CompiledModel, context: str, distribution: Mapping) -> tuple:
+        '''
+        Translates soft evidence into the probability of every card number of the context.
+
+        Args:
+            model: the snapshot the evidence is translated for
+            context: a context of the snapshot
+            distribution: a dict of instantiations and their probabilities
+        Returns:
+            tuple:
+            The normalized probabilities as array or None and an error message if the
+            distribution can't be used
+        '''
+        value_to_card = model.value_to_card[context]
+        weights = np.zeros(len(value_to_card))
+        for instantiation, probability in distribution.items():
+            if not isinstance(instantiation, Hashable) or instantiation not in value_to_card:
+                return None, (f'"{instantiation}" is not a valid instantiation for "{context}". '
+                              f'Valid options are {list(value_to_card)}')
+            try:
+                weights[value_to_card[instantiation]] = probability
+            except (TypeError, ValueError):
+                weights[:] = np.nan
+        if not np.all(np.isfinite(weights)) or np.any(weights < 0) or not weights.sum() > 0:
+            return None, (f'Soft evidence for "{context}" must have non-negative numbers '
+                          f'which do not all equal 0, got {dict(distribution)}')
+        return weights / weights.sum(), ''
+
+    def _decide(self, inference: dict, normalized: bool, decision_threshold: float) -> tuple:
+        '''
+        Picks the most likely intention if it reaches the decision threshold.
+
+        Args:
+            inference: dictionary of intentions and the corresponding probabilities
+            normalized: Flag if the inference is normalized to sum up to 1.
+            decision_threshold: a threshold for picking the most likely intention
+        Returns:
+            tuple:
+            The highest ranking intention (or None if decision_threshold is not reached), the
+            decision threshold and a dictionary of intentions and the corresponding probabilities.
+        '''
+        if normalized:
+            inference = self.normalize_inference(inference)
+        max_intention = max(inference, key=inference.get)
+        max_intention = max_intention if inference[max_intention] > decision_threshold else None
+        return max_intention, decision_threshold, inference
 
     def normalize_inference(self, inference: dict) -> dict:
         '''
@@ -487,6 +1527,11 @@ class BayesNet():
                                 f'An influence needs to be defined for all instantiations! {intention}.{context}.{instantiation} does not fit the defined instantiations for {context}')
                             self.valid = False
 
+        for context in self.config.get('discretizers', {}):
+            if context not in self.config['contexts']:
+                warnings.warn(
+                    f'Discretizer for {context} cannot be found in the defined contexts!')
+
         # Probabilities need to sum up to 1
         for context, instantiations in self.config['contexts'].items():
             for instantiation, value in instantiations.items():
@@ -530,6 +1575,7 @@ class BayesNet():
                 zeros[context][instantiation] = 0
         return zeros
 
+    @_writer
     def add_context(self, context: str, instantiations: dict):
         """
         This will add a new context to the config and updates the bayesNet.
@@ -552,8 +1598,9 @@ class BayesNet():
         # add this context in every intention with instantiations and values beeing zero.
         self._transport_context_into_intentions()
         # reinizialize
-        self.__init__(self.config)
+        self._recompile()
 
+    @_writer
     def add_intention(self, intention: str):
         """
         This will add a new intention to the config and updates the bayesNet.
@@ -577,8 +1624,9 @@ class BayesNet():
         #         {context: instantiations_with_values})
         #     self.config['intentions'][intention][context] = zeros[context]
         # reinizialize
-        self.__init__(self.config)
+        self._recompile()
 
+    @_writer
     def edit_context(self, context: str, instantiations: dict, new_name: str = None):
         """
         Edits an existing context - this can also be used to remove instantiations
@@ -616,8 +1664,9 @@ class BayesNet():
         self._remove_context_from_intentions()
         self._transport_context_into_intentions()
         # reinizialize
-        self.__init__(self.config)
+        self._recompile()
 
+    @_writer
     def edit_intention(self, intention: str, new_name: str):
         """
         Edits an existing intention.
@@ -640,8 +1689,9 @@ class BayesNet():
         del self.config['intentions'][intention]
         self.config['intentions'][new_name] = old_values
         # reinizialize
-        self.__init__(self.config)
+        self._recompile()
 
+    @_writer
     def del_context(self, context: str):
         """
         Removes a context.
@@ -661,8 +1711,9 @@ class BayesNet():
         self._remove_context_from_intentions()
         self._transport_context_into_intentions()
 
-        self.__init__(self.config)
+        self._recompile()
 
+    @_writer
     def del_intention(self, intention):
         """
         remove an intention.
@@ -678,7 +1729,7 @@ class BayesNet():
                 'Cannot delete non existing intention - use add_intention to add a new intention')
         del self.config['intentions'][intention]
         # reinizialize
-        self.__init__(self.config)
+        self._recompile()
 
     def save(self, path: str, save_invalid: bool = True):
         """
@@ -697,6 +1748,7 @@ class BayesNet():
             with open(path, 'w', encoding='utf-8') as save_file:
                 yaml.dump(default_to_regular(self.config), save_file)
 
+    @_writer
     def load(self, path: str):
         """
         Loads a config from file and reinitializes the bayesNet.
@@ -704,10 +1756,12 @@ class BayesNet():
         Args:
             path: path to the file the config is saved in
         """
-        config = load_config(path)
+        self.config = load_config(path, self.metrics)
+        self.discretization_functions.update(self.config.get('discretizers', {}))
         # reinitialize with config
-        self.__init__(config)
+        self._recompile()
 
+    @_writer
     def change_context_apriori_value(self, context: str, instantiation, value: float):
         """
         Changes the apriori_value for a context instantiation.
@@ -724,11 +1778,12 @@ class BayesNet():
         if instantiation in self.config['contexts'][context]:
             self.config['contexts'][context][instantiation] = value
             # reinizialize
-            self.__init__(self.config)
+            self._recompile()
         else:
             raise ValueError(
                 'change_context_apriori_value can only change values that exist already')
 
+    @_writer
     def change_influence_value(self, intention: str, context: str, instantiation, value: int):
         """
         Update the influence value of a specific intention for a particular context instance..
@@ -745,11 +1800,12 @@ class BayesNet():
         # otherwise you can just add values
         if instantiation in self.config['intentions'][intention][context]:
             self.config['intentions'][intention][context][instantiation] = value
-            self.__init__(self.config)
+            self._recompile()
         else:
             raise ValueError(
                 'change_influence_value can only change values that exist already')
 
+    @_writer
     def add_combined_influence(self, intention: str, contexts: tuple,
                                instantiations: tuple, value: int):
         """
@@ -773,8 +1829,9 @@ class BayesNet():
                 raise ValueError(
                     'add_combined_influence can only combine context instantiations that already exist')
         self.config['intentions'][intention][contexts][instantiations] = value
-        self.__init__(self.config)
+        self._recompile()
 
+    @_writer
     def del_combined_influence(self, intention: str, contexts: tuple, instantiations: tuple):
         """
         Adds an influence value for a combination of context instantiations.
@@ -825,6 +1882,7 @@ class BayesNet():
         for intention, context, instantiation in context_instantiations_to_remove_from_intentions:
             del self.config['intentions'][intention][context][instantiation]
 
+    @_writer
     def change_decision_threshold(self, decision_threshold):
         """
         Changes the decision threshold in the config.
@@ -832,7 +1890,7 @@ class BayesNet():
             decision_threshold: The new decision threshold.
         """
         self.config['decision_threshold'] = decision_threshold
-        self.__init__(self.config)
+        self._recompile()
 
 
 def config_to_default_dict(config: dict = None):
@@ -865,16 +1923,19 @@ def config_to_default_dict(config: dict = None):
         new_config['decision_threshold'] = config['decision_threshold']
     else:
         new_config['decision_threshold'] = 0.0
+    if config.get('discretizers'):
+        new_config['discretizers'] = compile_discretizers(config['discretizers'])
 
     return new_config
 
 
-def load_config(path):
+def load_config(path, metrics: MetricsRegistry = None):
     """
     Helper function to load a config.
 
     Args:
-        path: path to the file the config is saved in
+        path: path to the file the config is saved in or a text stream with the config
+        metrics: a registry the duration of the call is recorded in. See `CoBaIR.metrics`.
     Returns:
         defaultdict:
             a defaultdict containing the config
@@ -883,8 +1944,15 @@ def load_config(path):
     # if os.path.splitext(path)[-1] != ".yml":
     #     raise TypeError(
     #         'Invalid format file - only supporting yml files')
-    with open(path, encoding='utf-8') as stream:
-        return config_to_default_dict(yaml.load(stream, Loader=PrettySafeLoader))
+    start = time.perf_counter()
+    if hasattr(path, 'read'):
+        config = config_to_default_dict(yaml.load(path, Loader=PrettySafeLoader))
+    else:
+        with open(path, encoding='utf-8') as stream:
+            config = config_to_default_dict(yaml.load(stream, Loader=PrettySafeLoader))
+    if metrics is not None:
+        metrics.observe(CONFIG_LOAD_SECONDS, time.perf_counter() - start)
+    return config
 
 
 # https://stackoverflow.com/questions/26496831/how-to-convert-defaultdict-of-defaultdicts-of-defaultdicts-to-dict-of-dicts-o
@@ -0,0 +1,284 @@
+"""
+This module translates columnar evidence into card numbers for vectorized inference.
+
+Logs are often stored column by column. Evidence can be given as
+
+- a NumPy structured array with one field per context
+- a `pyarrow.RecordBatch` with one column per context
+- a dict of equally long 1D arrays with one entry per context
+
+Every column is dictionary encoded: the distinct values of the column are translated into card
+numbers once and the codes of the rows are mapped with a single lookup. Arrow columns which are
+already dictionary encoded are used as they are. No Python object is created per row.
+
+Missing values (None or null) mean that the context is unobserved. Values which are not an
+instantiation of the context are discretized with the bound discretization function of the
+context; distinct values are discretized once. Values which are still invalid and columns of
+unknown contexts are ignored and reported like in `BayesNet.infer`: with a warning, counted per
+row in quiet mode or as ValueError in strict mode (see `CoBaIR.diagnostics`).
+
+Numeric columns of a context with a discretizer from `CoBaIR.discretizers` are discretized as a
+whole with its vectorized `encode` method instead, in row order. Like in `BayesNet.infer`, values
+which are instantiations of the context are used as they are and only the other rows are
+discretized.
+
+pyarrow is not a dependency of CoBaIR. Record batches are only accessed through their methods.
+"""
+
+# System imports
+from collections.abc import Hashable, Mapping
+import warnings
+
+# 3rd party imports
+import numpy as np
+
+# local imports
+from .numpy_engine import UNOBSERVED
+from .diagnostics import INVALID_INSTANTIATION, UNKNOWN_CONTEXT
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def _is_record_batch(data) -> bool:
+    """Checks if data looks like a pyarrow RecordBatch or Table"""
+    return hasattr(data, 'schema') and hasattr(data, 'column') and hasattr(data, 'num_rows')
+
+
+def _is_arrow_array(column) -> bool:
+    """Checks if a column looks like a pyarrow Array"""
+    return hasattr(column, 'null_count') and hasattr(column, 'to_pylist')
+
+
+def column_names(data) -> list:
+    """
+    Returns the names of all columns.
+
+    Args:
+        data: a structured array, a record batch or a dict of arrays
+    Returns:
+        list:
+            The names of all columns
+    Raises:
+        TypeError: A TypeError is raised if data is not columnar
+    """
+    if _is_record_batch(data):
+        return list(data.schema.names)
+    names = getattr(getattr(data, 'dtype', None), 'names', None)
+    if names is not None:
+        return list(names)
+    if isinstance(data, Mapping):
+        return list(data)
+    raise TypeError(
+        f'Expected a structured array, a record batch or a dict of arrays, got {type(data)}')
+
+
+def num_rows(data) -> int:
+    """
+    Returns the number of rows.
+
+    Args:
+        data: a structured array, a record batch or a dict of arrays
+    Returns:
+        int:
+            The number of rows
+    Raises:
+        ValueError: A ValueError is raised if the columns of a dict differ in length
+    """
+    if _is_record_batch(data):
+        return data.num_rows
+    if isinstance(data, Mapping):
+        lengths = {len(column) for column in data.values()}
+        if len(lengths) > 1:
+            raise ValueError(f'All columns must have the same length, got lengths {lengths}')
+        return lengths.pop() if lengths else 0
+    return len(data)
+
+
+def _to_numpy(column) -> np.ndarray:
+    """Returns a column as NumPy array - nulls of arrow columns become NaN or None"""
+    if _is_arrow_array(column):
+        return column.to_numpy(zero_copy_only=False)
+    return np.asarray(column)
+
+
+def _column(data, name: str):
+    """Returns one column"""
+    if _is_record_batch(data):
+        column = data.column(name)
+        # Tables hold chunked arrays
+        if hasattr(column, 'combine_chunks'):
+            column = column.combine_chunks()
+        return column
+    return data[name]
+
+
+def dictionary_encode(column) -> tuple:
+    """
+    Dictionary encodes a column.
+
+    Args:
+        column: a 1D NumPy array, a sequence or a pyarrow Array
+    Returns:
+        tuple:
+        A list of the distinct values and an integer array with the index of the value of every
+        row or -1 for missing values
+    Raises:
+        ValueError: A ValueError is raised if a value is not hashable
+    """
+    if _is_arrow_array(column):
+        if not hasattr(column, 'indices'):
+            column = column.dictionary_encode()
+        codes = column.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+        return column.dictionary.to_pylist(), codes.astype(np.intp, copy=False)
+
+    column = np.asarray(column)
+    if column.dtype != object:
+        values, codes = np.unique(column, return_inverse=True)
+        return values.tolist(), codes.reshape(-1).astype(np.intp, copy=False)
+    # object columns can't be sorted if they mix types, e.g. None and strings
+    index = {}
+    codes = np.empty(len(column), dtype=np.intp)
+    try:
+        for row, value in enumerate(column):
+            codes[row] = -1 if value is None else index.setdefault(value, len(index))
+    except TypeError as error:
+        raise ValueError(f'Context instantiations must be hashable! {error}') from error
+    return list(index), codes
+
+
+def _card_lookup(model, context: str, values: list, discretization_function=None) -> tuple:
+    """
+    Translates the distinct values of a column into card numbers.
+
+    Args:
+        model: the `CompiledModel` to translate for
+        context: the context of the column
+        values: the distinct values of the column
+        discretization_function: the discretization function bound to the context or None
+    Returns:
+        tuple:
+        The card number of every value or UNOBSERVED and a list of the invalid values
+    """
+    value_to_card = model.value_to_card[context]
+    lookup = np.full(len(values), UNOBSERVED, dtype=np.intp)
+    invalid = []
+    for index, value in enumerate(values):
+        if value is None:
+            continue
+        valid = isinstance(value, Hashable) and value in value_to_card
+        if not valid and discretization_function is not None:
+            value = discretization_function(value)
+            if value is None:
+                continue
+            valid = isinstance(value, Hashable) and value in value_to_card
+        if valid:
+            lookup[index] = value_to_card[value]
+        else:
+            invalid.append((index, value))
+    return lookup, invalid
+
+
+def _report_invalid(model, context: str, invalid: list, codes: np.ndarray, diagnostics=None):
+    """
+    Reports the invalid values of a column like `BayesNet.infer` reports invalid evidence.
+
+    Args:
+        model: the `CompiledModel` the column is translated for
+        context: the context of the column
+        invalid: the indices and values of the invalid values, see `_card_lookup`
+        codes: the index of the value of every row
+        diagnostics: the `Diagnostics` of the net. Invalid values are warned if None.
+    Raises:
+        ValueError: A ValueError is raised in strict mode
+    """
+    if diagnostics is None or not diagnostics.quiet:
+        warnings.warn(f'{[value for _, value in invalid]} are not valid instantiations for '
+                      f'"{context}". Using None instead. '
+                      f'Valid options are {list(model.value_to_card[context])}')
+    elif diagnostics.strict:
+        raise ValueError(f'{[value for _, value in invalid]} are not valid instantiations for '
+                         f'"{context}"')
+    else:
+        rows = np.isin(codes, [index for index, _ in invalid]).sum()
+        diagnostics.record(INVALID_INSTANTIATION, context, int(rows))
+
+
+def columns_to_cards(model, data, discretization_functions: dict = None,
+                     diagnostics=None) -> np.ndarray:
+    """
+    Translates columnar evidence into card numbers.
+
+    Args:
+        model: the `CompiledModel` to translate for
+        data: a structured array, a record batch or a dict of arrays
+        discretization_functions: discretization functions per context
+        diagnostics: the `Diagnostics` of the net which decide how unknown contexts and invalid
+            values are reported. They are warned if None.
+    Returns:
+        np.ndarray:
+            An integer array of shape (number of rows, number of contexts) with the card number
+            of every context or UNOBSERVED
+    Raises:
+        ValueError: A ValueError is raised for unknown contexts and invalid values in strict
+            mode
+    """
+    discretization_functions = discretization_functions or {}
+    rows = num_rows(data)
+    cards = np.full((rows, len(model.contexts)), UNOBSERVED, dtype=np.intp)
+    for name in column_names(data):
+        if name not in model.context_index:
+            if diagnostics is None or not diagnostics.quiet:
+                warnings.warn(f'Context "{name}" not set in config - will be ignored')
+            elif diagnostics.strict:
+                raise ValueError(f'Context "{name}" not set in config')
+            elif rows:
+                diagnostics.record(UNKNOWN_CONTEXT, name, rows)
+            continue
+        column = _column(data, name)
+        function = discretization_functions.get(name)
+        values, codes = dictionary_encode(column)
+        if not values:
+            continue
+        array = _to_numpy(column) if hasattr(function, 'encode') else None
+        if array is not None and array.dtype.kind in 'fiu':
+            cards[:, model.context_index[name]] = _encode_column(
+                model, name, function, array, values, codes, diagnostics)
+            continue
+        lookup, invalid = _card_lookup(model, name, values, function)
+        if invalid:
+            _report_invalid(model, name, invalid, codes, diagnostics)
+        cards[:, model.context_index[name]] = np.where(
+            codes >= 0, lookup[codes], UNOBSERVED)
+    return cards
+
+
+def _encode_column(model, context: str, discretizer, array: np.ndarray, values: list,
+                   codes: np.ndarray, diagnostics=None) -> np.ndarray:
+    """
+    Translates a numeric column with a vectorized discretizer into card numbers.
+
+    Args:
+        model: the `CompiledModel` to translate for
+        context: the context of the column
+        discretizer: a discretizer with an `encode` method
+        array: the column
+        values: the distinct values of the column, see `dictionary_encode`
+        codes: the index of the value of every row, see `dictionary_encode`
+        diagnostics: the `Diagnostics` of the net, see `columns_to_cards`
+    Returns:
+        np.ndarray:
+            The card number of every row or UNOBSERVED
+    """
+    lookup, _ = _card_lookup(model, context, values)
+    row_cards = np.where(codes >= 0, lookup[codes], UNOBSERVED)
+    # the discretizer sees the rows which are no instantiation in row order
+    rows = (codes >= 0) & (row_cards == UNOBSERVED)
+    if not rows.any():
+        return row_cards
+    labels, label_codes = discretizer.encode(array[rows])
+    lookup, invalid = _card_lookup(model, context, labels)
+    if invalid:
+        _report_invalid(model, context, invalid, label_codes, diagnostics)
+    row_cards[rows] = np.where(label_codes >= 0, lookup[label_codes], UNOBSERVED)
+    return row_cards
@@ -9,6 +9,9 @@ This module contains some default functions to discretize incoming evidence
     ```
     net.bind_discretization_function('some context', lambda x: binary_decision(x, decision_boundary=0.7))
     ```
+
+    `CoBaIR.discretizers` provides picklable discretizers with more than two bins which
+    also discretize whole NumPy columns.
 """
 
 
@@ -0,0 +1,115 @@
+"""
+This module aggregates diagnostics of the evidence given to `BayesNet.infer`.
+
+By default every evidence with an unknown context, an invalid instantiation or None emits a
+formatted `warnings.warn`. In a control loop where one sensor is down this happens on every
+frame. The diagnostics modes trade the warnings for counters:
+
+- "warn": every diagnostic is a warning (default)
+- "quiet": diagnostics are counted and summarized in a log message at most once per interval
+- "strict": like "quiet", but unknown contexts and invalid instantiations raise a ValueError
+
+```
+net = BayesNet(config, diagnostics='quiet')
+...
+net.diagnostics.counts()
+# {('unknown context', 'gaze'): 1200, ('no evidence', 'speech commands'): 37}
+```
+"""
+
+# System imports
+from collections import defaultdict
+import logging
+import threading
+import time
+
+# 3rd party imports
+
+# local imports
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+DIAGNOSTICS_MODES = ('warn', 'quiet', 'strict')
+
+# Kinds of diagnostics
+UNKNOWN_CONTEXT = 'unknown context'
+INVALID_INSTANTIATION = 'invalid instantiation'
+NO_EVIDENCE = 'no evidence'
+
+
+class Diagnostics():
+    """Thread safe counters of diagnostics with rate limited logging."""
+
+    def __init__(self, mode: str = 'warn', interval: float = 10.0,
+                 logger: logging.Logger = None) -> None:
+        '''
+        Creates the counters.
+
+        Args:
+            mode: one of "warn", "quiet" and "strict"
+            interval: minimum number of seconds between two log messages
+            logger: the logger for the summaries. The logger of the module if None.
+        Raises:
+            ValueError: A ValueError is raised if the mode is unknown
+        '''
+        if mode not in DIAGNOSTICS_MODES:
+            raise ValueError(f'Unknown diagnostics mode "{mode}" - use one of {DIAGNOSTICS_MODES}')
+        self.mode = mode
+        self.interval = interval
+        self.log = logger or logging.getLogger(__name__)
+        self._counts = defaultdict(int)
+        # counts since the last log message
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        # the first diagnostic is logged right away
+        self._last_log = float('-inf')
+
+    @property
+    def quiet(self) -> bool:
+        """True if diagnostics are counted instead of warned"""
+        return self.mode != 'warn'
+
+    @property
+    def strict(self) -> bool:
+        """True if unknown contexts and invalid instantiations raise"""
+        return self.mode == 'strict'
+
+    def record(self, kind: str, context: str, count: int = 1):
+        """
+        Counts a diagnostic and logs a summary if the last one is older than the interval.
+
+        Args:
+            kind: the kind of the diagnostic, e.g. UNKNOWN_CONTEXT
+            context: the context of the evidence
+            count: the number of evidences with the diagnostic, e.g. rows of a column
+        """
+        key = (kind, context)
+        now = time.monotonic()
+        with self._lock:
+            self._counts[key] += count
+            self._pending[key] += count
+            if now - self._last_log < self.interval:
+                return
+            pending, self._pending = self._pending, defaultdict(int)
+            self._last_log = now
+        self.log.warning('Evidence diagnostics since the last summary: %s',
+                         ', '.join(f'{count}x {kind} "{context}"'
+                                   for (kind, context), count in pending.items()))
+
+    def counts(self) -> dict:
+        """
+        Returns the number of every diagnostic since the creation or the last reset.
+
+        Returns:
+            dict:
+                a dict of (kind, context) tuples and their counts
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        """Resets all counters"""
+        with self._lock:
+            self._counts.clear()
+            self._pending.clear()
@@ -0,0 +1,363 @@
+"""
+This module runs the discretization functions of one evidence concurrently.
+
+Discretization functions which wrap classifiers, e.g. for gestures or speech intents, can take
+milliseconds each. Called one after another their times add up. The stage runs the functions
+for all contexts of an evidence on a thread pool instead, so the evidence is ready after the
+slowest function. Discretization functions which are coroutine functions are awaited, all other
+functions run on the thread pool. If `infer` is called from a thread with a running event loop,
+e.g. in a coroutine of an asyncio server, coroutines are run on a background event loop instead.
+`infer_async` awaits them without blocking the loop.
+
+Every call is timed per context:
+
+```
+net = BayesNet(config, discretization_workers=4)
+net.bind_discretization_function('gesture', classify_gesture)
+net.bind_discretization_function('speech commands', classify_intent)
+net.infer({'gesture': frame, 'speech commands': audio})
+net.discretization_timings['gesture'].mean
+```
+
+Values which are discretized over and over again, e.g. probabilities with two decimals in an
+offline replay, can be memoized per context. A `DiscretizationMemo` maps raw values - optionally
+quantized to a step - directly to the card number of their discretized instantiation, so neither
+the discretization function nor the validation of its result run again:
+
+```
+net.bind_discretization_function('human holding object', ThresholdDiscretizer([0.5], [False, True]),
+                                 memo_size=1024, quantization_step=0.01)
+```
+
+!!! note
+    Discretization functions run on several threads at once. Functions with state, e.g. a
+    `HysteresisDiscretizer`, are still only called once per evidence and context, but two
+    evidences which are inferred at the same time may call the same function concurrently.
+"""
+
+# System imports
+import asyncio
+from collections.abc import Hashable
+import concurrent.futures
+import inspect
+import math
+import numbers
+import threading
+import time
+import weakref
+
+# 3rd party imports
+
+# local imports
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+class FunctionTiming():
+    """Statistics of the call times of one discretization function."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    @property
+    def mean(self) -> float:
+        """Mean seconds per call"""
+        return self.total / self.calls if self.calls else 0.0
+
+    def add(self, seconds: float):
+        """
+        Adds the time of a call.
+
+        Args:
+            seconds: the duration of the call
+        """
+        self.calls += 1
+        self.total += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self) -> dict:
+        """Returns the statistics as dict"""
+        return {'calls': self.calls, 'total': self.total, 'mean': self.mean, 'max': self.max,
+                'last': self.last}
+
+    def __repr__(self) -> str:
+        return (f'{self.__class__.__name__}(calls={self.calls}, mean={self.mean:.6f}, '
+                f'max={self.max:.6f})')
+
+
+class DiscretizationStage():
+    """Runs discretization functions for all contexts of an evidence and times them."""
+
+    def __init__(self, max_workers: int = 0) -> None:
+        '''
+        Creates the stage. The thread pool is only started when it is first needed.
+
+        Args:
+            max_workers: number of threads which run discretization functions concurrently.
+                With 0, functions run one after another in the calling thread and coroutine
+                functions are run with `asyncio.run`.
+        Raises:
+            ValueError: A ValueError is raised if max_workers is negative
+        '''
+        if max_workers < 0:
+            raise ValueError(f'max_workers must not be negative, got {max_workers}')
+        self.max_workers = max_workers
+        self._timings = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        # event loop in a background thread for coroutines of calls within a running loop
+        self._loop = None
+
+    @property
+    def timings(self) -> dict:
+        """A dict of contexts and the `FunctionTiming` of their discretization functions"""
+        with self._lock:
+            return dict(self._timings)
+
+    def reset_timings(self):
+        """Resets the timings of all contexts"""
+        with self._lock:
+            self._timings = {}
+
+    def _record(self, context: str, seconds: float):
+        """Adds the time of a call of the function of context"""
+        with self._lock:
+            timing = self._timings.get(context)
+            if timing is None:
+                timing = self._timings[context] = FunctionTiming()
+            timing.add(seconds)
+
+    def _executor_or_start(self) -> concurrent.futures.ThreadPoolExecutor:
+        """Returns the thread pool and starts it if needed"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='BayesNet-discretize')
+            return self._executor
+
+    def _call(self, context: str, function, value):
+        """Calls a function, runs its coroutine if it returns one and times it"""
+        start = time.perf_counter()
+        result = function(value)
+        if inspect.isawaitable(result):
+            result = self._run_awaitable(result)
+        self._record(context, time.perf_counter() - start)
+        return result
+
+    def _run_awaitable(self, awaitable):
+        """
+        Runs an awaitable to completion. asyncio.run can't be used in a thread with a running
+        event loop, so the awaitable is run on the background loop of the stage there.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(_await(awaitable))
+        return asyncio.run_coroutine_threadsafe(_await(awaitable), self._loop_or_start()).result()
+
+    def _loop_or_start(self) -> asyncio.AbstractEventLoop:
+        """Returns the background event loop and starts it if needed"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=_run_loop, args=(self._loop,), daemon=True,
+                                 name='BayesNet-discretize-loop').start()
+            return self._loop
+
+    def run(self, functions: dict, values: dict) -> dict:
+        """
+        Discretizes values with their functions.
+
+        Args:
+            functions: a dict of contexts and their discretization functions
+            values: a dict of contexts and the values to discretize. Every context must be in
+                functions.
+        Returns:
+            dict:
+                a dict of contexts and their discretized values
+        Raises:
+            Exception: The first exception of a discretization function is raised
+        """
+        if self.max_workers == 0 or len(values) < 2:
+            return {context: self._call(context, functions[context], value)
+                    for context, value in values.items()}
+        executor = self._executor_or_start()
+        futures = {context: executor.submit(self._call, context, functions[context], value)
+                   for context, value in values.items()}
+        return {context: future.result() for context, future in futures.items()}
+
+    async def run_async(self, functions: dict, values: dict) -> dict:
+        """
+        Discretizes values with their functions without blocking the event loop. Coroutine
+        functions are awaited, all other functions run on the thread pool or on the default
+        executor of the event loop if max_workers is 0. See `run` for details.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._executor_or_start() if self.max_workers else None
+
+        async def discretize(context, function, value):
+            start = time.perf_counter()
+            if inspect.iscoroutinefunction(function):
+                result = await function(value)
+            else:
+                result = await loop.run_in_executor(executor, function, value)
+                if inspect.isawaitable(result):
+                    result = await result
+            self._record(context, time.perf_counter() - start)
+            return result
+
+        results = await asyncio.gather(*[discretize(context, functions[context], value)
+                                          for context, value in values.items()])
+        return dict(zip(values, results))
+
+    def close(self):
+        """
+        Shuts down the thread pool and the background event loop. Both are started again if
+        the stage is used afterwards.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            loop, self._loop = self._loop, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop):
+    """Runs an event loop in its thread until it is stopped and closes it"""
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_forever()
+    finally:
+        loop.close()
+
+
+async def _await(awaitable):
+    """Awaits an awaitable - asyncio.run only accepts coroutines"""
+    return await awaitable
+
+
+class DiscretizationMemo():
+    """
+    A bounded table from raw values of one context to the card numbers of their discretized
+    instantiations.
+
+    Card numbers belong to one compiled model, so the table is emptied whenever it is used with
+    another model. If the table is full, the oldest entry is dropped. Only memoize pure
+    discretization functions - a `HysteresisDiscretizer` e.g. depends on previous values.
+    """
+
+    def __init__(self, maxsize: int, step: float = None) -> None:
+        '''
+        Creates an empty table.
+
+        Args:
+            maxsize: maximum number of entries
+            step: the quantization step of numbers. Numbers are rounded to a multiple of step
+                and the discretization function gets the rounded value. Numbers are used
+                as they are if None.
+        Raises:
+            ValueError: A ValueError is raised if maxsize or step is not positive
+        '''
+        if maxsize < 1:
+            raise ValueError(f'maxsize must be positive, got {maxsize}')
+        if step is not None and not step > 0:
+            raise ValueError(f'The quantization step must be positive, got {step}')
+        self.maxsize = maxsize
+        self.step = step
+        self.hits = 0
+        self.misses = 0
+        # a weak reference to the model and its cards are swapped together so readers never mix
+        # them up - the table does not keep a replaced snapshot alive
+        self._table = (None, {})
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._table[1])
+
+    def _quantizes(self, value) -> bool:
+        """Checks if a value is a number which is quantized"""
+        return self.step is not None and isinstance(value, numbers.Real) \
+            and not isinstance(value, bool)
+
+    def key(self, value):
+        """
+        Returns the key of a raw value in the table.
+
+        Args:
+            value: a raw value of the context
+        Returns:
+            The quantization bucket of numbers, the value itself for other hashable values or
+            None if the value can't be memoized
+        """
+        if self._quantizes(value):
+            if not math.isfinite(value):
+                return None
+            return round(value / self.step)
+        return value if isinstance(value, Hashable) else None
+
+    def quantize(self, value):
+        """
+        Returns the value the discretization function gets for a raw value.
+
+        Args:
+            value: a raw value of the context
+        Returns:
+            The multiple of the step closest to numbers, other values as they are
+        """
+        key = self.key(value)
+        if key is None or not self._quantizes(value):
+            return value
+        # round away the floating point error of the multiplication
+        return round(key * self.step, 12)
+
+    def get(self, model, key):
+        """
+        Looks up the card number of a key.
+
+        Args:
+            model: the compiled model the card number is needed for
+            key: a key returned by `key`
+        Returns:
+            The card number, the probabilities of soft evidence or None if the key is unknown
+        """
+        if key is None:
+            return None
+        table_model, cards = self._table
+        card = cards.get(key) if table_model is not None and table_model() is model else None
+        if card is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return card
+
+    def put(self, model, key, card):
+        """
+        Stores the card number of a key.
+
+        Args:
+            model: the compiled model the card number belongs to
+            key: a key returned by `key`. Nothing is stored if None.
+            card: the card number or the probabilities of soft evidence
+        """
+        if key is None:
+            return
+        with self._lock:
+            table_model, cards = self._table
+            if table_model is None or table_model() is not model:
+                cards = {}
+                self._table = (weakref.ref(model), cards)
+            while len(cards) >= self.maxsize:
+                del cards[next(iter(cards))]
+            cards[key] = card
+
+    def clear(self):
+        """Removes all entries"""
+        with self._lock:
+            self._table = (None, {})
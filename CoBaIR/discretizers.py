@@ -0,0 +1,503 @@
+"""
+This module contains discretizers which work on single values and on whole NumPy columns.
+
+All discretizers are picklable callables which can be bound with
+`bayes_net.bind_discretization_function` without wrapping them in a lambda:
+
+```
+net.bind_discretization_function('distance', ThresholdDiscretizer([0.5, 2.0], ['near', 'mid', 'far']))
+net.bind_discretization_function('gesture', ArgmaxDiscretizer(['wave', 'point', 'none']))
+net.bind_discretization_function('holding', HysteresisDiscretizer(low=0.4, high=0.6, debounce=3))
+```
+
+Called with a scalar they return one instantiation, called with a NumPy array they return an
+object array of instantiations. Values which can't be discretized, e.g. NaN, are discretized as
+None (unobserved).
+
+`encode` discretizes a whole column into the index of the label of every value.
+`BayesNet.infer_columns` uses it to discretize columns without a Python call per value.
+
+Discretizers can also be declared per context in the config file. `load_config` compiles them
+and `BayesNet.save` writes them back:
+
+```
+discretizers:
+  human holding object:
+    type: threshold
+    thresholds: [0.5]
+    labels: [false, true]
+  human activity:
+    type: argmax
+    labels: [idle, working]
+    min_probability: 0.6
+  speech commands:
+    type: map
+    mapping: {0: pickup, 1: handover}
+```
+"""
+
+# System imports
+import bisect
+import math
+
+# 3rd party imports
+import numpy as np
+import yaml
+
+# local imports
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+# Code of values which can't be discretized
+MISSING = -1
+
+
+def _label_array(labels: list) -> np.ndarray:
+    """Creates an object array of labels with None at the end for MISSING codes"""
+    array = np.empty(len(labels) + 1, dtype=object)
+    array[:-1] = labels
+    array[-1] = None
+    return array
+
+
+def _is_missing(value) -> bool:
+    """Checks if a scalar value can't be discretized"""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _freeze(value):
+    """Turns lists and dicts of a declaration into hashable tuples and frozensets"""
+    if isinstance(value, dict):
+        return frozenset((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class _Declarative():
+    """
+    Discretizers are equal if their declarations are equal, so configs with discretizers compare
+    equal after a copy or a round trip through a file. The state of a `HysteresisDiscretizer`
+    is not part of its declaration.
+    """
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, _Declarative):
+            return NotImplemented
+        return self.to_spec() == other.to_spec()
+
+    def __hash__(self) -> int:
+        return hash(_freeze(self.to_spec()))
+
+
+class ThresholdDiscretizer(_Declarative):
+    """Discretizes values into bins between ascending thresholds."""
+    kind = 'threshold'
+
+    def __init__(self, thresholds: list, labels: list) -> None:
+        '''
+        Creates the discretizer. Values >= a threshold belong to the bin above the threshold.
+
+        Args:
+            thresholds: ascending thresholds between the bins
+            labels: the instantiations of the bins - one more than thresholds
+        Raises:
+            ValueError: A ValueError is raised if the thresholds are not ascending or the number
+                of labels does not fit
+        '''
+        thresholds = [float(threshold) for threshold in thresholds]
+        if any(lower >= upper for lower, upper in zip(thresholds, thresholds[1:])):
+            raise ValueError(f'Thresholds must be strictly ascending, got {thresholds}')
+        if len(labels) != len(thresholds) + 1:
+            raise ValueError(f'{len(thresholds)} thresholds need {len(thresholds) + 1} labels, '
+                             f'got {len(labels)}')
+        self.thresholds = thresholds
+        self.labels = list(labels)
+        self._thresholds = np.asarray(thresholds)
+        self._labels = _label_array(self.labels)
+
+    def encode(self, values) -> tuple:
+        """
+        Discretizes an array of values into label indices.
+
+        Args:
+            values: an array of numbers
+        Returns:
+            tuple:
+            The labels and an integer array with the index of the label of every value or MISSING
+        """
+        values = np.asarray(values, dtype=float)
+        codes = np.searchsorted(self._thresholds, values, side='right')
+        codes[np.isnan(values)] = MISSING
+        return self.labels, codes
+
+    def __call__(self, value):
+        """
+        Discretizes a value or an array of values.
+
+        Args:
+            value: a number or an array of numbers
+        Returns:
+            The label of the bin of the value or an object array of labels
+        """
+        if np.ndim(value) == 0:
+            if _is_missing(value):
+                return None
+            return self.labels[bisect.bisect_right(self.thresholds, value)]
+        return self._labels[self.encode(value)[1]]
+
+    def to_spec(self) -> dict:
+        """Returns the declaration of the discretizer for the config"""
+        return {'type': self.kind, 'thresholds': self.thresholds, 'labels': self.labels}
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.thresholds}, {self.labels})'
+
+
+class ArgmaxDiscretizer(_Declarative):
+    """Discretizes class probabilities into the label of the most likely class."""
+    kind = 'argmax'
+
+    def __init__(self, labels: list, min_probability: float = 0.0) -> None:
+        '''
+        Creates the discretizer.
+
+        Args:
+            labels: the instantiation of every class in the order of the probabilities
+            min_probability: if the most likely class has a lower probability, the value is
+                discretized as None (unobserved)
+        Raises:
+            ValueError: A ValueError is raised if there are no labels
+        '''
+        if not labels:
+            raise ValueError('At least one label is needed')
+        self.labels = list(labels)
+        self.min_probability = min_probability
+        self._labels = _label_array(self.labels)
+
+    def encode(self, probabilities) -> tuple:
+        """
+        Discretizes class probabilities into label indices.
+
+        Args:
+            probabilities: an array of shape (number of labels,) or (number of values,
+                number of labels)
+        Returns:
+            tuple:
+            The labels and an integer array with the index of the label of every value or MISSING
+        Raises:
+            ValueError: A ValueError is raised if the number of probabilities does not fit
+        """
+        probabilities = np.asarray(probabilities, dtype=float)
+        if probabilities.shape[-1] != len(self.labels):
+            raise ValueError(f'Expected {len(self.labels)} class probabilities, '
+                             f'got {probabilities.shape[-1]}')
+        codes = np.argmax(probabilities, axis=-1)
+        maxima = np.take_along_axis(probabilities, np.expand_dims(codes, -1), axis=-1)[..., 0]
+        return self.labels, np.where(maxima >= self.min_probability, codes, MISSING)
+
+    def __call__(self, probabilities):
+        """
+        Discretizes one vector of class probabilities or an array of them.
+
+        Args:
+            probabilities: see `encode`
+        Returns:
+            The label of the most likely class or an object array of labels
+        """
+        return self._labels[self.encode(probabilities)[1]]
+
+    def to_spec(self) -> dict:
+        """Returns the declaration of the discretizer for the config"""
+        return {'type': self.kind, 'labels': self.labels, 'min_probability': self.min_probability}
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.labels}, min_probability={self.min_probability})'
+
+
+class HysteresisDiscretizer(_Declarative):
+    """
+    Discretizes values into two states which only switch when a threshold is crossed.
+
+    Values >= high switch to the upper state, values <= low switch to the lower state and values
+    in between keep the current state. With `debounce` > 1, the state only switches after that
+    many values in a row crossed the threshold, so single outliers are ignored. The state is kept
+    between calls, so one discretizer must only be used for one stream of values which arrive
+    in order.
+
+    `changed` tells if the last call switched the state. A control loop can skip the inference
+    and everything downstream if no discretizer of its evidence changed.
+    """
+    kind = 'hysteresis'
+
+    def __init__(self, low: float, high: float, labels: tuple = (False, True),
+                 initial=None, debounce: int = 1) -> None:
+        '''
+        Creates the discretizer.
+
+        Args:
+            low: values <= low switch to the lower state
+            high: values >= high switch to the upper state
+            labels: the instantiations of the lower and the upper state
+            initial: the initial state. Values between the thresholds are discretized as None
+                (unobserved) until a threshold is crossed if None.
+            debounce: the number of values in a row which must cross a threshold to switch.
+                Values between the thresholds break the row, missing values don't.
+        Raises:
+            ValueError: A ValueError is raised if low is larger than high, there are not two
+                labels, initial is not one of the labels or debounce is smaller than 1
+        '''
+        if low > high:
+            raise ValueError(f'low must not be larger than high, got {low} > {high}')
+        if len(labels) != 2:
+            raise ValueError(f'Exactly two labels are needed, got {labels}')
+        if initial is not None and initial not in labels:
+            raise ValueError(f'initial must be one of {labels}, got {initial}')
+        if int(debounce) < 1:
+            raise ValueError(f'debounce must be at least 1, got {debounce}')
+        self.low = low
+        self.high = high
+        self.labels = list(labels)
+        self.initial = initial
+        self.debounce = int(debounce)
+        self._labels = _label_array(self.labels)
+        self.reset(initial)
+
+    def reset(self, state=None):
+        """
+        Resets the state.
+
+        Args:
+            state: the new state - one of the labels or None
+        """
+        self.state = state
+        self.changed = False
+        # side and number of the values in a row which crossed a threshold without a switch yet
+        self._streak = (MISSING, 0)
+
+    def _code(self) -> int:
+        """Returns the label index of the state or MISSING"""
+        return MISSING if self.state is None else self.labels.index(self.state)
+
+    def _sides(self, values: np.ndarray) -> np.ndarray:
+        """Returns 0 for values <= low, 1 for values >= high and MISSING otherwise"""
+        sides = np.full(len(values), MISSING, dtype=np.intp)
+        sides[values <= self.low] = 0
+        sides[values >= self.high] = 1
+        return sides
+
+    def _advance(self, side: int, code: int) -> int:
+        """
+        Debounces one value.
+
+        Args:
+            side: the side of the thresholds the value is on, MISSING between them
+                or None for missing values
+            code: the label index of the state before the value
+        Returns:
+            int:
+                the label index of the state after the value
+        """
+        if side is None:
+            return code
+        if side in (MISSING, code):
+            self._streak = (MISSING, 0)
+            return code
+        count = self._streak[1] + 1 if self._streak[0] == side else 1
+        if count >= self.debounce:
+            self._streak = (MISSING, 0)
+            return side
+        self._streak = (side, count)
+        return code
+
+    def encode(self, values) -> tuple:
+        """
+        Discretizes an array of values in order into label indices and updates the state.
+
+        Args:
+            values: a 1D array of numbers in the order they arrived
+        Returns:
+            tuple:
+            The labels and an integer array with the index of the state after every value
+            or MISSING
+        """
+        values = np.asarray(values, dtype=float).reshape(-1)
+        switches = self._sides(values)
+        current = self._code()
+        if self.debounce == 1:
+            # carry the last switch forward - values before the first switch keep the state
+            positions = np.where(switches != MISSING, np.arange(len(values)), -1)
+            if len(values):
+                positions = np.maximum.accumulate(positions)
+            codes = np.where(positions >= 0, switches[positions], current)
+        else:
+            codes = np.empty(len(values), dtype=np.intp)
+            missing = np.isnan(values)
+            code = current
+            for index, side in enumerate(switches.tolist()):
+                code = self._advance(None if missing[index] else side, code)
+                codes[index] = code
+        self.changed = bool(len(codes)) and codes[-1] != current
+        if len(codes):
+            self.state = self._labels[codes[-1]]
+        return self.labels, codes
+
+    def update(self, value) -> tuple:
+        """
+        Discretizes one value and updates the state.
+
+        Args:
+            value: a number
+        Returns:
+            tuple:
+            The state after the value and a flag if the state changed
+        """
+        current = self._code()
+        if _is_missing(value):
+            side = None
+        else:
+            side = self._sides(np.asarray([value], dtype=float))[0]
+        code = self._advance(side, current)
+        self.changed = code != current
+        self.state = self._labels[code]
+        return self.state, self.changed
+
+    def __call__(self, value):
+        """
+        Discretizes a value or an array of values in order and updates the state.
+
+        Args:
+            value: a number or an array of numbers
+        Returns:
+            The state after the value or an object array with the state after every value
+        """
+        if np.ndim(value) == 0:
+            return self.update(value)[0]
+        return self._labels[self.encode(value)[1]]
+
+    def to_spec(self) -> dict:
+        """Returns the declaration of the discretizer for the config"""
+        spec = {'type': self.kind, 'low': self.low, 'high': self.high, 'labels': self.labels}
+        if self.initial is not None:
+            spec['initial'] = self.initial
+        if self.debounce != 1:
+            spec['debounce'] = self.debounce
+        return spec
+
+    def __repr__(self) -> str:
+        return (f'{self.__class__.__name__}(low={self.low}, high={self.high}, '
+                f'labels={self.labels}, debounce={self.debounce})')
+
+
+class MappingDiscretizer(_Declarative):
+    """Discretizes values with a lookup table, e.g. class ids of a classifier into labels."""
+    kind = 'map'
+
+    def __init__(self, mapping: dict, default=None) -> None:
+        '''
+        Creates the discretizer.
+
+        Args:
+            mapping: a dict of values and their instantiations
+            default: the instantiation of values which are not in mapping.
+                None means unobserved.
+        '''
+        self.mapping = dict(mapping)
+        self.default = default
+        self.labels = list(dict.fromkeys(list(self.mapping.values()) + [default]))
+        if None in self.labels:
+            self.labels.remove(None)
+        self._codes = {value: self.labels.index(label) if label is not None else MISSING
+                       for value, label in self.mapping.items()}
+        self._default_code = MISSING if default is None else self.labels.index(default)
+
+    def encode(self, values) -> tuple:
+        """
+        Discretizes an array of values into label indices. Every distinct value is looked up once.
+
+        Args:
+            values: a 1D array of values
+        Returns:
+            tuple:
+            The labels and an integer array with the index of the label of every value or MISSING
+        """
+        distinct, inverse = np.unique(np.asarray(values), return_inverse=True)
+        table = np.array([self._codes.get(value, self._default_code)
+                          for value in distinct.tolist()], dtype=np.intp)
+        return self.labels, table[inverse.reshape(-1)] if len(table) else inverse.reshape(-1)
+
+    def __call__(self, value):
+        """
+        Discretizes a value or an array of values.
+
+        Args:
+            value: a hashable value or an array of values
+        Returns:
+            The instantiation of the value or an object array of instantiations
+        """
+        if np.ndim(value) == 0:
+            return self.mapping.get(value, self.default)
+        return _label_array(self.labels)[self.encode(value)[1]]
+
+    def to_spec(self) -> dict:
+        """Returns the declaration of the discretizer for the config"""
+        spec = {'type': self.kind, 'mapping': self.mapping}
+        if self.default is not None:
+            spec['default'] = self.default
+        return spec
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.mapping}, default={self.default})'
+
+
+# All discretizers which can be declared in the config by their type
+DISCRETIZER_TYPES = {discretizer.kind: discretizer for discretizer in
+                     [ThresholdDiscretizer, ArgmaxDiscretizer, HysteresisDiscretizer,
+                      MappingDiscretizer]}
+
+
+def discretizer_from_spec(spec: dict):
+    """
+    Creates a discretizer from its declaration in the config.
+
+    Args:
+        spec: a dict with the type of the discretizer and the arguments of its class
+    Returns:
+        The discretizer
+    Raises:
+        ValueError: A ValueError is raised if the declaration is not valid
+    """
+    if not isinstance(spec, dict) or spec.get('type') not in DISCRETIZER_TYPES:
+        raise ValueError(f'Discretizer declarations need a type out of '
+                         f'{list(DISCRETIZER_TYPES)}, got {spec}')
+    arguments = {key: value for key, value in spec.items() if key != 'type'}
+    try:
+        return DISCRETIZER_TYPES[spec['type']](**arguments)
+    except TypeError as error:
+        raise ValueError(f'Invalid declaration of a {spec["type"]} discretizer: {error}') \
+            from error
+
+
+def compile_discretizers(specs: dict) -> dict:
+    """
+    Compiles the discretizers declared in a config. Discretizers which are already compiled
+    are kept.
+
+    Args:
+        specs: a dict of contexts and their discretizer declarations
+    Returns:
+        dict:
+            a dict of contexts and their discretizers
+    """
+    return {context: spec if hasattr(spec, 'to_spec') else discretizer_from_spec(spec)
+            for context, spec in (specs or {}).items()}
+
+
+def _represent_discretizer(dumper: yaml.Dumper, discretizer) -> yaml.Node:
+    """Dumps a discretizer as its declaration"""
+    return dumper.represent_dict(discretizer.to_spec())
+
+
+for _discretizer in DISCRETIZER_TYPES.values():
+    yaml.add_representer(_discretizer, _represent_discretizer)
@@ -0,0 +1,359 @@
+"""
+This module provides an aggregator for context observations published at different rates.
+
+Perception modules usually observe contexts independently and at different rates. Running
+inference for every single observation wastes CPU. An `EvidenceAggregator` keeps the latest
+observation of every context in a fixed slot and runs inference on a schedule:
+
+- fixed rate: inference runs `rate` times per second with the latest observations
+- on change: inference runs after an observation changed, at most once per `min_interval` seconds
+
+```
+aggregator = EvidenceAggregator(bn, min_interval=0.05, callback=print)
+aggregator.start()
+aggregator.update('speech commands', 'pickup')        # from any thread or coroutine
+aggregator.update('human activity', 'working')
+```
+
+`update` is thread-safe and never blocks for inference, so it can be called from many threads and
+from coroutines. The schedule runs in a background thread with `start` or as a coroutine with
+`run`. Observations which are not valid instantiations are discretized by the discretization
+functions of the net when inference runs.
+
+Observations can have a time-to-live (`ttl`) per context. An expired observation counts as
+unobserved, so inference falls back to the apriori values of the context - like passing `None`
+for it. Unobserved contexts are summed out by the precompiled marginals of the NumPy engine,
+so expiry costs no additional inference. Expiry is a change and triggers inference on change.
+Expired observations are reported to `on_expire` and counted in `expirations`.
+"""
+
+# System imports
+import asyncio
+import logging
+import threading
+import time
+
+# 3rd party imports
+
+# local imports
+from .bayes_net import BayesNet
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+class EvidenceAggregator():
+    """Keeps the latest observation of every context and infers on a schedule."""
+
+    def __init__(self, net: BayesNet, rate: float = None, min_interval: float = 0.0,
+                 callback=None, normalized=True, decision_threshold=None, ttl=None,
+                 on_expire=None) -> None:
+        '''
+        Creates the aggregator. All contexts are unobserved in the beginning.
+
+        Args:
+            net: The net used for inference
+            rate: number of inferences per second for a fixed rate schedule.
+                If None, inference runs on change.
+            min_interval: minimum seconds between two inferences on change
+            callback: function which is called with the result of every scheduled inference
+                like it is returned by `BayesNet.infer`
+            normalized: Flag if inferences are normalized to sum up to 1.
+            decision_threshold: a threshold for picking the most likely intention.
+                If not given the decision_threshold of the net is taken.
+            ttl: seconds after which an observation expires. Either one value for all contexts
+                or a dict of contexts and values. Observations never expire if None.
+            on_expire: function which is called with the context and the observation whenever
+                an observation expires
+        Raises:
+            ValueError: A ValueError is raised if rate, min_interval or ttl are not positive
+                or if ttl contains a context which does not exist
+        '''
+        if rate is not None and rate <= 0:
+            raise ValueError(f'rate must be positive, got {rate}')
+        if min_interval < 0:
+            raise ValueError(f'min_interval must not be negative, got {min_interval}')
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.net = net
+        self.rate = rate
+        self.min_interval = min_interval
+        self.callback = callback
+        self.normalized = normalized
+        self.decision_threshold = decision_threshold
+        self.contexts = list(net.contexts)
+        self.last_result = None
+        self.on_expire = on_expire
+        self.expirations = dict.fromkeys(self.contexts, 0)
+
+        self._slot_index = {context: slot for slot, context in enumerate(self.contexts)}
+        self._slots = [None] * len(self.contexts)
+        self._stamps = [None] * len(self.contexts)
+        self._ttls = self._create_ttls(ttl)
+        self._version = 0
+        self._inferred_version = 0
+        self._last_inference = None
+        self._changed = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self._loop = None
+        self._async_changed = None
+
+    def _create_ttls(self, ttl) -> list:
+        """
+        Creates the time-to-live of every slot.
+
+        Args:
+            ttl: see `__init__`
+        Returns:
+            list:
+                The time-to-live of every context in seconds or None
+        """
+        if ttl is None:
+            return [None] * len(self.contexts)
+        if not isinstance(ttl, dict):
+            ttl = dict.fromkeys(self.contexts, ttl)
+        ttls = [None] * len(self.contexts)
+        for context, seconds in ttl.items():
+            if context not in self._slot_index:
+                raise ValueError(f'Cannot set ttl of {context}. Context does not exist!')
+            if seconds is not None and seconds <= 0:
+                raise ValueError(f'ttl must be positive, got {seconds} for {context}')
+            ttls[self._slot_index[context]] = seconds
+        return ttls
+
+    @property
+    def version(self) -> int:
+        """Number of observations so far"""
+        return self._version
+
+    @property
+    def evidence(self) -> dict:
+        """The latest observation of every observed context which is not expired"""
+        self.expire()
+        with self._changed:
+            slots = list(self._slots)
+        return {context: value for context, value in zip(self.contexts, slots)
+                if value is not None}
+
+    def update(self, context: str, instantiation):
+        """
+        Stores the latest observation of a context.
+
+        Args:
+            context: One of the contexts of the net
+            instantiation: the observed instantiation or a value for the discretization function
+                of the context. None marks the context as unobserved.
+        Raises:
+            ValueError: A ValueError is raised if the context does not exist
+        """
+        self.update_many({context: instantiation})
+
+    def update_many(self, observations: dict):
+        """
+        Stores the latest observations of several contexts at once.
+
+        Args:
+            observations: a dict of contexts and observations. See `update` for details.
+        Raises:
+            ValueError: A ValueError is raised if a context does not exist
+        """
+        for context in observations:
+            if context not in self._slot_index:
+                raise ValueError(f'Cannot update {context}. Context does not exist!')
+        now = time.monotonic()
+        with self._changed:
+            for context, instantiation in observations.items():
+                slot = self._slot_index[context]
+                self._slots[slot] = instantiation
+                self._stamps[slot] = now
+            self._version += 1
+            self._changed.notify_all()
+        self._notify_async()
+
+    def _notify_async(self):
+        """Wakes up the coroutine schedule"""
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._async_changed.set)
+
+    def clear(self, context: str = None):
+        """
+        Marks a context or all contexts as unobserved.
+
+        Args:
+            context: the context to clear. All contexts if None.
+        """
+        contexts = self.contexts if context is None else [context]
+        self.update_many(dict.fromkeys(contexts))
+
+    def expire(self) -> list:
+        """
+        Marks all expired observations as unobserved.
+
+        This is done by the schedule and before inference but can also be called manually.
+
+        Returns:
+            list:
+                A list of tuples of context and observation for every expired observation
+        """
+        now = time.monotonic()
+        expired = []
+        with self._changed:
+            for slot, ttl in enumerate(self._ttls):
+                if ttl is None or self._slots[slot] is None:
+                    continue
+                if now - self._stamps[slot] >= ttl:
+                    expired.append((self.contexts[slot], self._slots[slot]))
+                    self._slots[slot] = None
+            if expired:
+                self._version += 1
+                self._changed.notify_all()
+        for context, instantiation in expired:
+            self.expirations[context] += 1
+            self.log.debug('Observation %s of %s expired', instantiation, context)
+            if self.on_expire is not None:
+                self.on_expire(context, instantiation)
+        if expired:
+            self._notify_async()
+        return expired
+
+    def _next_expiry(self, now: float) -> float:
+        """Returns the seconds until the next observation expires or None"""
+        expiries = [stamp + ttl - now for ttl, stamp, value
+                    in zip(self._ttls, self._stamps, self._slots)
+                    if ttl is not None and value is not None]
+        return max(0.0, min(expiries)) if expiries else None
+
+    def infer(self) -> tuple:
+        """
+        Infers with the latest observations now.
+
+        Returns:
+            tuple:
+            The result like returned by `BayesNet.infer`
+        Raises:
+            ValueError: A ValueError is raised if an observation can't be used
+        """
+        self.expire()
+        with self._changed:
+            version = self._version
+            slots = list(self._slots)
+        # evidence which fails is not retried before the next change or tick
+        self._inferred_version = version
+        self._last_inference = time.monotonic()
+        evidence = {context: value for context, value in zip(self.contexts, slots)
+                    if value is not None}
+        result = self.net.infer_batch([evidence], normalized=self.normalized,
+                                      decision_threshold=self.decision_threshold)[0]
+        self.last_result = result
+        return result
+
+    def _scheduled_infer(self):
+        """
+        Runs a scheduled inference and reports the result or the error. Errors are logged, so
+        they never end the schedule.
+        """
+        try:
+            result = self.infer()
+        except ValueError as error:
+            self.log.warning('Scheduled inference failed: %s', error)
+            return
+        except Exception:  # pylint: disable=broad-except
+            self.log.exception('Scheduled inference failed')
+            return
+        if self.callback is not None:
+            try:
+                self.callback(result)
+            except Exception:  # pylint: disable=broad-except
+                self.log.exception('The callback of a scheduled inference failed')
+
+    def _wait_time(self) -> tuple:
+        """
+        Returns the seconds until the next scheduled inference or expiry and a flag if inference
+        is due now. None means that the schedule waits for the next change.
+        Expiry never makes inference with a fixed rate due before its period is over.
+        """
+        now = time.monotonic()
+        if self.rate is not None:
+            if self._last_inference is None:
+                return 0.0, True
+            wait_time = max(0.0, self._last_inference + 1 / self.rate - now)
+        elif self._version == self._inferred_version:
+            wait_time = None
+        elif self._last_inference is None:
+            return 0.0, True
+        else:
+            wait_time = max(0.0, self._last_inference + self.min_interval - now)
+        if wait_time == 0.0:
+            return 0.0, True
+        next_expiry = self._next_expiry(now)
+        if wait_time is None or (next_expiry is not None and next_expiry < wait_time):
+            # expiry is checked at the beginning of every iteration of the schedule
+            return next_expiry, False
+        return wait_time, False
+
+    def _schedule(self):
+        """Runs the schedule until stop is called"""
+        while True:
+            self.expire()
+            with self._changed:
+                if self._stopped:
+                    return
+                wait_time, due = self._wait_time()
+                if not due:
+                    # wake up with the next update, expiry, inference or stop
+                    self._changed.wait(wait_time)
+                    continue
+            self._scheduled_infer()
+
+    def start(self):
+        """
+        Starts the schedule in a background thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._schedule, name='EvidenceAggregator', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the schedule of the background thread and waits for it to finish.
+        """
+        with self._changed:
+            self._stopped = True
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def run(self):
+        """
+        Runs the schedule as a coroutine until it is cancelled. Inference runs in the default
+        executor of the event loop so updates from coroutines are not blocked.
+        """
+        loop = asyncio.get_running_loop()
+        self._async_changed = asyncio.Event()
+        self._loop = loop
+        try:
+            while True:
+                self._async_changed.clear()
+                self.expire()
+                wait_time, due = self._wait_time()
+                if due:
+                    await loop.run_in_executor(None, self._scheduled_infer)
+                    continue
+                try:
+                    await asyncio.wait_for(self._async_changed.wait(), wait_time)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._loop = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,239 @@
+"""
+This module provides hot reloading of a config file for a running application.
+
+A `ConfigWatcher` polls the modification time of a config file. If the file changed, a new
+`BayesNet` is compiled in a background thread and swapped in with a single reference assignment.
+Inference which is running while the new net is compiled keeps using the old net, so there is no
+downtime. Configs which can't be loaded or are invalid are reported and the old net is kept.
+
+```
+watcher = ConfigWatcher('small_example.yml', interval=1.0)
+watcher.start()
+max_intention, threshold, inference = watcher.infer({'speech commands': 'pickup'})
+```
+"""
+
+# System imports
+import hashlib
+import io
+import logging
+import os
+import threading
+
+# 3rd party imports
+
+# local imports
+from .bayes_net import BayesNet, load_config
+from .metrics import MetricsRegistry
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+class ConfigWatcher():
+    """Holds a BayesNet for a config file and swaps in a new net if the file changes."""
+
+    def __init__(self, path: str, interval: float = 1.0, cache_dir: str = None,
+                 on_reload=None, on_error=None, diagnostics: str = 'warn',
+                 discretization_workers: int = 0, metrics: MetricsRegistry = None) -> None:
+        '''
+        Loads the config and compiles the first net. Polling starts with `start`.
+
+        Args:
+            path: path to the config file
+            interval: seconds between two checks of the config file
+            cache_dir: Directory of an on-disk cache for compiled models.
+                See `CoBaIR.model_cache` for details.
+            on_reload: function which is called with the new net after it was swapped in
+            on_error: function which is called with the exception if a changed config
+                could not be loaded or is invalid. Exceptions of the callbacks are logged and
+                polling goes on.
+            diagnostics: the diagnostics mode of all nets, see `BayesNet`
+            discretization_workers: the number of discretization threads of all nets,
+                see `BayesNet`
+            metrics: a registry all nets report into, see `CoBaIR.metrics`
+        Raises:
+            ValueError: A ValueError is raised if the initial config is invalid
+        '''
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self.interval = interval
+        self.cache_dir = cache_dir
+        self.on_reload = on_reload
+        self.on_error = on_error
+        self.diagnostics = diagnostics
+        self.discretization_workers = discretization_workers
+        self.metrics = metrics
+        self.discretization_functions = {}
+        # memo_size and quantization_step of every bound discretization function
+        self._memo_options = {}
+        # Serializes bindings and swaps, so no binding is lost while a new net is compiled
+        self._lock = threading.Lock()
+
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._signature = self._file_signature()
+        content = self._read()
+        self._content_hash = hashlib.sha256(content).hexdigest()
+        net = self._compile(content)
+        if not net.valid:
+            raise ValueError(f'Invalid configuration in {self.path}')
+        self._net = net
+
+    @property
+    def net(self) -> BayesNet:
+        """The currently active net"""
+        return self._net
+
+    def infer(self, evidence, normalized=True, decision_threshold=None, deadline_ms=None,
+              fallback='analytic') -> tuple:
+        """
+        Infers with the currently active net. See `BayesNet.infer` for details.
+        """
+        # Reading the reference once makes the call use one net even if a swap happens meanwhile
+        return self._net.infer(evidence, normalized=normalized,
+                               decision_threshold=decision_threshold, deadline_ms=deadline_ms,
+                               fallback=fallback)
+
+    def bind_discretization_function(self, context, discretization_function, memo_size: int = 0,
+                                     quantization_step: float = None):
+        """
+        Binds a discretization function to a context of the active and all reloaded nets.
+        See `BayesNet.bind_discretization_function` for details.
+        """
+        with self._lock:
+            self._net.bind_discretization_function(
+                context, discretization_function, memo_size, quantization_step)
+            self.discretization_functions[context] = discretization_function
+            self._memo_options[context] = (memo_size, quantization_step)
+
+    def _file_signature(self) -> tuple:
+        """Returns modification time and size of the config file"""
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self) -> bytes:
+        """Returns the content of the config file"""
+        with open(self.path, 'rb') as config_file:
+            return config_file.read()
+
+    def _compile(self, content: bytes) -> BayesNet:
+        """
+        Loads a config and compiles a new net. Discretization functions are bound when
+        the net is swapped in.
+
+        Args:
+            content: the content of the config file. It is read once, so the hash of the
+                content always belongs to the compiled net.
+        Returns:
+            BayesNet:
+                The compiled net
+        """
+        config = load_config(io.StringIO(content.decode('utf-8')), self.metrics)
+        net = BayesNet(config, cache_dir=self.cache_dir,
+                       diagnostics=self.diagnostics,
+                       discretization_workers=self.discretization_workers, metrics=self.metrics)
+        if net.valid:
+            # pylint: disable=pointless-statement
+            net.DAG  # compile everything now instead of during the first inference
+        return net
+
+    def _swap(self, net: BayesNet):
+        """
+        Binds all discretization functions to a new net and makes it the active net.
+
+        Args:
+            net: the new net
+        """
+        with self._lock:
+            for context, function in self.discretization_functions.items():
+                if context in net.contexts:
+                    net.bind_discretization_function(context, function,
+                                                     *self._memo_options[context])
+            net.stage_timer = self._net.stage_timer
+            previous = self._net
+            # a single reference assignment is atomic - running inference keeps the old net
+            self._net = net
+        # the old net stays usable and restarts its threads if it is still used
+        previous.close()
+
+    def check(self) -> bool:
+        """
+        Checks the config file once and swaps in a new net if it changed.
+
+        This is called periodically by the polling thread but can also be called manually.
+
+        Returns:
+            bool:
+                True if a new net was swapped in
+        """
+        try:
+            signature = self._file_signature()
+            if signature == self._signature:
+                return False
+            content = self._read()
+            content_hash = hashlib.sha256(content).hexdigest()
+            if content_hash == self._content_hash:
+                # touched but not changed
+                self._signature = signature
+                return False
+            net = self._compile(content)
+            if not net.valid:
+                raise ValueError(f'Invalid configuration in {self.path}')
+        except Exception as error:  # pylint: disable=broad-except
+            # the signature is kept, so the file is tried again with the next check
+            self.log.warning(
+                'Keeping the active net - could not reload %s: %s', self.path, error)
+            self._callback(self.on_error, error)
+            return False
+        self._swap(net)
+        self._signature = signature
+        self._content_hash = content_hash
+        self.log.info('Reloaded %s', self.path)
+        self._callback(self.on_reload, net)
+        return True
+
+    def _callback(self, callback, argument):
+        """Calls a callback if it is set and logs its exceptions"""
+        if callback is None:
+            return
+        try:
+            callback(argument)
+        except Exception:  # pylint: disable=broad-except
+            self.log.exception('The callback %r failed', callback)
+
+    def _poll(self):
+        """Checks the config file until stop is called"""
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception:  # pylint: disable=broad-except
+                # e.g. binding a discretization function to the new net failed
+                self.log.exception('Checking %s failed', self.path)
+
+    def start(self):
+        """
+        Starts polling the config file in a background thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._poll, name=f'ConfigWatcher({self.path})',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops polling and waits for the background thread to finish.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,217 @@
+"""
+This module provides a pool of worker processes for inference of many evidences.
+
+Inference in Python is bound to the GIL, so one process can not use all cores for large
+offline evaluations. An `InferencePool` places the compiled CPT values of a net in one
+`multiprocessing.shared_memory` block. The workers attach to it without copying and infer
+chunks of evidence with the exact NumPy engine (see `CoBaIR.numpy_engine`).
+
+```
+with InferencePool(bn, processes=8) as pool:
+    results = pool.map(evidences)
+    for max_intention, decision_threshold, inference in pool.imap(evidence_stream):
+        ...
+```
+
+Results are returned in the order of the evidences and are the same as `BayesNet.infer_batch`.
+
+!!! note
+    The pool uses the snapshot of the net at creation. Changes of the net afterwards are not
+    seen by the workers. Discretization functions are passed to the workers, so they must be
+    picklable if the start method of the processes is not `fork`.
+"""
+
+# System imports
+from collections import deque
+import itertools
+import math
+import multiprocessing
+from multiprocessing import shared_memory, util
+import os
+
+# 3rd party imports
+import numpy as np
+
+# local imports
+from .bayes_net import BayesNet, CompiledModel, config_to_default_dict, default_to_regular
+from .numpy_engine import NumpyEngine
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+# The net of a worker process - set by _attach
+_worker_net = None
+# The shared memory of a worker process - must be kept open while the net is used
+_worker_memory = None
+
+
+def _attach(name: str, tables_shape: tuple, prior_sizes: list, config: dict,
+            discretization_functions: dict, diagnostics: str = 'warn'):
+    """
+    Initializes a worker process with a net whose engine uses the shared CPT values.
+
+    Args:
+        name: name of the shared memory block
+        tables_shape: shape of the intention tables of the engine
+        prior_sizes: number of instantiations of every context
+        config: the config of the snapshot
+        discretization_functions: the discretization functions of the net
+        diagnostics: the diagnostics mode of the net
+    """
+    global _worker_net, _worker_memory  # pylint: disable=global-statement
+    _worker_memory = shared_memory.SharedMemory(name=name)
+    values = np.ndarray((int(np.prod(tables_shape)) + sum(prior_sizes),),
+                        dtype=np.float64, buffer=_worker_memory.buf)
+    values.setflags(write=False)
+    tables_size = int(np.prod(tables_shape))
+    tables = values[:tables_size].reshape(tables_shape)
+    offsets = np.cumsum([tables_size] + prior_sizes)
+    priors = [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    net = BayesNet(diagnostics=diagnostics)
+    net.config = config_to_default_dict(config)
+    net.valid = True
+    net.discretization_functions = discretization_functions
+    # pylint: disable=protected-access
+    net._model = CompiledModel(net.config, True, engine=NumpyEngine(tables, priors))
+    # workers which exit normally close the net when the pool is closed
+    util.Finalize(None, net.close, exitpriority=10)
+    _worker_net = net
+
+
+def _infer_chunk(task: tuple) -> list:
+    """
+    Infers a chunk of evidences in a worker process.
+
+    Args:
+        task: a tuple of the evidences and the arguments of `BayesNet.infer_batch`
+    Returns:
+        list:
+            The results of `BayesNet.infer_batch`
+    """
+    evidences, normalized, decision_threshold, return_exceptions = task
+    return _worker_net.infer_batch(evidences, normalized=normalized,
+                                   decision_threshold=decision_threshold,
+                                   return_exceptions=return_exceptions)
+
+
+def _chunks(evidences, chunksize: int):
+    """Splits an iterable of evidences into lists of chunksize evidences"""
+    iterator = iter(evidences)
+    while True:
+        chunk = list(itertools.islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+class InferencePool():
+    """A pool of worker processes sharing the compiled CPT values of one net."""
+
+    def __init__(self, net: BayesNet, processes: int = None, start_method: str = None) -> None:
+        '''
+        Copies the CPT values of the net into shared memory and starts the workers.
+
+        Args:
+            net: The net used for inference. Its config must be valid.
+            processes: number of worker processes. The number of CPUs if None.
+            start_method: start method of the worker processes, e.g. "fork" or "spawn".
+                The default of multiprocessing if None.
+        Raises:
+            ValueError: A ValueError is raised if the config of the net is invalid
+        '''
+        model = net.model
+        if not model.valid:
+            raise ValueError('Invalid configuration')
+        self.processes = processes or os.cpu_count() or 1
+        engine = model.engine
+        prior_sizes = [prior.size for prior in engine.priors]
+        values = np.concatenate([engine.tables.reshape(-1)] + engine.priors)
+
+        self._memory = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=np.float64, buffer=self._memory.buf)[:] = values
+        context = multiprocessing.get_context(start_method)
+        try:
+            self._pool = context.Pool(self.processes, initializer=_attach, initargs=(
+                self._memory.name, engine.tables.shape, prior_sizes,
+                default_to_regular(model.config), dict(net.discretization_functions),
+                net.diagnostics.mode))
+        except Exception:
+            self._release_memory()
+            raise
+
+    @property
+    def shared_memory_name(self) -> str:
+        """Name of the shared memory block with the CPT values"""
+        return self._memory.name
+
+    def map(self, evidences: list, normalized=True, decision_threshold=None,
+            chunksize: int = None, return_exceptions: bool = False) -> list:
+        '''
+        Infers all evidences in the workers.
+
+        Args:
+            evidences: A list of evidences. See `BayesNet.infer` for the format of an evidence.
+            normalized: Flag if the returned inferences are normalized to sum up to 1.
+            decision_threshold: a threshold for picking the most likely intention.
+                If not given the decision_threshold of the net is taken.
+            chunksize: number of evidences sent to a worker at once.
+                Evidences are spread evenly over the workers if None.
+            return_exceptions: see `BayesNet.infer_batch`
+        Returns:
+            list:
+            One tuple per evidence like it is returned by `BayesNet.infer`, in the same order
+        '''
+        evidences = list(evidences)
+        if chunksize is None:
+            chunksize = max(1, math.ceil(len(evidences) / (4 * self.processes)))
+        tasks = [(chunk, normalized, decision_threshold, return_exceptions)
+                 for chunk in _chunks(evidences, chunksize)]
+        return list(itertools.chain.from_iterable(self._pool.map(_infer_chunk, tasks)))
+
+    def imap(self, evidences, normalized=True, decision_threshold=None, chunksize: int = 64,
+             return_exceptions: bool = False):
+        '''
+        Lazily infers an iterable of evidences in the workers.
+
+        The evidences are consumed chunk by chunk and at most two chunks per worker are in
+        flight, so evidence streams which do not fit into memory can be inferred. See `map` for
+        the arguments.
+
+        Yields:
+            tuple:
+            One tuple per evidence like it is returned by `BayesNet.infer`, in the same order
+        '''
+        # multiprocessing.Pool.imap reads the whole iterable right away - submit chunks as
+        # results are taken instead
+        pending = deque()
+        for chunk in _chunks(evidences, chunksize):
+            if len(pending) >= 2 * self.processes:
+                yield from pending.popleft().get()
+            pending.append(self._pool.apply_async(
+                _infer_chunk, ((chunk, normalized, decision_threshold, return_exceptions),)))
+        while pending:
+            yield from pending.popleft().get()
+
+    def close(self):
+        '''
+        Stops the workers and releases the shared memory.
+        '''
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self._release_memory()
+
+    def _release_memory(self):
+        """Closes and unlinks the shared memory block"""
+        if self._memory is not None:
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
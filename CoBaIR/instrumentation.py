@@ -0,0 +1,172 @@
+"""
+This module records how long the stages of `BayesNet.infer` take.
+
+Timing is opt-in. A net without a `StageTimer` only checks for it once per stage:
+
+```
+net.stage_timer = StageTimer()
+net.infer(evidence)
+net.stage_timer.snapshot()['inference']['p99']
+```
+
+or only for a block:
+
+```
+with net.timing() as timer:
+    for evidence in evidences:
+        net.infer(evidence)
+print(timer.snapshot())
+```
+
+The stages of `infer` are
+
+- "discretization": running the discretization functions of the evidence
+- "validation": validating the evidence and translating it into card numbers
+- "inference": variable elimination with `bn.inference.fit` or the NumPy engine
+- "extraction": reading the probabilities from the inference results
+- "normalization": `normalize_inference` and picking the most likely intention
+- "total": the whole call
+
+Durations are measured with `time.perf_counter` - a monotonic clock - and counted in histograms
+of fixed size, so memory does not grow with the number of calls.
+"""
+
+# System imports
+import bisect
+import threading
+
+# 3rd party imports
+
+# local imports
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+DISCRETIZATION = 'discretization'
+VALIDATION = 'validation'
+INFERENCE = 'inference'
+EXTRACTION = 'extraction'
+NORMALIZATION = 'normalization'
+TOTAL = 'total'
+STAGES = (DISCRETIZATION, VALIDATION, INFERENCE, EXTRACTION, NORMALIZATION, TOTAL)
+
+# Upper bounds of the buckets in seconds - powers of 2 from about 1 µs to about 16 s
+DEFAULT_BOUNDS = tuple(2.0 ** exponent for exponent in range(-20, 5))
+
+
+class Histogram():
+    """A histogram of durations with fixed buckets."""
+
+    def __init__(self, bounds: tuple = DEFAULT_BOUNDS) -> None:
+        '''
+        Creates an empty histogram.
+
+        Args:
+            bounds: ascending upper bounds of the buckets in seconds. Larger durations are
+                counted in an additional overflow bucket.
+        '''
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        """
+        Counts a duration.
+
+        Args:
+            seconds: the duration
+        """
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, quantile: float) -> float:
+        """
+        Estimates a quantile as the upper bound of the bucket it falls into.
+
+        Args:
+            quantile: a number between 0 and 1
+        Returns:
+            float:
+                the estimated duration. The maximum for the overflow bucket and 0 if empty.
+        """
+        if not self.count:
+            return 0.0
+        rank = quantile * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                return min(self.bounds[bucket], self.max) if bucket < len(self.bounds) \
+                    else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        """
+        Returns the statistics of the histogram.
+
+        Returns:
+            dict:
+                count, sum, min, max, mean, estimated p50, p90 and p99 and the buckets as list of
+                upper bounds and counts. The overflow bucket has the bound inf.
+        """
+        return {'count': self.count, 'sum': self.sum,
+                'min': self.min if self.count else 0.0, 'max': self.max,
+                'mean': self.sum / self.count if self.count else 0.0,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+                'buckets': list(zip(self.bounds + (float('inf'),), self.counts))}
+
+
+class StageTimer():
+    """Thread safe histograms of the durations of named stages."""
+
+    def __init__(self, callback=None, bounds: tuple = DEFAULT_BOUNDS) -> None:
+        '''
+        Creates the timer.
+
+        Args:
+            callback: function which is called with the stage and the duration in seconds of
+                every recorded stage, e.g. to forward them to a tracing system
+            bounds: the bucket bounds of the histograms, see `Histogram`
+        '''
+        self.callback = callback
+        self.bounds = tuple(bounds)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        """
+        Records the duration of a stage.
+
+        Args:
+            stage: the name of the stage, e.g. INFERENCE
+            seconds: the duration
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.bounds)
+            histogram.observe(seconds)
+        if self.callback is not None:
+            self.callback(stage, seconds)
+
+    def snapshot(self) -> dict:
+        """
+        Returns the statistics of all stages.
+
+        Returns:
+            dict:
+                a dict of stages and their statistics, see `Histogram.snapshot`
+        """
+        with self._lock:
+            return {stage: histogram.snapshot() for stage, histogram in self._histograms.items()}
+
+    def reset(self):
+        """Forgets all recorded durations"""
+        with self._lock:
+            self._histograms = {}
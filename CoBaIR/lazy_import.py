@@ -0,0 +1,49 @@
+"""
+This module provides a placeholder for heavy modules that should only be imported on first use.
+
+bnlearn and pgmpy pull in pandas, networkx, matplotlib and more. Importing them lazily keeps
+`import CoBaIR` fast for tools that only load, validate or save configs.
+"""
+
+# System imports
+import importlib
+
+# 3rd party imports
+
+# local imports
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+class LazyModule():
+    """A placeholder for a module which is imported on first attribute access."""
+
+    def __init__(self, name: str) -> None:
+        '''
+        Creates the placeholder without importing the module.
+
+        Args:
+            name: absolute name of the module e.g. 'pgmpy.factors.discrete'
+        '''
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute: str):
+        """
+        Imports the module if necessary and returns the requested attribute of it.
+
+        Args:
+            attribute: name of an attribute of the module
+        Returns:
+            The attribute of the imported module
+        """
+        # __getattr__ is only called for attributes not found on the placeholder itself
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    @property
+    def imported(self) -> bool:
+        """True if the module was imported already"""
+        return self._module is not None
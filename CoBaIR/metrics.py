@@ -0,0 +1,398 @@
+"""
+This module collects statistics of nets in a metrics registry and exports them in the
+[Prometheus text format](https://prometheus.io/docs/instrumenting/exposition_formats/).
+
+Metrics are opt-in. A net reports into a registry it is given:
+
+```
+registry = MetricsRegistry()
+config = load_config('small_example.yml', metrics=registry)
+net = BayesNet(config, metrics=registry)
+net.infer(evidence)
+print(registry.render())
+```
+
+`infer`, `infer_batch`, the methods which edit the config, the compilation of models and
+`load_config` record their calls, errors and durations when they run. Everything the nets count
+anyway - diagnostics, deadline misses, skipped inferences, discretization timings and memo hits
+and the stage durations of a `StageTimer` - is read from the registered nets when the metrics
+are rendered, so it costs nothing while inferring. Statistics of several nets in one registry
+are summed up. Counters never go down: the values a net had when the metrics were rendered last
+are kept when the net is deleted, e.g. after a hot reload, or when it starts counting over, e.g.
+for a rebound discretization memo.
+
+The metrics are exported either to a file for the textfile collector of the node exporter or by
+a small HTTP server on localhost:
+
+```
+registry.write('/var/lib/node_exporter/cobair.prom')
+server = registry.serve(port=9464)  # GET http://127.0.0.1:9464/metrics
+...
+server.shutdown()
+```
+"""
+
+# System imports
+from collections import defaultdict, deque
+import http.server
+import math
+import os
+import tempfile
+import threading
+import weakref
+
+# 3rd party imports
+
+# local imports
+from .instrumentation import DEFAULT_BOUNDS, Histogram
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# Metrics which are recorded while the nets run
+INFER_SECONDS = 'cobair_infer_seconds'
+INFER_ERRORS = 'cobair_infer_errors_total'
+INFER_BATCH_SECONDS = 'cobair_infer_batch_seconds'
+INFER_BATCH_ERRORS = 'cobair_infer_batch_errors_total'
+CONFIG_EDITS = 'cobair_config_edits_total'
+COMPILE_SECONDS = 'cobair_compile_seconds'
+COMPILATIONS = 'cobair_compilations_total'
+CONFIG_LOAD_SECONDS = 'cobair_config_load_seconds'
+
+# Metrics which are read from the registered nets
+NETS = 'cobair_nets'
+DEADLINE_MISSES = 'cobair_deadline_misses_total'
+UNCHANGED_INFERENCES = 'cobair_unchanged_inferences_total'
+EVIDENCE_DIAGNOSTICS = 'cobair_evidence_diagnostics_total'
+DISCRETIZATION_CALLS = 'cobair_discretization_calls_total'
+DISCRETIZATION_SECONDS = 'cobair_discretization_seconds_total'
+MEMO_HITS = 'cobair_discretization_memo_hits_total'
+MEMO_MISSES = 'cobair_discretization_memo_misses_total'
+STAGE_SECONDS = 'cobair_infer_stage_seconds'
+
+METRICS = {
+    INFER_SECONDS: (HISTOGRAM, 'Duration of BayesNet.infer calls in seconds'),
+    INFER_ERRORS: (COUNTER, 'BayesNet.infer calls which raised a ValueError'),
+    INFER_BATCH_SECONDS: (HISTOGRAM, 'Duration of BayesNet.infer_batch calls in seconds'),
+    INFER_BATCH_ERRORS: (COUNTER, 'BayesNet.infer_batch calls which raised a ValueError'),
+    CONFIG_EDITS: (COUNTER, 'Successful calls of the methods which edit the config - binding '
+                            'discretization functions is not counted'),
+    COMPILE_SECONDS: (HISTOGRAM, 'Duration of the compilation of configs in seconds'),
+    COMPILATIONS: (COUNTER, 'Compiled models by source - interned, cache or compiled'),
+    CONFIG_LOAD_SECONDS: (HISTOGRAM, 'Duration of load_config calls in seconds'),
+    NETS: (GAUGE, 'Nets which report into the registry'),
+    DEADLINE_MISSES: (COUNTER, 'Inferences which did not finish within their deadline'),
+    UNCHANGED_INFERENCES: (COUNTER, 'Exact inferences skipped because the evidence did not '
+                                    'change'),
+    EVIDENCE_DIAGNOSTICS: (COUNTER, 'Diagnostics of evidence counted in quiet and strict mode'),
+    DISCRETIZATION_CALLS: (COUNTER, 'Calls of discretization functions'),
+    DISCRETIZATION_SECONDS: (COUNTER, 'Time spent in discretization functions in seconds'),
+    MEMO_HITS: (COUNTER, 'Raw values found in the discretization memo'),
+    MEMO_MISSES: (COUNTER, 'Raw values not found in the discretization memo'),
+    STAGE_SECONDS: (HISTOGRAM, 'Duration of the stages of BayesNet.infer in seconds - only '
+                               'recorded while a net has a stage timer'),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value: float) -> str:
+    """Formats a sample value like Prometheus expects it"""
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    if float(value).is_integer() and abs(value) < 2 ** 53:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: tuple) -> str:
+    """Formats sorted label pairs as {name="value",...}"""
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _label_key(labels: dict) -> tuple:
+    """Turns a dict of labels into a hashable key"""
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+class MetricsRegistry():
+    """Thread safe counters, gauges and histograms of nets with Prometheus text export."""
+
+    def __init__(self, bounds: tuple = DEFAULT_BOUNDS) -> None:
+        '''
+        Creates an empty registry which knows all metrics in `METRICS`.
+
+        Args:
+            bounds: the bucket bounds of histograms in seconds, see
+                `CoBaIR.instrumentation.Histogram`
+        '''
+        self.bounds = tuple(bounds)
+        self._descriptions = dict(METRICS)
+        # a dict of metrics and a dict of label keys and their values or histograms
+        self._values = defaultdict(dict)
+        self._nets = weakref.WeakSet()
+        # counters of the nets by id at the last rendering and of deleted nets
+        self._seen = {}
+        self._retained = defaultdict(float)
+        # ids of deleted nets - appended by finalizers without locking, which may run anywhere
+        self._departed = deque()
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str):
+        """
+        Adds a metric, e.g. one of the application which uses the nets.
+
+        Args:
+            name: the name of the metric. Counters should end with _total.
+            kind: one of COUNTER, GAUGE and HISTOGRAM
+            help_text: the description of the metric
+        Raises:
+            ValueError: A ValueError is raised if the kind is unknown
+        """
+        if kind not in (COUNTER, GAUGE, HISTOGRAM):
+            raise ValueError(f'Unknown kind of metric "{kind}"')
+        with self._lock:
+            self._descriptions[name] = (kind, help_text)
+
+    def _check(self, name: str, kind: str):
+        """Raises a ValueError if name is no metric of kind"""
+        description = self._descriptions.get(name)
+        if description is None or description[0] != kind:
+            raise ValueError(f'{name} is no {kind} - describe it first')
+
+    def inc(self, name: str, amount: float = 1.0, labels: dict = None):
+        """
+        Increases a counter.
+
+        Args:
+            name: the name of the counter
+            amount: the increment
+            labels: a dict of label names and values
+        Raises:
+            ValueError: A ValueError is raised if name is no counter
+        """
+        self._check(name, COUNTER)
+        key = _label_key(labels)
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0) + amount
+
+    def set(self, name: str, value: float, labels: dict = None):
+        """
+        Sets a gauge.
+
+        Args:
+            name: the name of the gauge
+            value: the new value
+            labels: a dict of label names and values
+        Raises:
+            ValueError: A ValueError is raised if name is no gauge
+        """
+        self._check(name, GAUGE)
+        with self._lock:
+            self._values[name][_label_key(labels)] = value
+
+    def observe(self, name: str, seconds: float, labels: dict = None):
+        """
+        Counts a duration in a histogram.
+
+        Args:
+            name: the name of the histogram
+            seconds: the duration
+            labels: a dict of label names and values
+        Raises:
+            ValueError: A ValueError is raised if name is no histogram
+        """
+        self._check(name, HISTOGRAM)
+        key = _label_key(labels)
+        with self._lock:
+            values = self._values[name]
+            histogram = values.get(key)
+            if histogram is None:
+                histogram = values[key] = Histogram(self.bounds)
+            histogram.observe(seconds)
+
+    def register(self, net):
+        """
+        Adds a net whose statistics are read when the metrics are rendered.
+        The registry only keeps a weak reference, so nets are dropped when they are deleted.
+        Their counters keep the values of the last rendering.
+
+        Args:
+            net: a `BayesNet`
+        """
+        with self._lock:
+            if net in self._nets:
+                return
+            self._nets.add(net)
+        weakref.finalize(net, self._departed.append, id(net))
+
+    @staticmethod
+    def _read_counters(net) -> dict:
+        """Returns the counters of a net as a dict of (metric, label key) and value"""
+        counters = defaultdict(float)
+        counters[(DEADLINE_MISSES, ())] = net.deadline_misses
+        counters[(UNCHANGED_INFERENCES, ())] = net.unchanged_inferences
+        for (kind, context), count in net.diagnostics.counts().items():
+            counters[(EVIDENCE_DIAGNOSTICS, (('context', context), ('kind', kind)))] += count
+        for context, timing in net.discretization_timings.items():
+            counters[(DISCRETIZATION_CALLS, (('context', context),))] += timing.calls
+            counters[(DISCRETIZATION_SECONDS, (('context', context),))] += timing.total
+        for context, memo in net.discretization_memos.items():
+            counters[(MEMO_HITS, (('context', context),))] += memo.hits
+            counters[(MEMO_MISSES, (('context', context),))] += memo.misses
+        return counters
+
+    def _fold_counters(self, counters: dict) -> dict:
+        """
+        Remembers the counters of the living nets and keeps the last counters of deleted nets
+        and of counters which started over.
+
+        Args:
+            counters: a dict of net ids and the counters of the net
+        Returns:
+            dict:
+                the retained counters as a dict of (metric, label key) and value
+        """
+        with self._lock:
+            # the living nets are referenced by the caller, so departed ids are of dead nets
+            while self._departed:
+                for sample, value in self._seen.pop(self._departed.popleft(), {}).items():
+                    self._retained[sample] += value
+            for net_id, net_counters in counters.items():
+                for sample, value in self._seen.get(net_id, {}).items():
+                    if net_counters.get(sample, 0) < value:
+                        self._retained[sample] += value
+                self._seen[net_id] = dict(net_counters)
+            return dict(self._retained)
+
+    def _collect_nets(self) -> dict:
+        """
+        Reads the statistics of all registered nets.
+
+        Returns:
+            dict:
+                a dict of metrics and a dict of label keys and their summed values. Histograms
+                are (count, sum, dict of bucket bounds and counts).
+        """
+        collected = defaultdict(lambda: defaultdict(float))
+        stages = {}
+        with self._lock:
+            nets = list(self._nets)
+        collected[NETS][()] = len(nets)
+        counters = {id(net): self._read_counters(net) for net in nets}
+        for (name, key), value in self._fold_counters(counters).items():
+            collected[name][key] += value
+        for net_counters in counters.values():
+            for (name, key), value in net_counters.items():
+                collected[name][key] += value
+        for net in nets:
+            if net.stage_timer is None:
+                continue
+            for stage, snapshot in net.stage_timer.snapshot().items():
+                count, total, buckets = stages.get(stage, (0, 0.0, defaultdict(int)))
+                for bound, bucket_count in snapshot['buckets']:
+                    buckets[bound] += bucket_count
+                stages[stage] = (count + snapshot['count'], total + snapshot['sum'], buckets)
+        collected[STAGE_SECONDS] = {(('stage', stage),): value for stage, value in stages.items()}
+        return collected
+
+    def render(self) -> str:
+        """
+        Renders all metrics in the Prometheus text format.
+
+        Returns:
+            str:
+                the exposition of all metrics with at least one sample
+        """
+        collected = self._collect_nets()
+        with self._lock:
+            descriptions = dict(self._descriptions)
+            recorded = {name: {key: (value.count, value.sum,
+                                     dict(zip(value.bounds + (float('inf'),), value.counts)))
+                                if isinstance(value, Histogram) else value
+                                for key, value in values.items()}
+                        for name, values in self._values.items()}
+        lines = []
+        for name, (kind, help_text) in descriptions.items():
+            samples = dict(recorded.get(name, {}))
+            samples.update(collected.get(name, {}))
+            if not samples:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for key in sorted(samples):
+                if kind != HISTOGRAM:
+                    lines.append(f'{name}{_format_labels(key)} {_format_value(samples[key])}')
+                    continue
+                count, total, buckets = samples[key]
+                cumulative = 0
+                for bound in sorted(buckets):
+                    cumulative += buckets[bound]
+                    labels = _format_labels(key + (('le', _format_value(bound)),))
+                    lines.append(f'{name}_bucket{labels} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(key)} {_format_value(total)}')
+                lines.append(f'{name}_count{_format_labels(key)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        """
+        Writes the metrics to a file. The file is replaced atomically, so a collector never
+        reads a partially written file.
+
+        Args:
+            path: path of the file, e.g. with the extension .prom for the node exporter
+        """
+        text = self.render()
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False,
+                                         encoding='utf-8') as tmp_file:
+            tmp_file.write(text)
+        os.replace(tmp_file.name, path)
+
+    def serve(self, port: int = 0, host: str = '127.0.0.1') -> http.server.ThreadingHTTPServer:
+        """
+        Serves the metrics at /metrics on a background thread.
+
+        Args:
+            port: port to bind. 0 picks a free port.
+            host: host to bind
+        Returns:
+            ThreadingHTTPServer:
+                the running server. Its address is in `server_address`, `shutdown` stops it.
+        """
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            """Answers GET /metrics with the rendered metrics"""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Sends the metrics or 404 for other paths"""
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                """Scrapes are not logged"""
+
+        server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='CoBaIR-metrics',
+                         daemon=True).start()
+        return server
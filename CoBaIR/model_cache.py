@@ -0,0 +1,174 @@
+"""
+This module provides a content-addressed on-disk cache for compiled bayes nets.
+
+Compiled models are stored as pickle files named after a hash of the normalized config.
+The cache is bounded by a maximum number of entries; the least recently used entries are
+evicted first. Entries are written to a temporary file and atomically moved into place,
+so several processes can share one cache directory.
+
+!!! note
+    Cache entries are pickles. Only point `cache_dir` to directories you trust.
+"""
+
+# System imports
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+# 3rd party imports
+
+# local imports
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+# Bump this whenever the layout of a cached model changes to invalidate old entries
+CACHE_FORMAT_VERSION = 1
+CACHE_SUFFIX = '.pkl'
+
+
+def config_hash(config: dict) -> str:
+    """
+    Creates a hash for the parts of a config that influence the compiled model.
+
+    The decision threshold is not part of the compiled model and is therefore not hashed.
+    The order of contexts and instantiations is part of the hash because it defines the
+    card numbers of the compiled model.
+
+    Args:
+        config: A (regular or default) dict with a config following the config format.
+    Returns:
+        str:
+            A hex digest identifying the compiled model of the config
+    """
+    normalized = {
+        'contexts': {context: dict(instantiations)
+                     for context, instantiations in config['contexts'].items()},
+        'intentions': {intention: {context: dict(influences)
+                                   for context, influences in context_influence.items()
+                                   if influences}
+                       for intention, context_influence in config['intentions'].items()},
+    }
+    digest = hashlib.sha256(
+        f'{CACHE_FORMAT_VERSION}:{normalized!r}'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ModelCache():
+    """A bounded LRU cache of compiled models in a directory."""
+
+    def __init__(self, cache_dir: str, max_entries: int = 64) -> None:
+        '''
+        Creates the cache directory if it does not exist yet.
+
+        Args:
+            cache_dir: directory the compiled models are stored in
+            max_entries: maximum number of compiled models kept in the cache
+        Raises:
+            ValueError: A ValueError is raised if max_entries is smaller than 1
+        '''
+        if max_entries < 1:
+            raise ValueError(
+                f'max_entries must be at least 1. Given value is {max_entries}')
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        """Returns the path of the cache entry for the given key."""
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def __contains__(self, key: str) -> bool:
+        """Checks if there is an entry for the key without loading it."""
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str):
+        """
+        Loads a compiled model from the cache.
+
+        Unreadable entries (e.g. written by an incompatible library version) are treated
+        as a cache miss.
+
+        Args:
+            key: the hash of the config as returned by `config_hash`
+        Returns:
+            The compiled model or None if there is no usable entry for the key
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cache_file:
+                model = pickle.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except Exception as error:  # pylint: disable=broad-except
+            self.log.warning(
+                'Ignoring unreadable cache entry %s: %s', path, error)
+            return None
+        try:
+            # touch the entry so it is the most recently used one
+            os.utime(path)
+        except OSError:
+            # The entry was evicted by another process in the meantime - the model is still fine
+            pass
+        return model
+
+    def put(self, key: str, model) -> None:
+        """
+        Stores a compiled model in the cache and evicts the least recently used entries.
+
+        The model is written to a temporary file first and then atomically renamed,
+        so concurrent readers never see partially written entries.
+
+        Args:
+            key: the hash of the config as returned by `config_hash`
+            model: a picklable compiled model
+        """
+        file_descriptor, tmp_path = tempfile.mkstemp(
+            dir=self.cache_dir, prefix=f'.{key}.', suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as tmp_file:
+                pickle.dump(model, tmp_file,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._evict()
+
+    def _evict(self) -> None:
+        """
+        Removes the least recently used entries until at most max_entries are left.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                # Already evicted by another process
+                continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        """
+        Removes all compiled models from the cache.
+        """
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(CACHE_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,308 @@
+"""
+This module provides a registry for many scenario configs which are compiled in parallel.
+
+Configs are registered by name (e.g. all yml files of a directory), parsed and compiled
+concurrently with `preload` or on demand with `get`. Identical configs are only compiled once
+and share one `BayesNet`. The number of compiled nets held in memory can be bounded; the least
+recently used nets are evicted first and recompiled on the next request.
+
+!!! note
+    Nets of identical configs are the same object. Mutating a net handed out by the
+    registry (e.g. with `change_influence_value`) affects all names sharing it.
+"""
+
+# System imports
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import glob
+import itertools
+import os
+import threading
+
+# 3rd party imports
+
+# local imports
+from .bayes_net import BayesNet, config_to_default_dict, default_to_regular, load_config
+from .model_cache import config_hash
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+EXECUTORS = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+
+
+def _parse_config(path: str) -> dict:
+    """
+    Loads a config in a form that can be sent between processes.
+
+    Args:
+        path: path to the file the config is saved in
+    Returns:
+        dict:
+            a regular dict containing the config
+    """
+    return default_to_regular(load_config(path))
+
+
+def _model_key(config: dict) -> tuple:
+    """
+    Creates the key under which identical configs are deduplicated.
+
+    Args:
+        config: A dict with a config following the config format.
+    Returns:
+        tuple:
+            The hash of the compiled model, the decision threshold and the declared
+            discretizers. Nets with different discretizers can't be shared even if their
+            compiled models are the same.
+    """
+    config = config_to_default_dict(config)
+    return (config_hash(config), config['decision_threshold'],
+            frozenset(config.get('discretizers', {}).items()))
+
+
+def _build(config: dict, cache_dir: str = None) -> BayesNet:
+    """
+    Creates a BayesNet and makes sure it is completely compiled.
+
+    Args:
+        config: A dict with a config following the config format.
+        cache_dir: Directory of an on-disk cache for compiled models
+    Returns:
+        BayesNet:
+            A net ready for inference if the config is valid
+    """
+    net = BayesNet(config_to_default_dict(config), cache_dir=cache_dir)
+    if net.valid:
+        # pylint: disable=pointless-statement
+        net.DAG  # creating the DAG compiles everything needed for inference
+    return net
+
+
+def _compile_into_cache(config: dict, cache_dir: str) -> None:
+    """
+    Compiles a config into the cache. This is used in worker processes.
+
+    Args:
+        config: A dict with a config following the config format.
+        cache_dir: Directory of an on-disk cache for compiled models
+    """
+    _build(config, cache_dir)
+
+
+class ModelRegistry():
+    """A registry of named scenario configs which hands out compiled nets."""
+
+    def __init__(self, directory: str = None, max_models: int = None, max_workers: int = None,
+                 executor: str = 'thread', cache_dir: str = None) -> None:
+        '''
+        Creates the registry and registers all configs in directory.
+
+        Args:
+            directory: A directory with config files. Every config is registered with the name
+                of its file without extension.
+            max_models: Maximum number of distinct compiled nets held in memory.
+                If None, nets are never evicted.
+            max_workers: Maximum number of threads or processes used in `preload`
+            executor: 'thread' or 'process'. Compiling configs is CPU bound, so 'process'
+                scales better with many configs. Compiled models are handed from the worker
+                processes to this process through the on-disk cache in `cache_dir`.
+            cache_dir: Directory of an on-disk cache for compiled models.
+                See `CoBaIR.model_cache` for details.
+        Raises:
+            ValueError: A ValueError is raised for an unknown executor, if executor is 'process'
+                without a cache_dir or if max_models is smaller than 1
+        '''
+        if executor not in EXECUTORS:
+            raise ValueError(
+                f'executor must be one of {list(EXECUTORS)}. Given value is {executor}')
+        if executor == 'process' and cache_dir is None:
+            raise ValueError(
+                'A cache_dir is needed to hand compiled models from worker processes')
+        if max_models is not None and max_models < 1:
+            raise ValueError(
+                f'max_models must be at least 1. Given value is {max_models}')
+        self.max_models = max_models
+        self.max_workers = max_workers
+        self.executor = executor
+        self.cache_dir = cache_dir
+
+        self._lock = threading.Lock()
+        # name -> path of the config file
+        self._paths = {}
+        # name -> key of the config, known after it was parsed once
+        self._keys = {}
+        # key -> compiled BayesNet in least recently used order
+        self._nets = OrderedDict()
+
+        if directory is not None:
+            self.add_directory(directory)
+
+    def register(self, name: str, path: str):
+        """
+        Registers a config file under a name. The config is not loaded yet.
+
+        Args:
+            name: name under which the net is handed out
+            path: path to the file the config is saved in
+        Raises:
+            ValueError: A ValueError is raised if the name is registered already
+        """
+        with self._lock:
+            if name in self._paths:
+                raise ValueError(f'"{name}" is registered already')
+            self._paths[name] = path
+
+    def add_directory(self, directory: str, patterns: tuple = ('*.yml', '*.yaml')) -> list:
+        """
+        Registers all config files in a directory under the name of the file without extension.
+
+        Args:
+            directory: A directory with config files
+            patterns: glob patterns of the config files
+        Returns:
+            list:
+                The registered names
+        """
+        paths = sorted(itertools.chain.from_iterable(
+            glob.glob(os.path.join(directory, pattern)) for pattern in patterns))
+        names = []
+        for path in paths:
+            name = os.path.splitext(os.path.basename(path))[0]
+            self.register(name, path)
+            names.append(name)
+        return names
+
+    @property
+    def names(self) -> list:
+        """All registered names"""
+        with self._lock:
+            return list(self._paths)
+
+    @property
+    def loaded(self) -> list:
+        """Registered names whose nets are currently held in memory"""
+        with self._lock:
+            return [name for name, key in self._keys.items() if key in self._nets]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._paths
+
+    def __getitem__(self, name: str) -> BayesNet:
+        return self.get(name)
+
+    def _path(self, name: str) -> str:
+        """
+        Returns the path of the config registered under name.
+
+        Raises:
+            KeyError: A KeyError is raised if the name is not registered
+        """
+        try:
+            return self._paths[name]
+        except KeyError:
+            raise KeyError(f'"{name}" is not registered') from None
+
+    def _cached_net(self, name: str) -> BayesNet:
+        """
+        Returns the net of name if it is in memory and marks it as most recently used.
+        Must be called with the lock held.
+        """
+        key = self._keys.get(name)
+        if key not in self._nets:
+            return None
+        self._nets.move_to_end(key)
+        return self._nets[key]
+
+    def _insert(self, key: tuple, net: BayesNet) -> BayesNet:
+        """
+        Inserts a compiled net and evicts the least recently used nets if necessary.
+        Must be called with the lock held.
+
+        Returns:
+            BayesNet:
+                The net held for key - this is an existing net if another thread was faster
+        """
+        net = self._nets.setdefault(key, net)
+        self._nets.move_to_end(key)
+        while self.max_models is not None and len(self._nets) > self.max_models:
+            self._nets.popitem(last=False)
+        return net
+
+    def get(self, name: str) -> BayesNet:
+        """
+        Returns the compiled net of the config registered under name.
+
+        The config is loaded and compiled if it is not held in memory.
+
+        Args:
+            name: a registered name
+        Returns:
+            BayesNet:
+                The compiled net
+        Raises:
+            KeyError: A KeyError is raised if the name is not registered
+        """
+        with self._lock:
+            path = self._path(name)
+            net = self._cached_net(name)
+        if net is not None:
+            return net
+
+        config = load_config(path)
+        key = _model_key(config)
+        with self._lock:
+            self._keys[name] = key
+            net = self._nets.get(key)
+        if net is None:
+            net = _build(config, self.cache_dir)
+        with self._lock:
+            return self._insert(key, net)
+
+    def preload(self, names: list = None) -> None:
+        """
+        Loads and compiles configs in parallel. Identical configs are only compiled once.
+
+        Args:
+            names: registered names to load. All registered names if None.
+        Raises:
+            KeyError: A KeyError is raised if a name is not registered
+        """
+        with self._lock:
+            names = list(self._paths) if names is None else list(names)
+            paths = [self._path(name) for name in names]
+
+        with EXECUTORS[self.executor](max_workers=self.max_workers) as executor:
+            configs = list(executor.map(_parse_config, paths))
+            unique_configs = {}
+            with self._lock:
+                for name, config in zip(names, configs):
+                    key = _model_key(config)
+                    self._keys[name] = key
+                    if key not in self._nets:
+                        unique_configs.setdefault(key, config)
+            keys = list(unique_configs)
+            configs = [unique_configs[key] for key in keys]
+
+            if self.executor == 'process':
+                # compile in the workers - nets can't be sent between processes, so this
+                # process loads the compiled models from the cache afterwards
+                list(executor.map(_compile_into_cache, configs,
+                                  itertools.repeat(self.cache_dir)))
+                nets = map(_build, configs, itertools.repeat(self.cache_dir))
+            else:
+                nets = executor.map(_build, configs,
+                                    itertools.repeat(self.cache_dir))
+            for key, net in zip(keys, nets):
+                with self._lock:
+                    self._insert(key, net)
+
+    def evict(self, name: str) -> None:
+        """
+        Removes the net of name from memory. It is recompiled on the next request.
+
+        Args:
+            name: a registered name
+        """
+        with self._lock:
+            self._nets.pop(self._keys.get(name), None)
@@ -0,0 +1,137 @@
+"""
+This module provides exact batched inference for the two-layer bayes net with NumPy.
+
+In the two-layer net every intention only depends on the contexts and the contexts are
+independent. The probability of an intention given evidence is therefore the CPT of the
+intention with the observed contexts fixed and all unobserved contexts summed out with their
+apriori probabilities. This needs no variable elimination and works on many evidences at once.
+
+For every combination of observed contexts the marginalized CPTs are computed once and cached.
+Inference for a batch of evidence is then a single lookup per row.
+
+Soft evidence gives a probability for every instantiation of a context instead of one
+instantiation. It replaces the apriori probabilities of the context, so its axis of the
+marginalized CPTs is summed out with the given probabilities instead of the priors.
+"""
+
+# System imports
+from collections import OrderedDict
+import threading
+
+# 3rd party imports
+import numpy as np
+
+# local imports
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+# Card index for contexts without evidence
+UNOBSERVED = -1
+# Card index for contexts with soft evidence
+SOFT = -2
+
+
+class NumpyEngine():
+    """Exact inference for all intentions of a two-layer bayes net with NumPy."""
+
+    def __init__(self, tables: np.ndarray, priors: list, max_marginals: int = 256) -> None:
+        '''
+        Creates the engine from the compiled CPT values.
+
+        Args:
+            tables: Probabilities of all intentions being True for every combination of context
+                instantiations. Shape is (number of intentions, *evidence_card).
+            priors: The apriori probabilities of the instantiations of every context
+                as 1D arrays in the order of the contexts
+            max_marginals: maximum number of cached marginalized CPTs
+        '''
+        self.tables = np.asarray(tables, dtype=float)
+        self.priors = [np.asarray(prior, dtype=float) for prior in priors]
+        self.max_marginals = max_marginals
+        self._marginals = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def num_contexts(self) -> int:
+        """Number of contexts"""
+        return len(self.priors)
+
+    @property
+    def num_intentions(self) -> int:
+        """Number of intentions"""
+        return self.tables.shape[0]
+
+    def marginal(self, observed: tuple) -> np.ndarray:
+        """
+        Returns the CPTs with all unobserved contexts summed out.
+
+        Args:
+            observed: a tuple of bools with True for every observed context
+        Returns:
+            np.ndarray:
+                Probabilities of all intentions being True for every combination of the
+                observed context instantiations. Shape is (number of intentions, *observed cards)
+        """
+        observed = tuple(observed)
+        marginal = self._marginals.get(observed)
+        if marginal is not None:
+            return marginal
+        marginal = self.tables
+        # sum out from the last axis so the indices of the remaining axes stay valid
+        for context in reversed(range(self.num_contexts)):
+            if not observed[context]:
+                marginal = np.tensordot(
+                    marginal, self.priors[context], axes=([context + 1], [0]))
+        with self._lock:
+            self._marginals[observed] = marginal
+            while len(self._marginals) > self.max_marginals:
+                self._marginals.popitem(last=False)
+        return marginal
+
+    def infer_cards(self, cards: np.ndarray, soft: dict = None) -> np.ndarray:
+        """
+        Infers the probabilities of all intentions for a batch of card encoded evidence.
+
+        Args:
+            cards: An integer array of shape (batch size, number of contexts) holding the card
+                index of the instantiation of every context, UNOBSERVED (-1) or SOFT (-2)
+            soft: The soft evidence of the rows with SOFT cards as a dict of context indices and
+                arrays of shape (batch size, instantiations of the context). Rows must sum up to 1.
+        Returns:
+            np.ndarray:
+                Probabilities of every intention being True with shape
+                (batch size, number of intentions). Rows are not normalized over intentions.
+        """
+        cards = np.asarray(cards, dtype=np.intp).reshape(-1, self.num_contexts)
+        result = np.empty((cards.shape[0], self.num_intentions))
+        if not cards.shape[0]:
+            return result
+        # 0 for unobserved, 1 for observed and 2 for soft evidence
+        states = (cards != UNOBSERVED).astype(np.int8) + (cards == SOFT)
+        patterns, pattern_of_row = np.unique(
+            states, axis=0, return_inverse=True)
+        pattern_of_row = pattern_of_row.reshape(-1)
+        for pattern_index, pattern in enumerate(patterns):
+            rows = np.flatnonzero(pattern_of_row == pattern_index)
+            marginal = self.marginal(tuple((pattern > 0).tolist()))
+            observed = np.flatnonzero(pattern == 1)
+            index = tuple(cards[rows, context] for context in observed)
+            if not (pattern == 2).any():
+                result[rows] = marginal[(slice(None),) + index].T
+                continue
+            # move the axes of the soft contexts to the end and pick the observed instantiations
+            axes = np.flatnonzero(pattern)
+            softs = np.flatnonzero(pattern == 2)
+            order = [0] + [1 + int(np.searchsorted(axes, context))
+                           for context in np.concatenate([observed, softs])]
+            marginal = marginal.transpose(order)
+            if index:
+                marginal = marginal[(slice(None),) + index]
+            else:
+                marginal = np.broadcast_to(
+                    marginal[:, None], (marginal.shape[0], len(rows)) + marginal.shape[1:])
+            for context in reversed(softs):
+                marginal = np.einsum('in...a,na->in...', marginal, soft[context][rows])
+            result[rows] = marginal.T
+        return result
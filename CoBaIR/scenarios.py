@@ -0,0 +1,248 @@
+"""
+This module generates synthetic scenarios - valid configs and matching evidence streams - for
+load and scaling tests.
+
+Everything is drawn from a seed, so a scenario can be regenerated anywhere:
+
+```
+config = generate_config(contexts=20, cardinality=(2, 5), intentions=50, sparsity=0.7,
+                         combined=2, seed=1)
+net = BayesNet(config)
+for evidence in evidence_stream(config, steps=1000, persistence=0.95, seed=1):
+    net.infer(evidence)
+```
+
+Evidence streams imitate sensors: the instantiation of a context persists for a while before it
+changes and a context drops out for a while before it is observed again.
+
+The `cobair-generate` command line tool writes a config in the format of `load_config` and
+optionally an evidence stream as JSONL for `cobair-infer`:
+
+```
+cobair-generate scenario.yml --contexts 20 --cardinality 2-5 --intentions 50 \\
+    --evidence evidence.jsonl --steps 10000
+```
+"""
+
+# System imports
+import argparse
+import itertools
+import json
+import random
+import sys
+
+# 3rd party imports
+import yaml
+
+# local imports
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def _cardinality(rng: random.Random, cardinality) -> int:
+    """Draws the number of instantiations of a context"""
+    if callable(cardinality):
+        number = cardinality(rng)
+    elif isinstance(cardinality, (tuple, list)):
+        number = rng.randint(*cardinality)
+    else:
+        number = cardinality
+    if number < 2:
+        raise ValueError(f'Contexts need at least 2 instantiations, got {number}')
+    return number
+
+
+def _priors(rng: random.Random, instantiations: list) -> dict:
+    """Draws apriori probabilities which sum up to exactly 1.0 as the config format demands"""
+    while True:
+        weights = [rng.randint(1, 9) for _ in instantiations]
+        priors = [round(weight / sum(weights), 3) for weight in weights[:-1]]
+        priors.append(1.0 - sum(priors))
+        if priors[-1] > 0 and sum(priors) == 1.0:
+            return dict(zip(instantiations, priors))
+
+
+def _influences(rng: random.Random, instantiations: dict) -> dict:
+    """Draws the influences of the instantiations of a context - at least one is not 0"""
+    influences = {instantiation: rng.randint(0, 5) for instantiation in instantiations}
+    if not any(influences.values()):
+        influences[rng.choice(list(influences))] = rng.randint(1, 5)
+    return influences
+
+
+def generate_config(contexts: int = 5, cardinality=(2, 4), intentions: int = 5,
+                    sparsity: float = 0.0, combined: int = 0, decision_threshold: float = 0.5,
+                    seed: int = None) -> dict:
+    '''
+    Generates a valid config.
+
+    Args:
+        contexts: number of contexts
+        cardinality: number of instantiations of every context - either a number, a tuple of
+            the smallest and the largest number to draw from or a function which takes a
+            `random.Random` and returns a number
+        intentions: number of intentions
+        sparsity: probability that a context has no influence on an intention. Every
+            intention keeps at least one context.
+        combined: number of combined influences of two contexts per intention. Each overrides
+            the influence of one pair of instantiations.
+        decision_threshold: the decision threshold of the config
+        seed: seed of the random generator
+    Returns:
+        dict:
+            A config following the config format
+    Raises:
+        ValueError: A ValueError is raised if a parameter is out of range
+    '''
+    if contexts < 1 or intentions < 1:
+        raise ValueError(f'At least one context and one intention are needed, got {contexts} '
+                         f'contexts and {intentions} intentions')
+    if not 0 <= sparsity < 1:
+        raise ValueError(f'sparsity must be in [0, 1), got {sparsity}')
+    if combined < 0:
+        raise ValueError(f'combined must not be negative, got {combined}')
+    rng = random.Random(seed)
+    config = {'contexts': {}, 'intentions': {}, 'decision_threshold': float(decision_threshold)}
+    for context in range(contexts):
+        instantiations = [f'value {index}' for index in range(_cardinality(rng, cardinality))]
+        config['contexts'][f'context {context}'] = _priors(rng, instantiations)
+
+    context_names = list(config['contexts'])
+    for intention in range(intentions):
+        influencing = [context for context in context_names if rng.random() >= sparsity]
+        if not influencing:
+            influencing = [rng.choice(context_names)]
+        influences = {context: _influences(rng, config['contexts'][context])
+                      for context in influencing}
+        pairs = list(itertools.combinations(influencing, 2))
+        for pair in rng.sample(pairs, min(combined, len(pairs))):
+            influences[pair] = {
+                (rng.choice(list(config['contexts'][pair[0]])),
+                 rng.choice(list(config['contexts'][pair[1]]))): rng.randint(1, 5)}
+        config['intentions'][f'intention {intention}'] = influences
+    return config
+
+
+def evidence_stream(config: dict, steps: int, persistence: float = 0.9, dropout: float = 0.01,
+                    recovery: float = 0.2, seed: int = None):
+    '''
+    Generates a stream of evidence for a config.
+
+    Every context follows its own Markov chain. With probability persistence the instantiation
+    stays the same in a step, otherwise a new one is drawn from the apriori probabilities.
+    An observed context drops out with probability dropout and an unobserved one is observed
+    again with probability recovery, so sensors go down for several steps at a time.
+
+    Args:
+        config: the config to generate evidence for
+        steps: number of evidences
+        persistence: probability that an instantiation stays the same in a step
+        dropout: probability that an observed context becomes unobserved in a step
+        recovery: probability that an unobserved context becomes observed in a step
+        seed: seed of the random generator
+    Returns:
+        generator:
+            The evidence of every step. Unobserved contexts are left out.
+    Raises:
+        ValueError: A ValueError is raised if a probability is not in [0, 1]
+    '''
+    for name, probability in [('persistence', persistence), ('dropout', dropout),
+                              ('recovery', recovery)]:
+        if not 0 <= probability <= 1:
+            raise ValueError(f'{name} must be in [0, 1], got {probability}')
+    return _evidence_stream(config, steps, persistence, dropout, recovery, random.Random(seed))
+
+
+def _evidence_stream(config: dict, steps: int, persistence: float, dropout: float,
+                     recovery: float, rng: random.Random):
+    """Generates the evidence stream of `evidence_stream`"""
+    priors = {context: (list(instantiations), list(instantiations.values()))
+              for context, instantiations in config['contexts'].items()}
+
+    def draw(context):
+        return rng.choices(*priors[context])[0]
+
+    states = {context: draw(context) for context in priors}
+    observed = {context: True for context in priors}
+    for _ in range(steps):
+        for context in priors:
+            if rng.random() >= persistence:
+                states[context] = draw(context)
+            observed[context] = rng.random() >= dropout if observed[context] \
+                else rng.random() < recovery
+        yield {context: state for context, state in states.items() if observed[context]}
+
+
+def save_config(config: dict, path: str):
+    """
+    Saves a config so it can be loaded with `load_config`.
+
+    Args:
+        config: a config following the config format
+        path: path of the yml file
+    """
+    with open(path, 'w', encoding='utf-8') as config_file:
+        yaml.dump(config, config_file)
+
+
+def _cardinality_argument(value: str):
+    """Parses "3" into 3 and "2-5" into (2, 5)"""
+    low, _, high = value.partition('-')
+    return (int(low), int(high)) if high else int(low)
+
+
+def main(argv: list = None):
+    """
+    Entry point of `cobair-generate`.
+
+    Args:
+        argv: command line arguments. sys.argv is used if None.
+    """
+    parser = argparse.ArgumentParser(
+        prog='cobair-generate', description='Generates a synthetic config and evidence stream')
+    parser.add_argument('config', help='path of the generated config file')
+    parser.add_argument('--contexts', type=int, default=5, help='number of contexts')
+    parser.add_argument('--cardinality', type=_cardinality_argument, default=(2, 4),
+                        help='instantiations per context - a number or a range like 2-5')
+    parser.add_argument('--intentions', type=int, default=5, help='number of intentions')
+    parser.add_argument('--sparsity', type=float, default=0.0,
+                        help='probability that a context has no influence on an intention')
+    parser.add_argument('--combined', type=int, default=0,
+                        help='number of combined influences per intention')
+    parser.add_argument('--decision-threshold', type=float, default=0.5,
+                        help='decision threshold of the config')
+    parser.add_argument('--seed', type=int, help='seed of the random generator')
+    parser.add_argument('--evidence', help='path of a JSONL evidence stream, - for stdout')
+    parser.add_argument('--steps', type=int, default=1000, help='length of the evidence stream')
+    parser.add_argument('--persistence', type=float, default=0.9,
+                        help='probability that an instantiation stays the same in a step')
+    parser.add_argument('--dropout', type=float, default=0.01,
+                        help='probability that a context becomes unobserved in a step')
+    parser.add_argument('--recovery', type=float, default=0.2,
+                        help='probability that an unobserved context is observed again')
+    args = parser.parse_args(argv)
+
+    try:
+        config = generate_config(args.contexts, args.cardinality, args.intentions,
+                                 args.sparsity, args.combined, args.decision_threshold,
+                                 args.seed)
+        evidences = evidence_stream(config, args.steps, args.persistence, args.dropout,
+                                    args.recovery, args.seed) if args.evidence else None
+        save_config(config, args.config)
+        if evidences is None:
+            return
+        output_file = sys.stdout if args.evidence == '-' else open(
+            args.evidence, 'w', encoding='utf-8')
+        try:
+            for evidence in evidences:
+                output_file.write(json.dumps(evidence) + '\n')
+        finally:
+            if output_file is not sys.stdout:
+                output_file.close()
+    except ValueError as error:
+        parser.error(str(error))
+
+
+if __name__ == '__main__':
+    main()
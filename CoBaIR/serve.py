@@ -0,0 +1,324 @@
+"""
+This module provides a local asyncio inference server which wraps one compiled net.
+
+Several processes can share one net instead of each loading and compiling their own.
+Concurrent requests are coalesced into micro-batches which are inferred at once with
+`BayesNet.infer_batch`.
+
+Start the server on a Unix domain socket or on a localhost TCP port:
+
+```
+python -m CoBaIR.serve small_example.yml --unix /tmp/cobair.sock
+python -m CoBaIR.serve small_example.yml --port 8765 --window-ms 2
+```
+
+The protocol is newline-delimited JSON. Every request is one line
+
+```
+{"id": 1, "evidence": {"speech commands": "pickup"}, "normalized": true, "decision_threshold": null}
+```
+
+where everything except `evidence` is optional. Every response is one line
+
+```
+{"id": 1, "intention": "pick up tool", "decision_threshold": 0.8,
+ "inference": {"hand over tool": 0.23, "pick up tool": 0.77}, "latency_ms": 2.3, "batch_size": 4}
+```
+
+or `{"id": 1, "error": "..."}` if the request could not be served.
+`latency_ms` is the time from receiving the request to sending the response.
+"""
+
+# System imports
+import argparse
+import asyncio
+from collections import defaultdict
+import json
+import logging
+import signal
+import time
+
+# 3rd party imports
+
+# local imports
+from .bayes_net import BayesNet, load_config
+from .diagnostics import DIAGNOSTICS_MODES
+from .metrics import MetricsRegistry
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+class MicroBatcher():
+    """Coalesces concurrent inference requests into batches."""
+
+    def __init__(self, net: BayesNet, window_ms: float = 2.0, max_batch_size: int = 64) -> None:
+        '''
+        Creates the batcher. Batches are processed once `run` is running.
+
+        Args:
+            net: The net used for inference
+            window_ms: Time in milliseconds after the first request of a batch in which further
+                requests are added to the batch
+            max_batch_size: Maximum number of requests in one batch
+        '''
+        self.net = net
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = asyncio.Queue()
+
+    async def infer(self, evidence: dict, normalized=True, decision_threshold=None) -> tuple:
+        """
+        Infers the evidence in the next batch. See `BayesNet.infer` for details.
+
+        Returns:
+            tuple:
+            The result like returned by `BayesNet.infer` and the size of the batch
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((evidence, normalized, decision_threshold, future))
+        return await future
+
+    async def _next_batch(self) -> list:
+        """Waits for the first request and collects further requests within the window"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _infer_batch(self, batch: list) -> list:
+        """Infers a batch in a worker thread - requests are grouped by their parameters"""
+        groups = defaultdict(list)
+        for request in batch:
+            evidence, normalized, decision_threshold, future = request
+            groups[(normalized, decision_threshold)].append((evidence, future))
+        results = []
+        for (normalized, decision_threshold), requests in groups.items():
+            try:
+                inferences = self.net.infer_batch([evidence for evidence, _ in requests],
+                                                  normalized=normalized,
+                                                  decision_threshold=decision_threshold,
+                                                  return_exceptions=True)
+            except Exception as error:  # pylint: disable=broad-except
+                # e.g. an invalid config or a failing discretization function
+                inferences = [error] * len(requests)
+            results.extend(zip((future for _, future in requests), inferences))
+        return results
+
+    async def run(self):
+        """
+        Processes batches until it is cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            results = await loop.run_in_executor(None, self._infer_batch, batch)
+            for future, result in results:
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result((result, len(batch)))
+
+
+class InferenceServer():
+    """Serves inference requests for one net over newline-delimited JSON."""
+
+    def __init__(self, net: BayesNet, window_ms: float = 2.0, max_batch_size: int = 64) -> None:
+        '''
+        Creates the server. It is started with `start_unix` or `start_tcp`.
+
+        Args:
+            net: The net used for inference
+            window_ms: see `MicroBatcher`
+            max_batch_size: see `MicroBatcher`
+        '''
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.net = net
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self.requests = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self._batcher = None
+        self._batcher_task = None
+        self._server = None
+
+    async def _respond(self, line: bytes) -> dict:
+        """Serves one request line and returns the response"""
+        start = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            (max_intention, decision_threshold, inference), batch_size = await self._batcher.infer(
+                request['evidence'], normalized=request.get('normalized', True),
+                decision_threshold=request.get('decision_threshold'))
+        except Exception as error:  # pylint: disable=broad-except
+            return {'id': request_id, 'error': f'{error.__class__.__name__}: {error}'}
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.requests += 1
+        self.total_latency_ms += latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        return {'id': request_id,
+                'intention': max_intention,
+                'decision_threshold': decision_threshold,
+                'inference': {intention: float(probability)
+                              for intention, probability in inference.items()},
+                'latency_ms': latency_ms,
+                'batch_size': batch_size}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves all requests of one connection. Requests are served concurrently."""
+        write_lock = asyncio.Lock()
+
+        async def respond(line):
+            response = await self._respond(line)
+            async with write_lock:
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _start_batcher(self):
+        """Starts the batching loop"""
+        self._batcher = MicroBatcher(
+            self.net, self.window_ms, self.max_batch_size)
+        self._batcher_task = asyncio.create_task(self._batcher.run())
+
+    async def start_unix(self, path: str):
+        """
+        Starts serving on a Unix domain socket.
+
+        Args:
+            path: path of the socket
+        """
+        self._start_batcher()
+        self._server = await asyncio.start_unix_server(self._handle, path=path)
+        self.log.info('Serving on %s', path)
+
+    async def start_tcp(self, host: str = '127.0.0.1', port: int = 8765):
+        """
+        Starts serving on a TCP port.
+
+        Args:
+            host: host to bind. Only bind to localhost unless the network is trusted.
+            port: port to bind. 0 picks a free port.
+        """
+        self._start_batcher()
+        self._server = await asyncio.start_server(self._handle, host=host, port=port)
+        self.log.info('Serving on %s', self.sockets())
+
+    def sockets(self) -> list:
+        """The addresses the server listens on"""
+        return [sock.getsockname() for sock in self._server.sockets]
+
+    async def stop(self):
+        """
+        Stops serving and logs the latency statistics.
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._batcher_task is not None:
+            self._batcher_task.cancel()
+            try:
+                await self._batcher_task
+            except asyncio.CancelledError:
+                pass
+        if self.requests:
+            self.log.info('Served %d requests - mean latency %.3f ms, max latency %.3f ms',
+                          self.requests, self.total_latency_ms / self.requests,
+                          self.max_latency_ms)
+
+
+async def serve(args: argparse.Namespace):
+    """
+    Runs the server until SIGINT or SIGTERM is received.
+
+    Args:
+        args: the parsed command line arguments
+    """
+    metrics = MetricsRegistry() if args.metrics_port is not None else None
+    net = BayesNet(load_config(args.config, metrics), cache_dir=args.cache_dir,
+                   diagnostics=args.diagnostics, metrics=metrics)
+    if not net.valid:
+        raise SystemExit(f'Invalid configuration in {args.config}')
+    metrics_server = None
+    if metrics is not None:
+        metrics_server = metrics.serve(args.metrics_port, args.host)
+        logging.getLogger(__name__).info('Serving metrics on %s',
+                                         metrics_server.server_address)
+    server = InferenceServer(net, args.window_ms, args.max_batch_size)
+    if args.unix:
+        await server.start_unix(args.unix)
+    else:
+        await server.start_tcp(args.host, args.port)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    await server.stop()
+    net.close()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+
+
+def main(argv: list = None):
+    """
+    Entry point of `python -m CoBaIR.serve`.
+
+    Args:
+        argv: command line arguments. sys.argv is used if None.
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m CoBaIR.serve', description='Local inference server for one CoBaIR config')
+    parser.add_argument('config', help='path to the config file')
+    parser.add_argument('--unix', help='path of a Unix domain socket to serve on')
+    parser.add_argument('--host', default='127.0.0.1', help='host to bind for TCP')
+    parser.add_argument('--port', type=int, default=8765, help='port to bind for TCP')
+    parser.add_argument('--window-ms', type=float, default=2.0,
+                        help='time window in milliseconds to coalesce requests into a batch')
+    parser.add_argument('--max-batch-size', type=int, default=64,
+                        help='maximum number of requests in one batch')
+    parser.add_argument('--cache-dir', help='directory of an on-disk cache for compiled models')
+    parser.add_argument('--diagnostics', choices=DIAGNOSTICS_MODES, default='warn',
+                        help='report unknown contexts and invalid evidence as warnings, '
+                        'as rate limited log messages (quiet) or as errors (strict)')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve metrics in the Prometheus text format at /metrics on this '
+                        'port of the host')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+"""
+This module provides a sharded config layout for configs with many intentions.
+
+A sharded config is a directory with a manifest and one file per intention:
+
+```
+scenario/
+    manifest.yml        # contexts, decision_threshold and the shard file of every intention
+    intentions/
+        hand_over_tool.yml
+        pick_up_tool.yml
+```
+
+The manifest holds the `contexts` and `decision_threshold` of the config format and maps every
+intention to its shard file under `intention_shards`. A shard holds the `intentions` entry of
+exactly one intention. `save_sharded_config` and `load_sharded_config` convert between the
+sharded layout and the single file format.
+
+A `ShardedBayesNet` only parses the manifest on creation. Intention shards are parsed and
+compiled when they are first queried with `infer`.
+"""
+
+# System imports
+import os
+import re
+import threading
+
+# 3rd party imports
+import yaml
+
+# local imports
+from .bayes_net import BayesNet, PrettySafeLoader, config_to_default_dict, default_to_regular
+from .discretizers import compile_discretizers
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+MANIFEST = 'manifest.yml'
+SHARD_DIR = 'intentions'
+
+
+def _load_yaml(path: str) -> dict:
+    """Loads a yml file with support for tuples"""
+    with open(path, encoding='utf-8') as stream:
+        return yaml.load(stream, Loader=PrettySafeLoader)
+
+
+def _shard_file_names(intentions: list) -> dict:
+    """
+    Creates unique file names for the shards of the given intentions.
+
+    Args:
+        intentions: names of the intentions
+    Returns:
+        dict:
+            A dict mapping every intention to the relative path of its shard
+    """
+    file_names = {}
+    used = set()
+    for intention in intentions:
+        stem = re.sub(r'[^A-Za-z0-9_-]+', '_', str(intention)).strip('_') or 'intention'
+        candidate, count = stem, 1
+        while candidate.lower() in used:
+            count += 1
+            candidate = f'{stem}_{count}'
+        used.add(candidate.lower())
+        file_names[intention] = f'{SHARD_DIR}/{candidate}.yml'
+    return file_names
+
+
+def save_sharded_config(config: dict, directory: str):
+    """
+    Saves a config in the sharded layout.
+
+    Args:
+        config: A dict with a config following the config format.
+        directory: The directory the manifest and the shards are saved in.
+            It is created if it does not exist.
+    """
+    config = default_to_regular(config)
+    intentions = config.get('intentions', {})
+    shards = _shard_file_names(list(intentions))
+    os.makedirs(os.path.join(directory, SHARD_DIR), exist_ok=True)
+    for intention, shard in shards.items():
+        with open(os.path.join(directory, shard), 'w', encoding='utf-8') as shard_file:
+            yaml.dump({intention: intentions[intention]}, shard_file)
+    manifest = {key: value for key,
+                value in config.items() if key != 'intentions'}
+    manifest['intention_shards'] = shards
+    with open(os.path.join(directory, MANIFEST), 'w', encoding='utf-8') as manifest_file:
+        yaml.dump(manifest, manifest_file)
+
+
+def load_manifest(directory: str) -> dict:
+    """
+    Loads the manifest of a sharded config.
+
+    Args:
+        directory: The directory of the sharded config
+    Returns:
+        dict:
+            The manifest with contexts, decision_threshold and intention_shards
+    """
+    manifest = _load_yaml(os.path.join(directory, MANIFEST)) or {}
+    manifest.setdefault('contexts', {})
+    manifest.setdefault('intention_shards', {})
+    return manifest
+
+
+def load_intention_shard(directory: str, shard: str, intention: str) -> dict:
+    """
+    Loads the context influences of an intention from its shard.
+
+    Args:
+        directory: The directory of the sharded config
+        shard: path of the shard relative to directory
+        intention: name of the intention
+    Returns:
+        dict:
+            The context influences of the intention
+    Raises:
+        ValueError: A ValueError is raised if the shard does not contain the intention
+    """
+    content = _load_yaml(os.path.join(directory, shard)) or {}
+    if intention not in content:
+        raise ValueError(f'Shard "{shard}" does not contain intention "{intention}"')
+    return content[intention] or {}
+
+
+def load_sharded_config(directory: str) -> dict:
+    """
+    Loads a sharded config with all intentions into the single file format.
+
+    Args:
+        directory: The directory of the sharded config
+    Returns:
+        defaultdict:
+            a defaultdict containing the config
+    """
+    manifest = load_manifest(directory)
+    config = {key: value for key, value in manifest.items()
+              if key != 'intention_shards'}
+    config['intentions'] = {
+        intention: load_intention_shard(directory, shard, intention)
+        for intention, shard in manifest['intention_shards'].items()}
+    return config_to_default_dict(config)
+
+
+class ShardedBayesNet():
+    """
+    A bayes net for a sharded config which compiles intentions when they are first queried.
+
+    Intentions only depend on the contexts, therefore every intention is compiled into its own
+    `BayesNet` with all contexts. Inference for an intention in its own net is the same as in a
+    net with all intentions.
+
+    All intention nets have the same contexts and therefore the same card numbers. Evidence is
+    discretized and validated once per `infer` by the first loaded net and the card numbers are
+    inferred by every queried net, so stateful discretizers see every raw value exactly once.
+    """
+
+    def __init__(self, directory: str, cache_dir: str = None) -> None:
+        '''
+        Loads the manifest of a sharded config. No intention shard is parsed yet.
+
+        Args:
+            directory: The directory of the sharded config
+            cache_dir: Directory of an on-disk cache for compiled models.
+                See `CoBaIR.model_cache` for details.
+        '''
+        self.directory = directory
+        self.cache_dir = cache_dir
+        self.manifest = load_manifest(directory)
+        self.contexts = list(self.manifest['contexts'])
+        self.intentions = list(self.manifest['intention_shards'])
+        self.decision_threshold = self.manifest.get('decision_threshold', 0.0)
+        self.discretization_functions = compile_discretizers(self.manifest.get('discretizers'))
+        # memo_size and quantization_step of discretization functions bound in code
+        self._memo_options = {}
+        self._nets = {}
+        # the net which discretizes and validates the evidence of infer
+        self._evidence_net = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded_intentions(self) -> list:
+        """Intentions whose shards are parsed and compiled"""
+        return list(self._nets)
+
+    def intention_net(self, intention: str) -> BayesNet:
+        """
+        Returns the compiled net of a single intention. The shard is loaded on first use.
+
+        Args:
+            intention: name of the intention
+        Returns:
+            BayesNet:
+                A net with all contexts and the given intention
+        Raises:
+            ValueError: A ValueError is raised if the intention is not in the manifest
+        """
+        net = self._nets.get(intention)
+        if net is not None:
+            return net
+        if intention not in self.manifest['intention_shards']:
+            raise ValueError(f'"{intention}" does not exist in the list of intentions')
+        with self._lock:
+            if intention not in self._nets:
+                influences = load_intention_shard(
+                    self.directory, self.manifest['intention_shards'][intention], intention)
+                net = BayesNet({'contexts': self.manifest['contexts'],
+                                'intentions': {intention: influences},
+                                'decision_threshold': self.decision_threshold},
+                               cache_dir=self.cache_dir)
+                for context, function in self.discretization_functions.items():
+                    net.bind_discretization_function(
+                        context, function, *self._memo_options.get(context, (0, None)))
+                self._nets[intention] = net
+                if self._evidence_net is None:
+                    self._evidence_net = net
+            return self._nets[intention]
+
+    def bind_discretization_function(self, context, discretization_function, memo_size: int = 0,
+                                     quantization_step: float = None):
+        """
+        Binds a discretization function to a context of all loaded and future intention nets.
+        See `BayesNet.bind_discretization_function` for details.
+        """
+        if context not in self.contexts:
+            raise ValueError(
+                f'Cannot bind discretization function to {context}. Context does not exist!')
+        with self._lock:
+            self.discretization_functions[context] = discretization_function
+            self._memo_options[context] = (memo_size, quantization_step)
+            for net in self._nets.values():
+                net.bind_discretization_function(
+                    context, discretization_function, memo_size, quantization_step)
+
+    def infer(self, evidence, intentions: list = None, normalized=True,
+              decision_threshold=None) -> tuple:
+        '''
+        Infers the probabilities for the queried intentions with given evidence.
+
+        Args:
+            evidence: Evidence to infer the probabilities. See `BayesNet.infer` for details.
+            intentions: The intentions to infer. All intentions if None.
+                Only the shards of these intentions are loaded.
+            normalized: Flag if the returned inference is normalized over the queried intentions
+                to sum up to 1.
+            decision_threshold: a threshold for picking the most likely intention.
+                If not given the decision_threshold of the manifest is taken.
+        Returns:
+            tuple:
+            Returns the highest ranking intention (or None if decision_threshold is not reached),
+            the decision threshold and a dictionary of intentions and the corresponding
+            probabilities.
+        '''
+        if decision_threshold is None:
+            decision_threshold = self.decision_threshold
+        if intentions is None:
+            intentions = self.intentions
+        nets = [self.intention_net(intention) for intention in intentions]
+        if not nets:
+            raise ValueError('No intentions to infer')
+        evidence_net = self._evidence_net
+        # pylint: disable=protected-access
+        card_evidence = evidence_net._card_evidence(evidence_net.model, evidence)
+        inference = {}
+        for net in nets:
+            inference.update(net._infer_card_evidence(net.model, card_evidence, False,
+                                                      decision_threshold)[2])
+        net = nets[-1]
+        if normalized:
+            inference = net.normalize_inference(inference)
+        max_intention = max(inference, key=inference.get)
+        max_intention = max_intention if inference[max_intention] > decision_threshold else None
+        return max_intention, decision_threshold, inference
+
+    def to_config(self) -> dict:
+        """
+        Loads all shards and returns the config in the single file format.
+
+        Returns:
+            defaultdict:
+                a defaultdict containing the config
+        """
+        return load_sharded_config(self.directory)
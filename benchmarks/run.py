@@ -0,0 +1,246 @@
+'''
+Benchmarks for compile time, inference latency and batched throughput.
+
+Every benchmark runs on synthetic configs of `CoBaIR.scenarios` which grow in one dimension at a
+time - contexts, instantiations per context (cardinality), intentions and combined influences -
+starting from a base config.
+Results are written as JSON, so runs of different commits can be compared:
+
+```
+python benchmarks/run.py --output base.json
+git checkout my-branch
+python benchmarks/run.py --output new.json --compare base.json
+```
+
+`--compare` prints the ratio of the median times and exits with 1 if a benchmark got slower
+than `--threshold`.
+'''
+
+# System imports
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# 3rd party imports
+import numpy as np
+
+# local imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from CoBaIR.bayes_net import BayesNet  # noqa: E402 pylint: disable=wrong-import-position
+from CoBaIR.scenarios import evidence_stream, generate_config  # noqa: E402 pylint: disable=wrong-import-position
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+BASE = {'contexts': 4, 'cardinality': 3, 'intentions': 4, 'combined': 0}
+GRID = {'contexts': [2, 4, 6, 8], 'cardinality': [2, 3, 5], 'intentions': [2, 4, 16, 64],
+        'combined': [0, 2, 8]}
+QUICK_GRID = {'contexts': [2, 4], 'cardinality': [2, 3], 'intentions': [2, 4],
+              'combined': [0, 2]}
+BATCH_SIZES = [1, 64, 1024]
+
+
+def parameter_sets(grid: dict) -> list:
+    """
+    Returns the base config parameters and the parameters with one dimension changed.
+
+    Args:
+        grid: a dict of dimensions and their values
+    Returns:
+        list:
+            distinct dicts of config parameters
+    """
+    parameters = [dict(BASE)]
+    for dimension, values in grid.items():
+        for value in values:
+            params = dict(BASE, **{dimension: value})
+            if params not in parameters:
+                parameters.append(params)
+    return parameters
+
+
+def measure(function, repeat: int, number: int = 1) -> dict:
+    """
+    Times a function.
+
+    Args:
+        function: the function to time - called without arguments
+        repeat: number of measurements
+        number: number of calls per measurement
+    Returns:
+        dict:
+            statistics of the seconds per call
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return {'min': min(times), 'median': statistics.median(times),
+            'mean': statistics.fmean(times),
+            'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+            'repeat': repeat, 'number': number}
+
+
+def bench_compile(config: dict, repeat: int) -> dict:
+    """Times BayesNet.__init__ including the creation of the DAG and the NumPy engine"""
+    def compile_net():
+        net = BayesNet(config, intern=False)
+        net.model.DAG  # pylint: disable=pointless-statement
+        net.model.engine  # pylint: disable=pointless-statement
+    return measure(compile_net, repeat)
+
+
+def bench_infer(net: BayesNet, evidences: list, repeat: int) -> dict:
+    """Times single calls of infer with bnlearn"""
+    calls = iter(evidences * (repeat // len(evidences) + 1))
+    return measure(lambda: net.infer(next(calls)), repeat)
+
+
+def bench_infer_batch(net: BayesNet, evidences: list, batch_size: int, repeat: int) -> dict:
+    """Times infer_batch - the statistics are per evidence"""
+    batch = (evidences * (batch_size // len(evidences) + 1))[:batch_size]
+    stats = measure(lambda: net.infer_batch(batch), repeat)
+    for key in ('min', 'median', 'mean', 'stdev'):
+        stats[key] /= batch_size
+    stats['throughput'] = 1 / stats['median']
+    return stats
+
+
+def synthetic_evidence(config: dict, seed: int) -> list:
+    """
+    Draws evidence where about 70 % of the contexts are observed. Consecutive evidences differ,
+    so no inference is skipped because its evidence did not change.
+    """
+    evidences = []
+    for evidence in evidence_stream(config, 256, persistence=0.0, dropout=0.3, recovery=0.7,
+                                    seed=seed):
+        if not evidences or evidence != evidences[-1]:
+            evidences.append(evidence)
+    return evidences
+
+
+def run(grid: dict, repeat: int, seed: int = 0) -> list:
+    """
+    Runs all benchmarks for all parameter sets.
+
+    Args:
+        grid: a dict of dimensions and their values
+        repeat: number of measurements per benchmark
+        seed: seed of the synthetic configs and evidence
+    Returns:
+        list:
+            one result per benchmark and parameter set
+    """
+    results = []
+    for params in parameter_sets(grid):
+        config = generate_config(**params, seed=seed)
+        evidences = synthetic_evidence(config, seed)
+        net = BayesNet(config, intern=False)
+        if not net.valid:
+            raise ValueError(f'Synthetic config for {params} is invalid')
+        results.append({'benchmark': 'compile', 'params': params,
+                        'stats': bench_compile(config, max(repeat // 10, 3))})
+        results.append({'benchmark': 'infer', 'params': params,
+                        'stats': bench_infer(net, evidences, repeat)})
+        for batch_size in BATCH_SIZES:
+            results.append({'benchmark': 'infer_batch', 'params': dict(params,
+                                                                      batch_size=batch_size),
+                            'stats': bench_infer_batch(net, evidences, batch_size, repeat)})
+        print(f'{params}: infer {results[-4]["stats"]["median"] * 1e3:.3f} ms', file=sys.stderr)
+    return results
+
+
+def _git_commit() -> str:
+    """Returns the current commit or None outside of a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(repeat: int, seed: int) -> dict:
+    """Returns a description of the environment of a run"""
+    return {'commit': _git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'processor': platform.processor(),
+            'repeat': repeat, 'seed': seed}
+
+
+def _key(result: dict) -> tuple:
+    """Identifies a benchmark across runs"""
+    return result['benchmark'], tuple(sorted(result['params'].items()))
+
+
+def compare(base: dict, new: dict, threshold: float) -> list:
+    """
+    Compares the median times of two runs.
+
+    Args:
+        base: the results of the base run
+        new: the results of the new run
+        threshold: ratio of new to base above which a benchmark counts as regression
+    Returns:
+        list:
+            tuples of benchmark, params, ratio and a flag if it is a regression for every
+            benchmark in both runs
+    """
+    base_results = {_key(result): result for result in base['results']}
+    comparison = []
+    for result in new['results']:
+        base_result = base_results.get(_key(result))
+        if base_result is None:
+            continue
+        ratio = result['stats']['median'] / base_result['stats']['median']
+        comparison.append((result['benchmark'], result['params'], ratio, ratio > threshold))
+    return comparison
+
+
+def main(argv: list = None) -> int:
+    """
+    Runs the benchmarks from the command line.
+
+    Args:
+        argv: command line arguments. sys.argv is used if None.
+    Returns:
+        int:
+            1 if a regression was found, 0 otherwise
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks of CoBaIR')
+    parser.add_argument('--output', '-o', help='path of the JSON results. stdout if not given')
+    parser.add_argument('--compare', help='path of JSON results of a base run to compare to')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='ratio of the median times which counts as regression')
+    parser.add_argument('--repeat', type=int, default=50, help='measurements per benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic configs')
+    parser.add_argument('--quick', action='store_true', help='run a small grid only')
+    args = parser.parse_args(argv)
+
+    report = {'meta': metadata(args.repeat, args.seed),
+              'results': run(QUICK_GRID if args.quick else GRID, args.repeat, args.seed)}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+
+    if not args.compare:
+        return 0
+    with open(args.compare, encoding='utf-8') as base_file:
+        comparison = compare(json.load(base_file), report, args.threshold)
+    for benchmark, params, ratio, regression in comparison:
+        print(f'{"REGRESSION " if regression else ""}{benchmark} {params}: {ratio:.2f}x',
+              file=sys.stderr)
+    return int(any(regression for *_, regression in comparison))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -39,6 +39,10 @@ setup(
     url="https://github.com/dfki-ric/CoBaIR",
     install_requires=requirements,
     packages=find_packages(),
+    entry_points={
+        'console_scripts': ['cobair-infer=CoBaIR.batch_infer:main',
+                            'cobair-generate=CoBaIR.scenarios:main'],
+    },
     long_description=read('README.md'),
     long_description_content_type="text/markdown",
     classifiers=[
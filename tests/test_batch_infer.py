@@ -0,0 +1,124 @@
+'''
+Tests for the batch inference command line tool
+'''
+
+# System imports
+import csv
+import json
+
+# 3rd party imports
+import pytest
+import yaml
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, default_to_regular, load_config
+from CoBaIR.batch_infer import main
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+bn = BayesNet(load_config('small_example.yml'))
+evidences = [{'speech commands': 'pickup'},
+             {'speech commands': 'handover', 'human holding object': True},
+             {'human activity': 'idle'},
+             {}] * 5
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_jsonl(tmp_path, capsys, processes):
+    """
+    Test that JSONL evidence is streamed through the net in chunks
+    """
+    evidence_path = tmp_path / 'evidence.jsonl'
+    evidence_path.write_text(
+        ''.join(json.dumps(evidence) + '\n' for evidence in evidences + [{'speech commands': {}}]))
+    output_path = tmp_path / 'posteriors.jsonl'
+    main(['small_example.yml', str(evidence_path), '--output', str(output_path),
+          '--chunk-size', '3', '--processes', str(processes)])
+
+    lines = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert [line['row'] for line in lines] == list(range(len(evidences) + 1))
+    for line, (max_intention, decision_threshold, inference) in zip(
+            lines, bn.infer_batch(evidences)):
+        assert line['intention'] == max_intention
+        assert line['decision_threshold'] == decision_threshold
+        assert line['inference'] == pytest.approx(inference)
+    assert 'error' in lines[-1]
+    assert 'rows: 21 (1 errors)' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_malformed_jsonl(tmp_path, capsys, processes):
+    """
+    Test that malformed lines are reported as errors of their rows and the run goes on
+    """
+    evidence_path = tmp_path / 'evidence.jsonl'
+    evidence_path.write_text('{"speech commands": "pickup"}\n{"speech commands": \n[1, 2]\n'
+                             '\n{"human activity": "idle"}\n')
+    output_path = tmp_path / 'posteriors.jsonl'
+    main(['small_example.yml', str(evidence_path), '--output', str(output_path),
+          '--chunk-size', '2', '--processes', str(processes)])
+
+    lines = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert [line['row'] for line in lines] == [0, 1, 2, 3]
+    assert 'line 2' in lines[1]['error'] and 'line 3' in lines[2]['error']
+    assert lines[0]['intention'] == bn.infer({'speech commands': 'pickup'})[0]
+    assert lines[3]['inference'] == pytest.approx(bn.infer({'human activity': 'idle'})[2])
+    assert 'rows: 4 (2 errors)' in capsys.readouterr().err
+
+
+def test_csv(tmp_path, capsys):
+    """
+    Test that CSV cells are translated into instantiations and CSV output is written
+    """
+    evidence_path = tmp_path / 'evidence.csv'
+    with open(evidence_path, 'w', newline='', encoding='utf-8') as evidence_file:
+        writer = csv.DictWriter(evidence_file, fieldnames=bn.contexts)
+        writer.writeheader()
+        writer.writerows(evidences)
+    output_path = tmp_path / 'posteriors.csv'
+    main(['small_example.yml', str(evidence_path), '-o', str(output_path)])
+
+    with open(output_path, newline='', encoding='utf-8') as output_file:
+        rows = list(csv.DictReader(output_file))
+    assert len(rows) == len(evidences)
+    for row, (max_intention, _, inference) in zip(rows, bn.infer_batch(evidences)):
+        assert row['intention'] == (max_intention or '')
+        for intention, probability in inference.items():
+            assert float(row[intention]) == pytest.approx(probability)
+    assert 'rows/s' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_csv_declared_discretizers(tmp_path, capsys, processes):
+    """
+    Test that numeric CSV cells of discretized contexts are parsed and errors of the
+    discretization functions are reported as errors of their rows
+    """
+    config = default_to_regular(load_config('small_example.yml'))
+    config['discretizers'] = {
+        'human holding object': {'type': 'threshold', 'thresholds': [0.5],
+                                 'labels': [False, True]},
+        'speech commands': {'type': 'map', 'mapping': {0: 'pickup', 1: 'handover'},
+                            'default': 'other'}}
+    config_path = tmp_path / 'discretized.yml'
+    with open(config_path, 'w', encoding='utf-8') as config_file:
+        yaml.dump(config, config_file)
+    evidence_path = tmp_path / 'evidence.csv'
+    evidence_path.write_text('human holding object,speech commands\n0.7,1\nTrue,pickup\n'
+                             'a lot,0\n0.2,\n')
+    output_path = tmp_path / 'posteriors.jsonl'
+    main([str(config_path), str(evidence_path), '--output', str(output_path),
+          '--processes', str(processes)])
+
+    lines = [json.loads(line) for line in output_path.read_text().splitlines()]
+    expected = bn.infer_batch([
+        {'human holding object': True, 'speech commands': 'handover'},
+        {'human holding object': True, 'speech commands': 'pickup'},
+        {'human holding object': False}])
+    for line, (max_intention, _, inference) in zip(
+            [lines[0], lines[1], lines[3]], expected):
+        assert line['intention'] == max_intention
+        assert line['inference'] == pytest.approx(inference)
+    assert 'error' in lines[2]
+    assert 'rows: 4 (1 errors)' in capsys.readouterr().err
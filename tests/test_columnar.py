@@ -0,0 +1,132 @@
+'''
+Tests for inference of columnar evidence
+'''
+
+# System imports
+import itertools
+import warnings
+
+# 3rd party imports
+import numpy as np
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.discretizers import ThresholdDiscretizer
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+bn = BayesNet(load_config('small_example.yml'))
+rows = list(itertools.product(['pickup', 'handover', 'other'], [True, False], ['idle', 'working']))
+contexts = ['speech commands', 'human holding object', 'human activity']
+
+
+def expected(evidences, normalized=True):
+    """
+    Returns the probabilities of infer_batch as an array
+    """
+    return np.array([[result[2][intention] for intention in bn.intentions]
+                     for result in bn.infer_batch(evidences, normalized=normalized)])
+
+
+def test_structured_array():
+    """
+    Test that structured arrays infer the same as infer_batch
+    """
+    data = np.array(rows, dtype=[('speech commands', 'U8'), ('human holding object', '?'),
+                                 ('human activity', 'U8')])
+    max_intentions, decision_threshold, probabilities = bn.infer_columns(data, normalized=False)
+    evidences = [dict(zip(contexts, row)) for row in rows]
+    assert np.allclose(probabilities, expected(evidences, normalized=False))
+    assert decision_threshold == bn.decision_threshold
+
+    max_intentions, _, probabilities = bn.infer_columns(data, decision_threshold=0.6)
+    for max_intention, result in zip(max_intentions,
+                                     bn.infer_batch(evidences, decision_threshold=0.6)):
+        assert (bn.intentions[max_intention] if max_intention >= 0 else None) == result[0]
+
+
+def test_missing_and_invalid_values():
+    """
+    Test that missing values are unobserved and invalid values are ignored with a warning
+    """
+    data = {'speech commands': np.array(['pickup', None, 'shout'], dtype=object),
+            'human activity': ['idle', 'idle', 'working']}
+    with pytest.warns(UserWarning, match='shout'):
+        _, _, probabilities = bn.infer_columns(data)
+    evidences = [{'speech commands': 'pickup', 'human activity': 'idle'},
+                 {'human activity': 'idle'},
+                 {'human activity': 'working'}]
+    assert np.allclose(probabilities, expected(evidences))
+    with pytest.raises(ValueError):
+        bn.infer_columns({'speech commands': ['pickup'], 'human activity': []})
+
+
+def test_diagnostics_modes():
+    """
+    Test that invalid values and unknown contexts follow the diagnostics mode of the net
+    """
+    data = {'speech commands': np.array(['shout', None, 'shout', 'pickup'], dtype=object),
+            'gaze': ['robot'] * 4}
+    quiet = BayesNet(load_config('small_example.yml'), diagnostics='quiet')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', UserWarning)
+        quiet.infer_columns(data)
+    assert quiet.diagnostics.counts() == {('invalid instantiation', 'speech commands'): 2,
+                                          ('unknown context', 'gaze'): 4}
+    strict = BayesNet(load_config('small_example.yml'), diagnostics='strict')
+    with pytest.raises(ValueError, match='shout'):
+        strict.infer_columns({'speech commands': data['speech commands']})
+    with pytest.raises(ValueError, match='gaze'):
+        strict.infer_columns({'gaze': data['gaze']})
+
+
+def test_discretization_of_distinct_values():
+    """
+    Test that every distinct value is discretized once
+    """
+    calls = []
+
+    def discretize(value):
+        calls.append(value)
+        return value > 0.5
+
+    net = BayesNet(load_config('small_example.yml'))
+    net.bind_discretization_function('human holding object', discretize)
+    data = {'human holding object': np.array([0.9, 0.1, 0.9, 0.9, 0.1])}
+    _, _, probabilities = net.infer_columns(data)
+    assert sorted(calls) == [0.1, 0.9]
+    evidences = [{'human holding object': value > 0.5} for value in data['human holding object']]
+    assert np.allclose(probabilities, expected(evidences))
+
+
+def test_vectorized_discretizer_keeps_instantiations():
+    """
+    Test that values which are instantiations are not discretized - like in infer
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    net.bind_discretization_function('human holding object',
+                                     ThresholdDiscretizer([0.01], [True, False]))
+    data = {'human holding object': np.array([1.0, 0.0, 0.7, 0.005, np.nan])}
+    _, _, probabilities = net.infer_columns(data)
+    rows_inferred = [net.infer({'human holding object': value})[2]
+                     for value in data['human holding object']]
+    assert np.allclose(probabilities, [[inference[intention] for intention in net.intentions]
+                                       for inference in rows_inferred])
+    evidences = [{'human holding object': value} for value in [True, False, False, True, None]]
+    assert np.allclose(probabilities, expected(evidences))
+
+
+def test_record_batch():
+    """
+    Test that plain and dictionary encoded arrow columns infer the same as infer_batch
+    """
+    pyarrow = pytest.importorskip('pyarrow')
+    speech = pyarrow.array([row[0] for row in rows] + [None]).dictionary_encode()
+    holding = pyarrow.array([row[1] for row in rows] + [True])
+    activity = pyarrow.array([row[2] for row in rows] + [None])
+    batch = pyarrow.RecordBatch.from_arrays([speech, holding, activity], names=contexts)
+    _, _, probabilities = bn.infer_columns(batch)
+    evidences = [dict(zip(contexts, row)) for row in rows] + [{'human holding object': True}]
+    assert np.allclose(probabilities, expected(evidences))
@@ -0,0 +1,137 @@
+'''
+Tests for discretizers declared in the config file
+'''
+
+# System imports
+import copy
+import pickle
+
+# 3rd party imports
+import pytest
+import yaml
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, PrettySafeLoader, default_to_regular, load_config
+from CoBaIR.discretizers import ThresholdDiscretizer, discretizer_from_spec
+from CoBaIR.inference_pool import InferencePool
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+discretizers = {'human holding object': {'type': 'threshold', 'thresholds': [0.5],
+                                         'labels': [False, True]},
+                'human activity': {'type': 'argmax', 'labels': ['idle', 'working'],
+                                   'min_probability': 0.6},
+                'speech commands': {'type': 'map', 'mapping': {0: 'pickup', 1: 'handover'},
+                                    'default': 'other'}}
+raw_evidence = {'human holding object': 0.7, 'human activity': [0.2, 0.8], 'speech commands': 1}
+discrete_evidence = {'human holding object': True, 'human activity': 'working',
+                     'speech commands': 'handover'}
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    """
+    The small example config with declared discretizers
+    """
+    config = default_to_regular(load_config('small_example.yml'))
+    config['discretizers'] = discretizers
+    path = tmp_path / 'discretized.yml'
+    with open(path, 'w', encoding='utf-8') as config_file:
+        yaml.dump(config, config_file)
+    return str(path)
+
+
+def test_load_compiles_discretizers(config_path):
+    """
+    Test that declared discretizers are compiled and bound on load
+    """
+    net = BayesNet(load_config(config_path))
+    assert set(net.discretization_functions) == set(discretizers)
+    assert net.infer(raw_evidence) == net.infer(discrete_evidence)
+
+    loaded = BayesNet()
+    loaded.load(config_path)
+    assert loaded.infer(raw_evidence) == net.infer(discrete_evidence)
+
+
+def test_save_round_trip(config_path, tmp_path):
+    """
+    Test that saving writes the declarations back
+    """
+    net = BayesNet(load_config(config_path))
+    net.bind_discretization_function('human holding object', ThresholdDiscretizer(
+        [0.3], [False, True]))
+    net.bind_discretization_function('speech commands', str)
+    saved_path = str(tmp_path / 'saved.yml')
+    net.save(saved_path)
+    with open(saved_path, encoding='utf-8') as saved_file:
+        saved = yaml.load(saved_file, Loader=PrettySafeLoader)['discretizers']
+    assert saved['human holding object']['thresholds'] == [0.3]
+    assert saved['human activity'] == discretizers['human activity']
+    # discretization functions in code are not part of the config
+    assert 'speech commands' not in saved
+
+    net.del_context('human activity')
+    assert 'human activity' not in net.config['discretizers']
+
+
+def test_config_equality(config_path, tmp_path):
+    """
+    Test that configs with discretizers compare equal after a copy and a save and reload
+    """
+    assert load_config(config_path) == load_config(config_path)
+    net = BayesNet(load_config(config_path))
+    assert net.config == copy.deepcopy(net.config)
+    saved_path = str(tmp_path / 'saved.yml')
+    net.save(saved_path)
+    assert load_config(saved_path) == net.config
+    assert len({ThresholdDiscretizer([0.5], [False, True]),
+                discretizer_from_spec(discretizers['human holding object'])}) == 1
+
+    net.bind_discretization_function('human holding object', ThresholdDiscretizer(
+        [0.3], [False, True]))
+    assert load_config(saved_path) != net.config
+
+
+def test_multi_process(config_path):
+    """
+    Test that declared discretizers can be sent to spawned worker processes
+    """
+    net = BayesNet(load_config(config_path))
+    assert pickle.loads(pickle.dumps(net.discretization_functions)).keys() == \
+        net.discretization_functions.keys()
+    with InferencePool(net, processes=1, start_method='spawn') as pool:
+        assert pool.map([raw_evidence]) == net.infer_batch([discrete_evidence])
+
+
+def test_pickle_net(config_path):
+    """
+    Test that a net with declarative discretizers can be pickled
+    """
+    net = BayesNet(load_config(config_path), diagnostics='quiet', discretization_workers=2)
+    net.bind_discretization_function('human holding object', ThresholdDiscretizer(
+        [0.3], [False, True]), memo_size=4, quantization_step=0.1)
+    net.infer(raw_evidence, deadline_ms=10000)
+    net.infer(raw_evidence)
+    copied = pickle.loads(pickle.dumps(net))
+    assert copied.infer(raw_evidence) == net.infer(raw_evidence)
+    assert copied.diagnostics.mode == 'quiet'
+    assert copied.unchanged_inferences == 0
+    memo = copied.discretization_memos['human holding object']
+    assert (memo.maxsize, memo.step, len(memo)) == (4, 0.1, 1)
+    # the copy can be edited like the original
+    copied.change_decision_threshold(0.6)
+    assert copied.decision_threshold == 0.6 and net.decision_threshold != 0.6
+    net.close()
+    copied.close()
+
+
+def test_invalid_declaration():
+    """
+    Test that invalid declarations are rejected
+    """
+    with pytest.raises(ValueError):
+        discretizer_from_spec({'type': 'unknown'})
+    with pytest.raises(ValueError):
+        discretizer_from_spec({'type': 'threshold', 'thresholds': [0.5]})
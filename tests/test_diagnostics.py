@@ -0,0 +1,69 @@
+'''
+Tests for the diagnostics modes of infer
+'''
+
+# System imports
+import logging
+import warnings
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.diagnostics import Diagnostics
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+evidence = {'speech commands': 'pickup', 'gaze': 'tool', 'human activity': None,
+            'human holding object': 'maybe'}
+
+
+def test_quiet():
+    """
+    Test that the quiet mode counts diagnostics instead of warning
+    """
+    net = BayesNet(load_config('small_example.yml'), diagnostics='quiet')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', UserWarning)
+        for _ in range(3):
+            result = net.infer(evidence)
+        net.infer_batch([evidence])
+    assert result == BayesNet(load_config('small_example.yml')).infer(
+        {'speech commands': 'pickup'})
+    assert net.diagnostics.counts() == {('unknown context', 'gaze'): 4,
+                                        ('no evidence', 'human activity'): 4,
+                                        ('invalid instantiation', 'human holding object'): 4}
+    net.diagnostics.reset()
+    assert not net.diagnostics.counts()
+
+
+def test_strict():
+    """
+    Test that the strict mode raises for unknown contexts and invalid instantiations
+    """
+    net = BayesNet(load_config('small_example.yml'), diagnostics='strict')
+    net.infer({'speech commands': 'pickup', 'human activity': None})
+    for invalid in [{'gaze': 'tool'}, {'human holding object': 'maybe'}]:
+        with pytest.raises(ValueError):
+            net.infer(invalid)
+    assert net.diagnostics.counts() == {('no evidence', 'human activity'): 1}
+    with pytest.raises(ValueError):
+        BayesNet(diagnostics='loud')
+
+
+def test_rate_limited_logging(caplog):
+    """
+    Test that summaries are logged at most once per interval
+    """
+    diagnostics = Diagnostics('quiet', interval=3600)
+    with caplog.at_level(logging.WARNING):
+        for _ in range(5):
+            diagnostics.record('unknown context', 'gaze')
+    assert len(caplog.records) == 1
+    assert diagnostics.counts() == {('unknown context', 'gaze'): 5}
+    diagnostics.interval = 0
+    with caplog.at_level(logging.WARNING):
+        diagnostics.record('unknown context', 'gaze')
+    assert '5x unknown context "gaze"' in caplog.records[-1].getMessage()
@@ -0,0 +1,90 @@
+'''
+Tests for memoized discretization
+'''
+
+# System imports
+import gc
+import weakref
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.discretization_stage import DiscretizationMemo
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+class CountingDiscretizer():
+    """A discretization function which counts its calls"""
+
+    def __init__(self):
+        self.values = []
+
+    def __call__(self, value):
+        self.values.append(value)
+        return value >= 0.5
+
+
+def test_memoized_discretization():
+    """
+    Test that quantized values are only discretized once
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    expected = {value: net.infer({'human holding object': value})
+                for value in [True, False]}
+    discretizer = CountingDiscretizer()
+    net.bind_discretization_function('human holding object', discretizer,
+                                     memo_size=2, quantization_step=0.1)
+    for value in [0.71, 0.69, 0.7, 0.2, 0.44]:
+        assert net.infer({'human holding object': value}) == expected[value >= 0.45]
+    # the function gets the quantized values
+    assert discretizer.values == [0.7, 0.2, 0.4]
+    memo = net.discretization_memos['human holding object']
+    assert (memo.hits, memo.misses, len(memo)) == (2, 3, 2)
+    # valid instantiations are not memoized
+    assert net.infer({'human holding object': True}) == expected[True]
+
+    # a new snapshot has new card numbers
+    net.add_context('gaze', {'tool': 0.5, 'human': 0.5})
+    net.infer({'human holding object': 0.7})
+    assert discretizer.values[-1] == 0.7
+    # rebinding without a memo removes it
+    net.bind_discretization_function('human holding object', discretizer)
+    assert not net.discretization_memos
+
+
+def test_memo_releases_model():
+    """
+    Test that the memo does not keep a replaced snapshot alive
+    """
+    net = BayesNet(load_config('small_example.yml'), intern=False)
+    discretizer = CountingDiscretizer()
+    net.bind_discretization_function('human holding object', discretizer, memo_size=2)
+    net.infer({'human holding object': 0.7})
+    model = weakref.ref(net.model)
+    net.change_decision_threshold(0.7)
+    gc.collect()
+    assert model() is None
+    net.infer({'human holding object': 0.7})
+    assert discretizer.values == [0.7, 0.7]
+
+
+def test_memo_keys():
+    """
+    Test the keys of values
+    """
+    memo = DiscretizationMemo(10, step=0.25)
+    assert memo.key(0.3) == memo.key(0.2) == 1
+    assert memo.quantize(0.3) == 0.25
+    assert memo.key(float('nan')) is None
+    assert memo.key('idle') == 'idle' and memo.quantize('idle') == 'idle'
+    assert memo.key([0.1, 0.9]) is None
+    assert memo.key(True) is True
+    assert DiscretizationMemo(10).key(0.3) == 0.3
+    with pytest.raises(ValueError):
+        DiscretizationMemo(0)
+    with pytest.raises(ValueError):
+        DiscretizationMemo(10, step=0)
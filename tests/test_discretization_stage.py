@@ -0,0 +1,118 @@
+'''
+Tests for the concurrent discretization of evidence
+'''
+
+# System imports
+import asyncio
+import time
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.discretization_stage import DiscretizationStage
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+raw_evidence = {'human holding object': 0.7, 'human activity': 0.1, 'speech commands': 'pickup'}
+discrete_evidence = {'human holding object': True, 'human activity': 'idle',
+                     'speech commands': 'pickup'}
+
+
+def slow_holding(value):
+    """A slow discretization function"""
+    time.sleep(0.2)
+    return value > 0.5
+
+
+def slow_activity(value):
+    """Another slow discretization function"""
+    time.sleep(0.2)
+    return 'working' if value > 0.5 else 'idle'
+
+
+async def async_activity(value):
+    """A discretization function which is a coroutine function"""
+    await asyncio.sleep(0.2)
+    return 'working' if value > 0.5 else 'idle'
+
+
+def create_net(activity=slow_activity, workers=2) -> BayesNet:
+    """Creates a net with slow discretization functions"""
+    net = BayesNet(load_config('small_example.yml'), discretization_workers=workers)
+    net.bind_discretization_function('human holding object', slow_holding)
+    net.bind_discretization_function('human activity', activity)
+    return net
+
+
+def test_concurrent_discretization():
+    """
+    Test that discretization functions run concurrently and are timed
+    """
+    net = create_net()
+    expected = net.infer(discrete_evidence)
+    start = time.perf_counter()
+    assert net.infer(raw_evidence) == expected
+    assert time.perf_counter() - start < 0.35
+    timings = net.discretization_timings
+    assert set(timings) == {'human holding object', 'human activity'}
+    assert timings['human activity'].calls == 1
+    assert 0.2 <= timings['human activity'].mean < 0.3
+    # valid instantiations are not discretized
+    net.infer({'human holding object': True})
+    assert net.discretization_timings['human holding object'].calls == 1
+
+    assert create_net(workers=0).infer(raw_evidence) == expected
+
+
+def test_async_discretization():
+    """
+    Test that coroutine functions are awaited
+    """
+    net = create_net(async_activity)
+    expected = net.infer(discrete_evidence)
+    assert net.infer(raw_evidence) == expected
+
+    async def infer_concurrently():
+        return await asyncio.gather(net.infer_async(raw_evidence), net.infer_async(raw_evidence))
+
+    start = time.perf_counter()
+    assert asyncio.run(infer_concurrently()) == [expected, expected]
+    assert time.perf_counter() - start < 0.35
+    assert net.discretization_timings['human activity'].calls == 3
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_coroutine_within_running_loop(workers):
+    """
+    Test that infer runs coroutine functions when it is called within a running event loop
+    """
+    net = create_net(async_activity, workers)
+    expected = net.infer(discrete_evidence)
+
+    async def infer_in_loop():
+        return net.infer(raw_evidence)
+
+    assert asyncio.run(infer_in_loop()) == expected
+    net.close()
+    # the closed stage starts its threads again
+    assert asyncio.run(infer_in_loop()) == expected
+    net.close()
+
+
+def test_discretization_errors():
+    """
+    Test that exceptions of discretization functions are raised
+    """
+    def broken(value):
+        raise RuntimeError(f'Can not discretize {value}')
+
+    stage = DiscretizationStage(2)
+    with pytest.raises(RuntimeError):
+        stage.run({'a': broken, 'b': str}, {'a': 1, 'b': 2})
+    assert stage.run({'a': str, 'b': str}, {'a': 1, 'b': 2}) == {'a': '1', 'b': '2'}
+    stage.close()
+    with pytest.raises(ValueError):
+        DiscretizationStage(-1)
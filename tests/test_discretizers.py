@@ -0,0 +1,153 @@
+'''
+Tests for the vectorized discretizers
+'''
+
+# System imports
+import gc
+import pickle
+import weakref
+
+# 3rd party imports
+import numpy as np
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.discretizers import ArgmaxDiscretizer, HysteresisDiscretizer, ThresholdDiscretizer
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def test_threshold_discretizer():
+    """
+    Test that scalars and arrays are binned the same way
+    """
+    discretizer = ThresholdDiscretizer([0.5, 2.0], ['near', 'mid', 'far'])
+    values = [-1.0, 0.0, 0.5, 1.0, 2.0, 10.0, float('nan')]
+    expected = ['near', 'near', 'mid', 'mid', 'far', 'far', None]
+    assert [discretizer(value) for value in values] == expected
+    assert discretizer(np.array(values)).tolist() == expected
+    assert pickle.loads(pickle.dumps(discretizer))(1.0) == 'mid'
+    with pytest.raises(ValueError):
+        ThresholdDiscretizer([2.0, 0.5], ['near', 'mid', 'far'])
+    with pytest.raises(ValueError):
+        ThresholdDiscretizer([0.5], ['near', 'mid', 'far'])
+
+
+def test_argmax_discretizer():
+    """
+    Test that class probabilities are discretized into the most likely class
+    """
+    discretizer = ArgmaxDiscretizer(['idle', 'working'], min_probability=0.6)
+    assert discretizer([0.2, 0.8]) == 'working'
+    assert discretizer([0.5, 0.5]) is None
+    assert discretizer(np.array([[0.9, 0.1], [0.3, 0.7], [0.55, 0.45]])).tolist() == [
+        'idle', 'working', None]
+    with pytest.raises(ValueError):
+        discretizer([0.2, 0.3, 0.5])
+
+
+def test_hysteresis_discretizer():
+    """
+    Test that the state only switches when a threshold is crossed - also across calls
+    """
+    values = [0.5, 0.7, 0.5, 0.35, 0.5, 0.65, 0.45]
+    expected = [None, True, True, False, False, True, True]
+    scalar = HysteresisDiscretizer(low=0.4, high=0.6)
+    assert [scalar(value) for value in values] == expected
+    vectorized = HysteresisDiscretizer(low=0.4, high=0.6)
+    assert vectorized(np.array(values[:3])).tolist() == expected[:3]
+    assert vectorized(np.array(values[3:])).tolist() == expected[3:]
+    assert vectorized.state is True
+    with pytest.raises(ValueError):
+        HysteresisDiscretizer(low=0.6, high=0.4)
+
+
+def test_bound_discretizers():
+    """
+    Test that discretizers plug into infer and infer_columns
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    net.bind_discretization_function('human holding object', ThresholdDiscretizer([0.5],
+                                                                                 [False, True]))
+    net.bind_discretization_function('human activity', ArgmaxDiscretizer(['idle', 'working']))
+    assert net.infer({'human holding object': 0.7, 'human activity': [0.1, 0.9]}) == net.infer(
+        {'human holding object': True, 'human activity': 'working'})
+
+    holding = np.array([0.1, 0.7, 0.5])
+    _, _, probabilities = net.infer_columns({'human holding object': holding})
+    expected = net.infer_batch([{'human holding object': value >= 0.5} for value in holding])
+    assert np.allclose(probabilities, [[result[2][intention] for intention in net.intentions]
+                                       for result in expected])
+
+
+def test_debounced_hysteresis():
+    """
+    Test that outliers don't switch the state and changes are reported
+    """
+    values = [0.7, 0.7, 0.3, 0.7, 0.3, float('nan'), 0.3, 0.5, 0.3, 0.3]
+    expected = [None, True, True, True, True, True, False, False, False, False]
+    changed = [False, True, False, False, False, False, True, False, False, False]
+    scalar = HysteresisDiscretizer(low=0.4, high=0.6, debounce=2)
+    assert [scalar.update(value) for value in values] == list(zip(expected, changed))
+    vectorized = HysteresisDiscretizer(low=0.4, high=0.6, debounce=2)
+    assert vectorized(np.array(values[:5])).tolist() == expected[:5]
+    assert vectorized.changed
+    assert vectorized(np.array(values[5:])).tolist() == expected[5:]
+    assert vectorized.state is False
+    vectorized.reset(True)
+    assert vectorized(0.3) is True and not vectorized.changed
+    with pytest.raises(ValueError):
+        HysteresisDiscretizer(low=0.4, high=0.6, debounce=0)
+
+
+def test_unchanged_evidence():
+    """
+    Test that the inference is skipped if the discretized evidence did not change
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    net.bind_discretization_function('human holding object',
+                                     HysteresisDiscretizer(low=0.4, high=0.6, debounce=2))
+    net.infer({'human holding object': 0.7})
+    for value in [0.7, 0.3, 0.7]:
+        assert net.infer({'human holding object': value}) == net.infer(
+            {'human holding object': True})
+    # the first value does not switch the state yet
+    assert net.unchanged_inferences == 5
+    # returned results can be changed without changing the skipped results
+    first = net.infer({'human holding object': 0.7})
+    first[2].clear()
+    assert net.infer({'human holding object': 0.7})[2]
+    net.infer({'human holding object': 0.7}, normalized=False)
+    assert net.unchanged_inferences == 7
+
+
+def test_unchanged_evidence_keeps_result():
+    """
+    Test that changing a returned inference does not change the results of later calls
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    evidence = {'speech commands': 'pickup'}
+    first = net.infer(evidence)
+    expected = dict(first[2])
+    first[2].clear()
+    second = net.infer(evidence)
+    assert net.unchanged_inferences == 1
+    assert second[2] == expected
+    second[2].pop(next(iter(expected)))
+    assert net.infer(evidence)[2] == expected
+
+
+def test_unchanged_evidence_releases_model():
+    """
+    Test that the last inference does not keep a replaced snapshot alive
+    """
+    net = BayesNet(load_config('small_example.yml'), intern=False)
+    net.infer({'speech commands': 'pickup'})
+    model = weakref.ref(net.model)
+    net.change_decision_threshold(0.7)
+    gc.collect()
+    assert model() is None
+    net.infer({'speech commands': 'pickup'})
+    assert net.unchanged_inferences == 0
@@ -0,0 +1,200 @@
+'''
+Tests for the evidence aggregator
+'''
+
+# System imports
+import asyncio
+import threading
+import time
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.evidence_aggregator import EvidenceAggregator
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+bn = BayesNet(load_config('small_example.yml'))
+
+
+def wait_for(condition, timeout=5.0):
+    """
+    Waits until the condition is True or the timeout is reached
+    """
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_latest_value_per_context():
+    """
+    Test that only the latest observation of every context is used
+    """
+    aggregator = EvidenceAggregator(bn)
+    aggregator.update('speech commands', 'handover')
+    aggregator.update('speech commands', 'pickup')
+    aggregator.update_many({'human activity': 'working', 'human holding object': True})
+    aggregator.clear('human holding object')
+    evidence = {'speech commands': 'pickup', 'human activity': 'working'}
+    assert aggregator.evidence == evidence
+    assert aggregator.infer() == bn.infer_batch([evidence])[0]
+    with pytest.raises(ValueError):
+        aggregator.update('unknown context', 'value')
+
+
+def test_on_change_schedule():
+    """
+    Test that inference runs after changes and bursts of updates are coalesced
+    """
+    results = []
+    with EvidenceAggregator(bn, min_interval=0.2, callback=results.append) as aggregator:
+        # nothing changed yet
+        time.sleep(0.1)
+        assert not results
+        threads = [threading.Thread(target=aggregator.update, args=('speech commands', value))
+                   for value in ['pickup', 'handover'] * 10]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        aggregator.update('speech commands', 'pickup')
+        expected = bn.infer_batch([{'speech commands': 'pickup'}])[0]
+        assert wait_for(lambda: results and results[-1] == expected)
+        assert aggregator.last_result == expected
+    # the first update is inferred at once, all later updates within min_interval together
+    assert len(results) <= 2
+
+
+def test_fixed_rate_schedule():
+    """
+    Test that inference runs at a fixed rate without changes
+    """
+    results = []
+    with EvidenceAggregator(bn, rate=50, callback=results.append):
+        assert wait_for(lambda: len(results) >= 3)
+
+
+def test_async_schedule():
+    """
+    Test that the schedule runs as a coroutine with updates from other coroutines
+    """
+    results = []
+
+    async def observe(aggregator):
+        for value in ['idle', 'working']:
+            aggregator.update('human activity', value)
+            await asyncio.sleep(0.05)
+
+    async def main():
+        aggregator = EvidenceAggregator(bn, callback=results.append)
+        task = asyncio.create_task(aggregator.run())
+        await observe(aggregator)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert results[-1] == bn.infer_batch([{'human activity': 'working'}])[0]
+
+
+def test_invalid_schedule():
+    """
+    Test that invalid schedules are rejected
+    """
+    with pytest.raises(ValueError):
+        EvidenceAggregator(bn, rate=0)
+    with pytest.raises(ValueError):
+        EvidenceAggregator(bn, min_interval=-1)
+
+
+def test_ttl_expires_to_apriori():
+    """
+    Test that expired observations count as unobserved and are reported
+    """
+    expired = []
+    aggregator = EvidenceAggregator(bn, ttl={'speech commands': 0.05},
+                                    on_expire=lambda *event: expired.append(event))
+    aggregator.update_many({'speech commands': 'pickup', 'human activity': 'working'})
+    assert aggregator.infer() == bn.infer_batch([aggregator.evidence])[0]
+    assert aggregator.evidence == {'speech commands': 'pickup', 'human activity': 'working'}
+    time.sleep(0.06)
+    assert aggregator.infer() == bn.infer_batch([{'human activity': 'working'}])[0]
+    assert aggregator.evidence == {'human activity': 'working'}
+    assert expired == [('speech commands', 'pickup')]
+    assert aggregator.expirations['speech commands'] == 1
+    # a new observation is valid again for the full ttl
+    aggregator.update('speech commands', 'handover')
+    assert aggregator.evidence['speech commands'] == 'handover'
+
+
+def test_expiry_triggers_inference():
+    """
+    Test that expiry is a change which triggers inference on change
+    """
+    results = []
+    with EvidenceAggregator(bn, ttl=0.1, callback=results.append) as aggregator:
+        aggregator.update('speech commands', 'pickup')
+        expected = bn.infer_batch([{}])[0]
+        assert wait_for(lambda: results and results[-1] == expected)
+    assert results[0] == bn.infer_batch([{'speech commands': 'pickup'}])[0]
+
+
+def test_invalid_ttl():
+    """
+    Test that invalid ttls are rejected
+    """
+    with pytest.raises(ValueError):
+        EvidenceAggregator(bn, ttl=0)
+    with pytest.raises(ValueError):
+        EvidenceAggregator(bn, ttl={'unknown context': 1})
+
+
+def test_expiry_keeps_fixed_rate():
+    """
+    Test that a due expiry does not run inference with a fixed rate before the period is over
+    """
+    results = []
+    aggregator = EvidenceAggregator(bn, rate=2, ttl=0.05, callback=results.append)
+    aggregator.infer()
+    aggregator.update('speech commands', 'pickup')
+    # the observation expired, but the schedule did not mark it as unobserved yet
+    time.sleep(0.06)
+    wait_time, due = aggregator._wait_time()  # pylint: disable=protected-access
+    assert (wait_time, due) == (0.0, False)
+    with aggregator:
+        assert wait_for(lambda: aggregator.expirations['speech commands'] == 1)
+        time.sleep(0.1)
+        assert not results
+
+
+def test_schedule_survives_errors():
+    """
+    Test that errors of discretization functions and callbacks do not end the schedule
+    """
+    def discretize(value):
+        if value == 'crash':
+            raise RuntimeError('sensor crashed')
+        return value
+
+    def callback(result):
+        results.append(result)
+        if len(results) == 1:
+            raise RuntimeError('callback crashed')
+
+    net = BayesNet(load_config('small_example.yml'))
+    net.bind_discretization_function('speech commands', discretize)
+    results = []
+    with EvidenceAggregator(net, callback=callback) as aggregator:
+        aggregator.update('speech commands', 'crash')
+        # pylint: disable=protected-access
+        assert wait_for(lambda: aggregator._inferred_version == aggregator.version)
+        aggregator.update('speech commands', 'pickup')
+        assert wait_for(lambda: len(results) == 1)
+        aggregator.update('human activity', 'idle')
+        assert wait_for(lambda: len(results) == 2)
+        assert results[-1] == net.infer_batch([{'speech commands': 'pickup',
+                                                'human activity': 'idle'}])[0]
@@ -0,0 +1,198 @@
+'''
+Tests for hot reloading of config files
+'''
+
+# System imports
+import os
+import shutil
+import time
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, InferenceResult, load_config
+from CoBaIR.default_discretizer import binary_decision
+from CoBaIR.hot_reload import ConfigWatcher
+from CoBaIR.instrumentation import StageTimer
+from CoBaIR.metrics import MetricsRegistry
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def replace_config(source, target):
+    """
+    Replaces the target config and makes sure the modification time changes
+    """
+    shutil.copy(source, target)
+    stat = os.stat(target)
+    os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    """
+    A copy of the small example config
+    """
+    path = tmp_path / 'scenario.yml'
+    shutil.copy('small_example.yml', path)
+    return str(path)
+
+
+def test_swap_on_change(config_path):
+    """
+    Test that a changed config is swapped in and the old net stays usable
+    """
+    watcher = ConfigWatcher(config_path)
+    old_net = watcher.net
+    assert watcher.check() is False
+
+    replace_config('small_example_altered.yml', config_path)
+    assert watcher.check() is True
+    assert watcher.net is not old_net
+    expected = BayesNet(load_config('small_example_altered.yml'))
+    evidence = {'speech commands': 'pickup'}
+    assert watcher.infer(evidence) == expected.infer(evidence)
+    # references to the old net keep working
+    old_net.infer(evidence)
+
+
+def test_invalid_change_keeps_net(config_path):
+    """
+    Test that an invalid config is reported and the active net is kept
+    """
+    errors = []
+    watcher = ConfigWatcher(config_path, on_error=errors.append)
+    net = watcher.net
+    with pytest.warns(UserWarning):
+        replace_config('tests/small_example_invalid.yml', config_path)
+        assert watcher.check() is False
+    assert watcher.net is net
+    assert len(errors) == 1
+
+
+def test_discretization_functions_survive_reload(config_path):
+    """
+    Test that bound discretization functions are bound to reloaded nets
+    """
+    watcher = ConfigWatcher(config_path)
+    watcher.bind_discretization_function(
+        'human holding object', binary_decision)
+    replace_config('small_example_altered.yml', config_path)
+    watcher.check()
+    assert 'human holding object' in watcher.net.discretization_functions
+
+
+def test_polling_thread(config_path):
+    """
+    Test that the polling thread swaps in a changed config
+    """
+    reloaded = []
+    with ConfigWatcher(config_path, interval=0.01, on_reload=reloaded.append):
+        replace_config('small_example_altered.yml', config_path)
+        deadline = time.monotonic() + 10
+        while not reloaded and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert len(reloaded) == 1
+
+
+def test_failed_reload_is_retried(config_path, monkeypatch):
+    """
+    Test that a config whose reload failed is tried again with the next check
+    """
+    errors = []
+    watcher = ConfigWatcher(config_path, on_error=errors.append)
+    compile_net = watcher._compile  # pylint: disable=protected-access
+
+    def fail_once(content):
+        monkeypatch.setattr(watcher, '_compile', compile_net)
+        raise OSError('file is still being written')
+
+    monkeypatch.setattr(watcher, '_compile', fail_once)
+    replace_config('small_example_altered.yml', config_path)
+    assert watcher.check() is False
+    assert len(errors) == 1
+    assert watcher.check() is True
+    assert watcher.check() is False
+
+
+def test_binding_during_reload(config_path, monkeypatch):
+    """
+    Test that a discretization function bound while a new net is compiled is not lost
+    """
+    watcher = ConfigWatcher(config_path)
+    compile_net = watcher._compile  # pylint: disable=protected-access
+
+    def compile_and_bind(content):
+        net = compile_net(content)
+        watcher.bind_discretization_function('human holding object', binary_decision)
+        return net
+
+    monkeypatch.setattr(watcher, '_compile', compile_and_bind)
+    replace_config('small_example_altered.yml', config_path)
+    assert watcher.check() is True
+    assert watcher.net.discretization_functions['human holding object'] is binary_decision
+
+
+def test_options_survive_reload(config_path):
+    """
+    Test that the options of the nets are forwarded to reloaded nets
+    """
+    registry = MetricsRegistry()
+    watcher = ConfigWatcher(config_path, diagnostics='quiet', discretization_workers=2,
+                            metrics=registry)
+    watcher.net.stage_timer = StageTimer()
+    replace_config('small_example_altered.yml', config_path)
+    assert watcher.check() is True
+    net = watcher.net
+    assert net.diagnostics.mode == 'quiet'
+    assert net.metrics is registry
+    assert net.stage_timer is not None
+    assert net._discretization.max_workers == 2  # pylint: disable=protected-access
+    result = watcher.infer({'speech commands': 'pickup'}, deadline_ms=10000, fallback='last')
+    assert isinstance(result, InferenceResult) and not result.stale
+
+
+def test_failing_callbacks_keep_polling(config_path, caplog):
+    """
+    Test that exceptions of the callbacks are logged and the polling thread goes on
+    """
+    reloaded = []
+
+    def fail(net):
+        reloaded.append(net)
+        raise RuntimeError('callback failed')
+
+    with ConfigWatcher(config_path, interval=0.01, on_reload=fail):
+        for count, source in enumerate(['small_example_altered.yml', 'small_example.yml'], 1):
+            replace_config(source, config_path)
+            deadline = time.monotonic() + 10
+            while len(reloaded) < count and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert len(reloaded) == count
+    assert 'callback failed' in caplog.text
+
+
+def test_edit_during_reload(config_path, monkeypatch):
+    """
+    Test that an edit right after the config was read is reloaded with the next check
+    """
+    watcher = ConfigWatcher(config_path)
+    read = watcher._read  # pylint: disable=protected-access
+
+    def read_and_edit():
+        content = read()
+        monkeypatch.setattr(watcher, '_read', read)
+        replace_config('small_example.yml', config_path)
+        return content
+
+    replace_config('small_example_altered.yml', config_path)
+    monkeypatch.setattr(watcher, '_read', read_and_edit)
+    assert watcher.check() is True
+    altered = BayesNet(load_config('small_example_altered.yml'))
+    evidence = {'speech commands': 'pickup'}
+    # the compiled net and the hash belong to the content which was read
+    assert watcher.infer(evidence) == altered.infer(evidence)
+    assert watcher.check() is True
+    assert watcher.infer(evidence) == BayesNet(load_config('small_example.yml')).infer(evidence)
@@ -0,0 +1,65 @@
+'''
+Tests that heavy backends are only imported when they are needed
+'''
+
+# System imports
+import json
+import subprocess
+import sys
+import textwrap
+
+# 3rd party imports
+
+# local imports
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+HEAVY_MODULES = ['bnlearn', 'pgmpy', 'pandas', 'networkx', 'matplotlib']
+# Importing CoBaIR.bayes_net only needs yaml - this is a generous upper bound
+IMPORT_TIME_BUDGET = 1.0
+
+
+def run_isolated(code):
+    """
+    Runs the code in a fresh interpreter and returns what it printed as json
+    """
+    code = textwrap.dedent(code)
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c', code],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_import_time():
+    """
+    Test that importing CoBaIR does not import heavy backends and stays within the time budget
+    """
+    result = run_isolated(f'''
+        import json, sys, time
+        start = time.perf_counter()
+        import CoBaIR.bayes_net
+        duration = time.perf_counter() - start
+        print(json.dumps({{'duration': duration,
+                          'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+    ''')
+    assert result['loaded'] == []
+    assert result['duration'] < IMPORT_TIME_BUDGET
+
+
+def test_config_handling_without_backends(tmp_path):
+    """
+    Test that loading, validating and saving configs does not import heavy backends
+    """
+    result = run_isolated(f'''
+        import json, sys
+        from CoBaIR.bayes_net import BayesNet, load_config
+        bn = BayesNet(load_config('small_example.yml'))
+        bn.validate_config()
+        bn.change_influence_value('pick up tool', 'human activity', 'idle', 3)
+        bn.save({str(tmp_path / 'saved.yml')!r})
+        loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+        bn.infer({{'speech commands': 'pickup'}})
+        print(json.dumps({{'loaded': loaded, 'after_infer': 'bnlearn' in sys.modules}}))
+    ''')
+    assert result['loaded'] == []
+    assert result['after_infer']
@@ -3,6 +3,7 @@ Tests for adding intention variables
 '''
 
 # System imports
+import itertools
 import pytest
 
 # local imports
@@ -134,3 +135,32 @@ def test_infer_warning_evidence():
     with pytest.warns(UserWarning):
         bn.infer(
             {'speech commands': 'something not related', 'this context': 'will be ignored anyways'})
+
+
+def test_infer_batch():
+    """
+    Test that batched inference equals single inference for all combinations of evidence
+    """
+    values = {'speech commands': [None, 'pickup', 'handover', 'other'],
+              'human holding object': [None, True, False],
+              'human activity': [None, 'idle', 'working']}
+    evidences = [{context: value for context, value in zip(values, combination)
+                  if value is not None}
+                 for combination in itertools.product(*values.values())]
+    for evidence, result in zip(evidences, bn.infer_batch(evidences)):
+        max_intention, decision_threshold, inference = bn.infer(evidence)
+        assert result[:2] == (max_intention, decision_threshold)
+        for intention, probability in inference.items():
+            assert round(abs(probability - result[2][intention]), 7) == 0
+
+
+def test_infer_batch_invalid_evidence():
+    """
+    Test that invalid evidence in a batch raises or is returned
+    """
+    evidences = [{'speech commands': {}}, {'speech commands': 'pickup'}]
+    with pytest.raises(ValueError):
+        bn.infer_batch(evidences)
+    invalid, valid = bn.infer_batch(evidences, return_exceptions=True)
+    assert isinstance(invalid, ValueError)
+    assert valid[2] == bn.infer_batch(evidences[1:])[0][2]
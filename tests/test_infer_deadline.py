@@ -0,0 +1,97 @@
+'''
+Tests for inference with a deadline
+'''
+
+# System imports
+import threading
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+evidence = {'speech commands': 'pickup', 'human activity': 'working'}
+
+
+def slow_net(release: threading.Event) -> BayesNet:
+    """
+    Creates a net whose exact inference waits until release is set
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    infer_exact = net._infer_exact  # pylint: disable=protected-access
+
+    def blocked_infer_exact(*args):
+        release.wait()
+        return infer_exact(*args)
+    net._infer_exact = blocked_infer_exact  # pylint: disable=protected-access
+    return net
+
+
+def test_deadline_met():
+    """
+    Test that the exact result is returned if the deadline is met
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    result = net.infer(evidence, deadline_ms=60_000)
+    assert result == net.infer(evidence)
+    assert not result.stale
+    assert result.source == 'exact'
+    assert net.deadline_misses == 0
+
+
+def test_analytic_fallback():
+    """
+    Test that a missed deadline returns the result of the NumPy engine marked as stale
+    """
+    release = threading.Event()
+    net = slow_net(release)
+    max_intention, decision_threshold, inference = result = net.infer(evidence, deadline_ms=10)
+    assert result.stale
+    assert result.source == 'analytic'
+    assert (max_intention, decision_threshold, inference) == net.infer_batch([evidence])[0]
+    # the exact inference is still running, so the next call misses right away
+    assert net.infer(evidence, deadline_ms=60_000).stale
+    assert net.deadline_misses == 2
+    release.set()
+
+
+def test_last_fallback():
+    """
+    Test that a missed deadline returns the last exact result
+    """
+    release = threading.Event()
+    net = slow_net(release)
+    release.set()
+    last = net.infer({'speech commands': 'handover'})
+    release.clear()
+    result = net.infer(evidence, deadline_ms=10, fallback='last')
+    assert result.stale
+    assert result.source == 'last'
+    assert result == last
+    # changing a returned result does not change the fallback
+    result[2].clear()
+    assert net.infer(evidence, deadline_ms=10, fallback='last') == last
+    release.set()
+    with pytest.raises(ValueError):
+        net.infer(evidence, deadline_ms=10, fallback='unknown')
+
+
+
+def test_close():
+    """
+    Test that closing stops the background thread and the net stays usable
+    """
+    running = set(threading.enumerate())
+    with BayesNet(load_config('small_example.yml')) as net:
+        net.infer(evidence, deadline_ms=10000)
+        started = [thread for thread in threading.enumerate() if thread not in running]
+        assert [thread.name.split('_')[0] for thread in started] == ['BayesNet-exact']
+        net.close()
+        started[0].join(timeout=10)
+        assert not started[0].is_alive()
+        assert not net.infer(evidence, deadline_ms=10000).stale
+    assert net._deadline_executor is None  # pylint: disable=protected-access
@@ -0,0 +1,111 @@
+'''
+Tests for the multi-process inference pool
+'''
+
+# System imports
+import itertools
+from multiprocessing import shared_memory
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.inference_pool import InferencePool
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+bn = BayesNet(load_config('small_example.yml'))
+values = {'speech commands': [None, 'pickup', 'handover', 'other'],
+          'human holding object': [None, True, False],
+          'human activity': [None, 'idle', 'working']}
+evidences = [{context: value for context, value in zip(values, combination)
+              if value is not None}
+             for combination in itertools.product(*values.values())]
+
+
+def discretize_activity(value):
+    """
+    Discretizes a sequence of activity levels by their mean
+    """
+    return 'working' if sum(value) / len(value) > 0.5 else 'idle'
+
+
+def test_map_equals_infer_batch():
+    """
+    Test that the pool returns the results of infer_batch in order
+    """
+    with InferencePool(bn, processes=2) as pool:
+        results = pool.map(evidences, chunksize=5)
+    assert results == bn.infer_batch(evidences)
+
+
+def test_imap_preserves_order():
+    """
+    Test that lazily inferred evidence streams keep their order
+    """
+    with InferencePool(bn, processes=2) as pool:
+        results = list(pool.imap(iter(evidences * 3), normalized=False, chunksize=7))
+    assert results == bn.infer_batch(evidences * 3, normalized=False)
+
+
+def test_imap_bounds_chunks_in_flight():
+    """
+    Test that imap only reads a few chunks of an endless evidence stream ahead
+    """
+    consumed = []
+
+    def endless():
+        for evidence in itertools.cycle(evidences):
+            consumed.append(evidence)
+            yield evidence
+    with InferencePool(bn, processes=2) as pool:
+        results = pool.imap(endless(), chunksize=5)
+        assert next(results) == bn.infer_batch(evidences[:1])[0]
+        # two chunks per worker are in flight and one more chunk is read before waiting
+        assert len(consumed) <= 5 * 5
+        results.close()
+
+
+def test_invalid_evidence():
+    """
+    Test that invalid evidence raises or is returned like in infer_batch
+    """
+    invalid = [{'speech commands': {}}, {'speech commands': 'pickup'}]
+    with InferencePool(bn, processes=1) as pool:
+        with pytest.raises(ValueError):
+            pool.map(invalid)
+        error, result = pool.map(invalid, return_exceptions=True)
+    assert isinstance(error, ValueError)
+    assert result == bn.infer_batch(invalid[1:])[0]
+
+
+def test_discretization_functions():
+    """
+    Test that discretization functions are used in the workers
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    net.bind_discretization_function('human activity', discretize_activity)
+    with InferencePool(net, processes=1) as pool:
+        result, = pool.map([{'human activity': [0.8, 1.0]}])
+    assert result == bn.infer_batch([{'human activity': 'working'}])[0]
+
+
+def test_shared_memory_is_released():
+    """
+    Test that closing the pool releases the shared memory
+    """
+    pool = InferencePool(bn, processes=1)
+    name = pool.shared_memory_name
+    pool.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_invalid_config():
+    """
+    Test that a pool can't be created for an invalid config
+    """
+    with pytest.raises(ValueError):
+        InferencePool(BayesNet())
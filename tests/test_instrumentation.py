@@ -0,0 +1,61 @@
+'''
+Tests for the per-stage timing of infer
+'''
+
+# System imports
+
+# 3rd party imports
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.instrumentation import STAGES, Histogram, StageTimer
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def test_stage_timing():
+    """
+    Test that every stage of infer is recorded
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    net.bind_discretization_function('human holding object', lambda value: value > 0.5)
+    assert net.stage_timer is None
+    recorded = []
+    with net.timing(lambda stage, seconds: recorded.append(stage)) as timer:
+        assert net.stage_timer is timer
+        for value in [0.2, 0.8, 0.4]:
+            net.infer({'human holding object': value, 'speech commands': 'pickup'})
+        net.infer({'speech commands': {'pickup': 0.5, 'other': 0.5}})
+    assert net.stage_timer is None
+    net.infer({'speech commands': 'other'})
+
+    snapshot = timer.snapshot()
+    assert set(snapshot) == set(STAGES)
+    assert snapshot['total']['count'] == 4
+    assert snapshot['discretization']['count'] == 4
+    # soft evidence is inferred by the engine in one stage
+    assert snapshot['inference']['count'] == 4
+    assert snapshot['extraction']['count'] == snapshot['normalization']['count'] == 3
+    assert snapshot['total']['sum'] > snapshot['inference']['sum'] > 0
+    assert recorded.count('total') == 4
+    timer.reset()
+    assert not timer.snapshot()
+
+
+def test_histogram():
+    """
+    Test that histograms have a fixed size and estimate quantiles
+    """
+    histogram = Histogram(bounds=(0.001, 0.01, 0.1))
+    for seconds in [0.0005] * 90 + [0.05] * 9 + [5.0]:
+        histogram.observe(seconds)
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == [(0.001, 90), (0.01, 0), (0.1, 9), (float('inf'), 1)]
+    assert (snapshot['p50'], snapshot['p90'], snapshot['p99']) == (0.001, 0.001, 0.1)
+    assert histogram.quantile(1.0) == snapshot['max'] == 5.0
+    assert snapshot['count'] == 100 and snapshot['min'] == 0.0005
+    assert Histogram().snapshot()['p99'] == 0.0
+    timer = StageTimer()
+    timer.record('custom', 0.2)
+    assert timer.snapshot()['custom']['count'] == 1
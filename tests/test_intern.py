@@ -0,0 +1,60 @@
+'''
+Tests for sharing compiled models between nets of identical configs
+'''
+
+# System imports
+import gc
+
+# 3rd party imports
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, interned_model_count, load_config
+from CoBaIR.default_discretizer import binary_decision
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def test_identical_configs_share_model():
+    """
+    Test that nets of identical configs share one compiled model
+    """
+    fleet = [BayesNet(load_config('small_example.yml')) for _ in range(10)]
+    assert all(net.model is fleet[0].model for net in fleet)
+    assert fleet[0].value_to_card is fleet[-1].value_to_card
+    assert BayesNet(load_config('small_example.yml'), intern=False).model is not fleet[0].model
+
+    config = load_config('small_example.yml')
+    config['decision_threshold'] = 0.5
+    assert BayesNet(config).model is not fleet[0].model
+
+
+def test_per_net_state_stays_separate():
+    """
+    Test that discretization functions and edits only affect their own net
+    """
+    first = BayesNet(load_config('small_example.yml'))
+    second = BayesNet(load_config('small_example.yml'))
+    first.bind_discretization_function('human holding object', binary_decision)
+    assert 'human holding object' not in second.discretization_functions
+
+    first.change_influence_value('pick up tool', 'human activity', 'idle', 0)
+    assert first.model is not second.model
+    assert second.model.config['intentions']['pick up tool']['human activity']['idle'] != 0
+    evidence = {'human activity': 'idle'}
+    assert first.infer(evidence) != second.infer(evidence)
+
+
+def test_memory_grows_with_distinct_configs():
+    """
+    Test that interned models are released with their last net
+    """
+    gc.collect()
+    count = interned_model_count()
+    config = load_config('small_example.yml')
+    config['decision_threshold'] = 0.123
+    fleet = [BayesNet(config) for _ in range(100)]
+    assert interned_model_count() == count + 1
+    del fleet
+    gc.collect()
+    assert interned_model_count() == count
@@ -0,0 +1,140 @@
+'''
+Tests for the metrics registry and its Prometheus export
+'''
+
+# System imports
+import gc
+import urllib.request
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.metrics import COUNTER, CONTENT_TYPE, MetricsRegistry
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def samples(text: str) -> dict:
+    """Parses the samples of the Prometheus text format"""
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in text.splitlines() if not line.startswith('#')}
+
+
+def test_net_metrics():
+    """
+    Test that infer, edits, compilations, load_config and the statistics of the net are exported
+    """
+    registry = MetricsRegistry()
+    net = BayesNet(load_config('small_example.yml', metrics=registry), intern=False,
+                   diagnostics='quiet', metrics=registry)
+    net.bind_discretization_function('human holding object', lambda value: value > 0.5,
+                                     memo_size=8)
+    for value in [0.2, 0.2, 0.8]:
+        net.infer({'human holding object': value, 'gaze': 'robot'})
+    with pytest.raises(ValueError):
+        net.infer({'speech commands': 'pickup'}, decision_threshold=0.5, deadline_ms=1,
+                  fallback='unknown')
+    net.infer_batch([{'speech commands': 'pickup'}] * 2)
+    with net.timing():
+        net.infer({'speech commands': 'other'})
+        text = registry.render()
+    result = samples(text)
+
+    assert '# TYPE cobair_infer_seconds histogram' in text
+    assert result['cobair_infer_seconds_count'] == 4
+    assert result['cobair_infer_seconds_bucket{le="+Inf"}'] == 4
+    assert result['cobair_infer_errors_total'] == 1
+    assert result['cobair_infer_batch_seconds_count'] == 1
+    assert 'cobair_config_edits_total{method="bind_discretization_function"}' not in result
+    assert result['cobair_compilations_total{source="compiled"}'] == 1
+    assert result['cobair_compile_seconds_count'] == 1
+    assert result['cobair_config_load_seconds_count'] == 1
+    assert result['cobair_nets'] == 1
+    assert result['cobair_unchanged_inferences_total'] == 1
+    assert result['cobair_evidence_diagnostics_total{context="gaze",kind="unknown context"}'] == 3
+    assert result['cobair_discretization_memo_hits_total{context="human holding object"}'] == 1
+    assert result['cobair_discretization_calls_total{context="human holding object"}'] == 2
+    assert result['cobair_infer_stage_seconds_count{stage="inference"}'] == 1
+    buckets = [value for name, value in result.items()
+               if name.startswith('cobair_infer_seconds_bucket')]
+    assert buckets == sorted(buckets)
+
+    net.change_decision_threshold(0.6)
+    result = samples(registry.render())
+    assert result['cobair_config_edits_total{method="change_decision_threshold"}'] == 1
+    assert result['cobair_compile_seconds_count'] == 2
+    assert 'cobair_infer_stage_seconds_count{stage="inference"}' not in result
+    del net
+    assert samples(registry.render())['cobair_nets'] == 0
+
+
+def test_counters_of_deleted_nets():
+    """
+    Test that counters don't go down when a net is deleted or a memo is rebound
+    """
+    registry = MetricsRegistry()
+    net = BayesNet(load_config('small_example.yml'), metrics=registry)
+    net.bind_discretization_function('human holding object', lambda value: value > 0.5,
+                                     memo_size=8)
+    for _ in range(3):
+        net.infer({'human holding object': 0.2})
+    result = samples(registry.render())
+    assert result['cobair_unchanged_inferences_total'] == 2
+    assert result['cobair_discretization_memo_hits_total{context="human holding object"}'] == 2
+
+    net.bind_discretization_function('human holding object', lambda value: value > 0.5,
+                                     memo_size=8)
+    net.infer({'human holding object': 0.2})
+    result = samples(registry.render())
+    assert result['cobair_discretization_memo_hits_total{context="human holding object"}'] == 2
+    assert result['cobair_unchanged_inferences_total'] == 3
+
+    del net
+    gc.collect()
+    other = BayesNet(load_config('small_example.yml'), metrics=registry)
+    other.infer({'speech commands': 'pickup'})
+    other.infer({'speech commands': 'pickup'})
+    result = samples(registry.render())
+    assert result['cobair_nets'] == 1
+    assert result['cobair_unchanged_inferences_total'] == 4
+    assert result['cobair_discretization_memo_hits_total{context="human holding object"}'] == 2
+
+
+def test_custom_metrics():
+    """
+    Test that metrics have to be described and labels are escaped
+    """
+    registry = MetricsRegistry()
+    with pytest.raises(ValueError):
+        registry.inc('requests_total')
+    with pytest.raises(ValueError):
+        registry.observe('cobair_infer_errors_total', 0.1)
+    registry.describe('requests_total', COUNTER, 'Requests of the application')
+    registry.inc('requests_total', 2, labels={'path': 'a"b\\c'})
+    registry.inc('requests_total', labels={'path': 'a"b\\c'})
+    assert 'requests_total{path="a\\"b\\\\c"} 3\n' in registry.render()
+
+
+def test_export(tmp_path):
+    """
+    Test that metrics are written to a file and served over HTTP
+    """
+    registry = MetricsRegistry()
+    registry.inc('cobair_infer_errors_total')
+    path = tmp_path / 'cobair.prom'
+    registry.write(str(path))
+    assert path.read_text(encoding='utf-8') == registry.render()
+    assert [file.name for file in tmp_path.iterdir()] == ['cobair.prom']
+
+    server = registry.serve()
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            assert 'cobair_infer_errors_total 1\n' in response.read().decode('utf-8')
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,105 @@
+'''
+Tests for the on-disk cache of compiled models
+'''
+
+# System imports
+import os
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.metrics import MetricsRegistry
+from CoBaIR.model_cache import ModelCache, config_hash
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def cache_entries(cache_dir):
+    """
+    Returns the names of all compiled models in the cache directory
+    """
+    return [name for name in os.listdir(cache_dir) if name.endswith('.pkl')]
+
+
+def test_cache_hit_infers_same_as_compiled(tmp_path):
+    """
+    Test that a net loaded from the cache infers the same as a freshly compiled net
+    """
+    config = load_config('small_example.yml')
+    compiled = BayesNet(config, cache_dir=str(tmp_path))
+    assert len(cache_entries(tmp_path)) == 1
+
+    cached = BayesNet(config, cache_dir=str(tmp_path))
+    assert len(cache_entries(tmp_path)) == 1
+    evidence = {'speech commands': 'pickup', 'human activity': 'working'}
+    assert cached.infer(evidence) == compiled.infer(evidence)
+    assert cached.infer_batch([evidence]) == compiled.infer_batch([evidence])
+
+
+def test_config_hash_ignores_decision_threshold():
+    """
+    Test that the decision threshold does not change the hash of the compiled model
+    """
+    config = load_config('small_example.yml')
+    key = config_hash(config)
+    config['decision_threshold'] = 0.3
+    assert config_hash(config) == key
+    config['contexts']['human activity']['idle'] = 0.3
+    config['contexts']['human activity']['working'] = 0.7
+    assert config_hash(config) != key
+
+
+def test_mutation_uses_cache(tmp_path):
+    """
+    Test that mutations of the net keep using the cache
+    """
+    bn = BayesNet(load_config('small_example.yml'), cache_dir=str(tmp_path))
+    bn.change_influence_value('pick up tool', 'human activity', 'idle', 3)
+    assert len(cache_entries(tmp_path)) == 2
+    assert ModelCache(str(tmp_path)).get(config_hash(bn.config)) is not None
+
+    # a net of the mutated config loads the model of the mutation from the cache
+    registry = MetricsRegistry()
+    mutated = BayesNet(bn.config, cache_dir=str(tmp_path), intern=False, metrics=registry)
+    assert len(cache_entries(tmp_path)) == 2
+    assert 'cobair_compilations_total{source="cache"} 1' in registry.render()
+    evidence = {'human activity': 'idle'}
+    assert mutated.infer(evidence) == bn.infer(evidence)
+
+
+def test_lru_eviction(tmp_path):
+    """
+    Test that the least recently used entries are evicted
+    """
+    cache = ModelCache(str(tmp_path), max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # make 'a' the most recently used entry
+    os.utime(tmp_path / 'b.pkl', (0, 0))
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert sorted(cache_entries(tmp_path)) == ['a.pkl', 'c.pkl']
+    assert cache.get('b') is None
+
+
+def test_net_cache_max_entries(tmp_path):
+    """
+    Test that the net passes its size limit to the cache
+    """
+    bn = BayesNet(load_config('small_example.yml'), cache_dir=str(tmp_path), cache_max_entries=1)
+    bn.change_influence_value('pick up tool', 'human activity', 'idle', 3)
+    assert len(cache_entries(tmp_path)) == 1
+    with pytest.raises(ValueError):
+        BayesNet(load_config('small_example.yml'), cache_max_entries=0)
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    """
+    Test that corrupt entries are treated as cache misses
+    """
+    cache = ModelCache(str(tmp_path))
+    (tmp_path / 'broken.pkl').write_bytes(b'not a pickle')
+    assert cache.get('broken') is None
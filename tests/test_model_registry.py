@@ -0,0 +1,94 @@
+'''
+Tests for the registry of compiled scenario configs
+'''
+
+# System imports
+import shutil
+
+# 3rd party imports
+import pytest
+import yaml
+
+# local imports
+from CoBaIR.bayes_net import default_to_regular, load_config
+from CoBaIR.model_registry import ModelRegistry
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+@pytest.fixture
+def scenario_dir(tmp_path):
+    """
+    A directory with two identical and one different scenario config
+    """
+    shutil.copy('small_example.yml', tmp_path / 'assembly.yml')
+    shutil.copy('small_example.yml', tmp_path / 'assembly_copy.yml')
+    shutil.copy('small_example_altered.yml', tmp_path / 'repair.yml')
+    return tmp_path
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_preload_deduplicates(scenario_dir, tmp_path_factory, executor):
+    """
+    Test that preloading compiles identical configs only once
+    """
+    registry = ModelRegistry(str(scenario_dir), executor=executor, max_workers=2,
+                             cache_dir=str(tmp_path_factory.mktemp('cache')))
+    assert sorted(registry.names) == ['assembly', 'assembly_copy', 'repair']
+    registry.preload()
+    assert sorted(registry.loaded) == sorted(registry.names)
+    assert registry['assembly'] is registry['assembly_copy']
+    assert registry['assembly'] is not registry['repair']
+    registry['repair'].infer({'speech commands': 'pickup'})
+
+
+def test_get_on_demand(scenario_dir):
+    """
+    Test that nets are compiled on first request
+    """
+    registry = ModelRegistry(str(scenario_dir))
+    assert registry.loaded == []
+    net = registry.get('repair')
+    assert registry.loaded == ['repair']
+    assert registry.get('repair') is net
+    with pytest.raises(KeyError):
+        registry.get('unknown scenario')
+
+
+def test_lru_eviction(scenario_dir):
+    """
+    Test that the least recently used nets are evicted
+    """
+    registry = ModelRegistry(str(scenario_dir), max_models=1)
+    repair = registry.get('repair')
+    registry.get('assembly')
+    assert sorted(registry.loaded) == ['assembly']
+    assert registry.get('repair') is not repair
+
+
+def test_discretizers_not_shared(tmp_path):
+    """
+    Test that configs which only differ in their discretizers get their own nets
+    """
+    config = default_to_regular(load_config('small_example.yml'))
+    for name, threshold in [('low', 0.3), ('high', 0.7), ('high_copy', 0.7)]:
+        config['discretizers'] = {'human holding object': {
+            'type': 'threshold', 'thresholds': [threshold], 'labels': [False, True]}}
+        with open(tmp_path / f'{name}.yml', 'w', encoding='utf-8') as config_file:
+            yaml.dump(config, config_file)
+    registry = ModelRegistry(str(tmp_path))
+    assert registry['low'] is not registry['high']
+    assert registry['high'] is registry['high_copy']
+    evidence = {'human holding object': 0.5}
+    assert registry['low'].infer(evidence) == registry['low'].infer({'human holding object': True})
+    assert registry['high'].infer(evidence) == registry['high'].infer(
+        {'human holding object': False})
+
+
+def test_process_executor_needs_cache():
+    """
+    Test that a process pool can't be used without a cache directory
+    """
+    with pytest.raises(ValueError):
+        ModelRegistry(executor='process')
@@ -0,0 +1,73 @@
+'''
+Tests for the synthetic scenario generator
+'''
+
+# System imports
+import json
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.scenarios import evidence_stream, generate_config, main
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def test_generate_config():
+    """
+    Test that generated configs are valid and reproducible
+    """
+    config = generate_config(contexts=6, cardinality=(2, 4), intentions=8, sparsity=0.5,
+                             combined=2, seed=3)
+    assert config == generate_config(contexts=6, cardinality=(2, 4), intentions=8,
+                                     sparsity=0.5, combined=2, seed=3)
+    assert BayesNet(config).valid
+    assert {len(instantiations) for instantiations in config['contexts'].values()} <= {2, 3, 4}
+    assert all(influences for influences in config['intentions'].values())
+    assert any(isinstance(context, tuple) for influences in config['intentions'].values()
+               for context in influences)
+    with pytest.raises(ValueError):
+        generate_config(cardinality=1)
+    with pytest.raises(ValueError):
+        generate_config(sparsity=1.0)
+
+
+def test_evidence_stream():
+    """
+    Test that evidence persists over time and sensors drop out
+    """
+    config = generate_config(contexts=3, cardinality=3, intentions=2, seed=1)
+    stream = list(evidence_stream(config, 2000, persistence=0.9, dropout=0.05, recovery=0.2,
+                                  seed=1))
+    assert stream == list(evidence_stream(config, 2000, persistence=0.9, dropout=0.05,
+                                          recovery=0.2, seed=1))
+    context = 'context 0'
+    values = [evidence.get(context) for evidence in stream]
+    changes = sum(previous != value for previous, value in zip(values, values[1:]))
+    # an instantiation is redrawn every 10 steps and observations drop out for 5 steps on average
+    assert changes < len(values) / 3
+    assert 0.05 < values.count(None) / len(values) < 0.4
+    assert all(evidence[key] in config['contexts'][key]
+               for evidence in stream for key in evidence)
+    with pytest.raises(ValueError):
+        evidence_stream(config, 10, persistence=1.5)
+
+
+def test_command_line(tmp_path):
+    """
+    Test that the command line tool writes a loadable config and an evidence stream
+    """
+    config_path = str(tmp_path / 'scenario.yml')
+    evidence_path = str(tmp_path / 'evidence.jsonl')
+    main([config_path, '--contexts', '4', '--cardinality', '2-3', '--intentions', '3',
+          '--combined', '1', '--seed', '7', '--evidence', evidence_path, '--steps', '50'])
+    config = load_config(config_path)
+    net = BayesNet(config)
+    assert net.valid and len(net.contexts) == 4
+    with open(evidence_path, encoding='utf-8') as evidence_file:
+        evidences = [json.loads(line) for line in evidence_file]
+    assert len(evidences) == 50
+    assert len(net.infer_batch(evidences)) == 50
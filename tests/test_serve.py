@@ -0,0 +1,88 @@
+'''
+Tests for the local inference server
+'''
+
+# System imports
+import asyncio
+import json
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+from CoBaIR.serve import InferenceServer
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+bn = BayesNet(load_config('small_example.yml'))
+
+
+async def request_all(path, requests):
+    """
+    Sends all requests over one connection and returns the responses by id
+    """
+    reader, writer = await asyncio.open_unix_connection(path)
+    for request in requests:
+        writer.write(json.dumps(request).encode('utf-8') + b'\n')
+    await writer.drain()
+    responses = {}
+    for _ in requests:
+        response = json.loads(await reader.readline())
+        responses[response['id']] = response
+    writer.close()
+    return responses
+
+
+async def serve_requests(path, connections, window_ms=20.0):
+    """
+    Starts a server, sends the requests of all connections concurrently and stops the server
+    """
+    server = InferenceServer(bn, window_ms=window_ms)
+    await server.start_unix(path)
+    try:
+        results = await asyncio.gather(*(request_all(path, requests)
+                                         for requests in connections))
+    finally:
+        await server.stop()
+    return results, server
+
+
+def test_concurrent_requests_are_batched(tmp_path):
+    """
+    Test that concurrent requests from several connections are coalesced and correct
+    """
+    evidences = [{'speech commands': 'pickup'},
+                 {'speech commands': 'handover', 'human activity': 'idle'},
+                 {}]
+    connections = [[{'id': f'{connection}-{i}', 'evidence': evidence}
+                    for i, evidence in enumerate(evidences)] for connection in range(3)]
+    results, server = asyncio.run(serve_requests(str(tmp_path / 'cobair.sock'), connections))
+
+    assert server.requests == 9
+    batch_sizes = set()
+    for responses in results:
+        for request_id, response in responses.items():
+            evidence = evidences[int(request_id.split('-')[1])]
+            max_intention, threshold, inference = bn.infer(evidence)
+            assert response['intention'] == max_intention
+            assert response['decision_threshold'] == threshold
+            for intention, probability in inference.items():
+                assert response['inference'][intention] == pytest.approx(probability)
+            assert response['latency_ms'] >= 0
+            batch_sizes.add(response['batch_size'])
+    assert max(batch_sizes) > 1
+
+
+def test_invalid_request(tmp_path):
+    """
+    Test that invalid evidence results in an error response without affecting other requests
+    """
+    connections = [[{'id': 'invalid', 'evidence': {'speech commands': {}}},
+                    {'id': 'valid', 'evidence': {'speech commands': 'pickup'}},
+                    {'id': 'malformed'}]]
+    (responses,), _ = asyncio.run(serve_requests(str(tmp_path / 'cobair.sock'), connections))
+    assert 'ValueError' in responses['invalid']['error']
+    assert 'error' in responses['malformed']
+    assert responses['valid']['intention'] is None
@@ -0,0 +1,92 @@
+'''
+Tests for the sharded config layout
+'''
+
+# System imports
+import os
+
+# 3rd party imports
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, default_to_regular, load_config
+from CoBaIR.discretizers import HysteresisDiscretizer
+from CoBaIR.sharded_config import ShardedBayesNet, load_sharded_config, save_sharded_config
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+@pytest.fixture
+def sharded_dir(tmp_path):
+    """
+    The small example saved in the sharded layout
+    """
+    save_sharded_config(load_config('small_example.yml'), str(tmp_path))
+    return tmp_path
+
+
+def test_round_trip(sharded_dir, tmp_path_factory):
+    """
+    Test that single file and sharded layout convert into each other without changes
+    """
+    config = load_config('small_example.yml')
+    assert sorted(os.listdir(sharded_dir / 'intentions')) == [
+        'hand_over_tool.yml', 'pick_up_tool.yml']
+    sharded = load_sharded_config(str(sharded_dir))
+    assert default_to_regular(sharded) == default_to_regular(config)
+
+    single_file = tmp_path_factory.mktemp('single') / 'config.yml'
+    BayesNet(sharded).save(str(single_file))
+    assert default_to_regular(load_config(str(single_file))) == default_to_regular(config)
+
+
+def test_shards_loaded_on_demand(sharded_dir):
+    """
+    Test that only queried intentions are loaded
+    """
+    net = ShardedBayesNet(str(sharded_dir))
+    assert net.intentions == ['hand over tool', 'pick up tool']
+    assert net.loaded_intentions == []
+    _, _, inference = net.infer({'speech commands': 'pickup'}, intentions=['pick up tool'])
+    assert net.loaded_intentions == ['pick up tool']
+    assert inference == {'pick up tool': 1.0}
+
+
+def test_infer_equals_single_file(sharded_dir):
+    """
+    Test that inference over all shards equals inference of the single file config
+    """
+    sharded_net = ShardedBayesNet(str(sharded_dir))
+    net = BayesNet(load_config('small_example.yml'))
+    for evidence in [{}, {'speech commands': 'pickup', 'human activity': 'working'}]:
+        max_intention, threshold, inference = sharded_net.infer(evidence)
+        expected = net.infer(evidence)
+        assert (max_intention, threshold) == expected[:2]
+        for intention, probability in inference.items():
+            assert round(abs(probability - expected[2][intention]), 7) == 0
+
+
+def test_stateful_discretizer(sharded_dir):
+    """
+    Test that every raw value is discretized once per infer and not once per intention net
+    """
+    net = ShardedBayesNet(str(sharded_dir))
+    discretizer = HysteresisDiscretizer(0.4, 0.6, initial=False, debounce=2)
+    net.bind_discretization_function('human holding object', discretizer)
+    single = BayesNet(load_config('small_example.yml'))
+    net.infer({'human holding object': 0.9})
+    assert discretizer.state is False
+    _, _, inference = net.infer({'human holding object': 0.9})
+    assert discretizer.state is True
+    expected = single.infer({'human holding object': True})[2]
+    for intention, probability in inference.items():
+        assert round(abs(probability - expected[intention]), 7) == 0
+
+
+def test_unknown_intention(sharded_dir):
+    """
+    Test that querying an unknown intention raises a ValueError
+    """
+    with pytest.raises(ValueError):
+        ShardedBayesNet(str(sharded_dir)).infer({}, intentions=['fly'])
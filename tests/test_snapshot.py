@@ -0,0 +1,72 @@
+'''
+Tests for the immutable compiled snapshots of a BayesNet
+'''
+
+# System imports
+import threading
+
+# 3rd party imports
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def test_mutation_publishes_new_snapshot():
+    """
+    Test that a mutation swaps in a new snapshot and leaves the old one untouched
+    """
+    bn = BayesNet(load_config('small_example.yml'))
+    old_model = bn.model
+    bn.change_influence_value('pick up tool', 'human activity', 'idle', 0)
+    assert bn.model is not old_model
+    assert old_model.config['intentions']['pick up tool']['human activity']['idle'] == 2
+    assert bn.model.config['intentions']['pick up tool']['human activity']['idle'] == 0
+
+
+def test_discretization_functions_survive_mutation():
+    """
+    Test that discretization functions stay bound as long as their context exists
+    """
+    bn = BayesNet(load_config('small_example.yml'))
+    bn.bind_discretization_function('human activity', str)
+    bn.change_decision_threshold(0.5)
+    assert 'human activity' in bn.discretization_functions
+    bn.del_context('human activity')
+    assert 'human activity' not in bn.discretization_functions
+
+
+def test_concurrent_infer_during_mutation():
+    """
+    Test that readers always see a consistent snapshot while a writer mutates the net
+    """
+    bn = BayesNet(load_config('small_example.yml'))
+    evidence = {'speech commands': 'pickup', 'human activity': 'idle'}
+    expected = [bn.infer(evidence)[2]]
+    bn.change_influence_value('pick up tool', 'human activity', 'idle', 0)
+    expected.append(bn.infer(evidence)[2])
+
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                inference = bn.infer(evidence)[2]
+                assert any(all(round(abs(inference[intention] - probability), 7) == 0
+                               for intention, probability in candidate.items())
+                           for candidate in expected)
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for i in range(20):
+        bn.change_influence_value('pick up tool', 'human activity', 'idle', 2 * (i % 2))
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert errors == []
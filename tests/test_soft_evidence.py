@@ -0,0 +1,80 @@
+'''
+Tests for soft evidence
+'''
+
+# System imports
+
+# 3rd party imports
+import numpy as np
+import pytest
+
+# local imports
+from CoBaIR.bayes_net import BayesNet, load_config
+
+# end file header
+__author__ = 'Adrian Lubitz'
+
+
+def probabilities(result: tuple) -> np.ndarray:
+    """Returns the probabilities of an inference result as array"""
+    return np.array(list(result[2].values()))
+
+
+def test_soft_evidence():
+    """
+    Test that soft evidence mixes the results of the hard evidence
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    hard = {'speech commands': 'pickup'}
+    holding = probabilities(net.infer({**hard, 'human holding object': True}, normalized=False))
+    empty = probabilities(net.infer({**hard, 'human holding object': False}, normalized=False))
+    soft = net.infer({**hard, 'human holding object': {True: 0.7, False: 0.3}}, normalized=False)
+    assert np.allclose(probabilities(soft), 0.7 * holding + 0.3 * empty)
+    # probabilities are normalized and missing instantiations have probability 0
+    assert np.allclose(probabilities(net.infer(
+        {**hard, 'human holding object': {True: 2}}, normalized=False)), holding)
+    # the apriori probabilities are the same as no evidence
+    assert np.allclose(probabilities(net.infer(
+        {**hard, 'human activity': {'idle': 0.2, 'working': 0.8}})), probabilities(net.infer(hard)))
+    assert net.infer({**hard, 'human holding object': {True: 1.0}}, deadline_ms=100).source == \
+        'exact'
+
+
+def test_soft_evidence_batch():
+    """
+    Test that rows with and without soft evidence can be inferred together
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    evidences = [{'human activity': {'idle': 0.5, 'working': 0.5},
+                  'human holding object': {True: 0.1, False: 0.9}},
+                 {'human activity': 'idle', 'speech commands': {'pickup': 0.6, 'handover': 0.4}},
+                 {'human activity': 'working'},
+                 {'human activity': {'working': 0.3, 'idle': 0.7}, 'speech commands': 'other'}]
+    results = net.infer_batch(evidences)
+    for evidence, result in zip(evidences, results):
+        assert np.allclose(probabilities(result), probabilities(net.infer(evidence)))
+
+
+def test_discretized_soft_evidence():
+    """
+    Test that discretization functions can return soft evidence
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    expected = net.infer({'human holding object': {True: 0.25, False: 0.75}})
+    net.bind_discretization_function('human holding object',
+                                     lambda value: {True: value, False: 1 - value})
+    assert np.allclose(probabilities(net.infer({'human holding object': 0.25})),
+                       probabilities(expected))
+
+
+def test_invalid_soft_evidence():
+    """
+    Test that invalid soft evidence is rejected
+    """
+    net = BayesNet(load_config('small_example.yml'))
+    for distribution in [{'maybe': 1.0}, {True: -0.5, False: 1.5}, {True: 0, False: 0},
+                         {True: 'likely'}]:
+        with pytest.raises(ValueError):
+            net.infer({'human holding object': distribution})
+    with pytest.warns(UserWarning):
+        net.infer({'unknown context': {'a': 1.0}})